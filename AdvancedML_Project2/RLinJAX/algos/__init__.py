@@ -1,4 +1,4 @@
-from .algorithm import Algorithm
+from .algorithm import Algorithm, SweepResult
 from .dqn import DQN
 from .iqn import IQN
 from .mixins import (
@@ -15,6 +15,7 @@ from .td3 import TD3
 
 __all__ = [
     "Algorithm",
+    "SweepResult",
     "DQN",
     "IQN",
     "PPO",
@@ -1,16 +1,22 @@
 from copy import deepcopy
-from dataclasses import asdict
-from typing import Any, Callable
+from dataclasses import asdict, fields
+from functools import partial
+from typing import Any, Callable, Dict, Tuple
 
 import chex
 import gymnax
 import jax
+import numpy as np
+import optax
 from flax import struct
 from gymnax.environments.environment import Environment
 from jax import numpy as jnp
 
-from RLinJAX.compat import create
-from RLinJAX.evaluate import evaluate
+from RLinJAX.compat import EpisodeStatisticsWrapper, create
+from RLinJAX.compilation import CompiledTrain, compile_train
+from RLinJAX.evaluate import evaluate, evaluate_rollout
+from RLinJAX.metrics import init_metrics, summarize_metrics, update_metrics
+from RLinJAX.profiling import phase, time_phases
 
 INIT_REGISTRATION_KEY = "_rejax_registered_init"
 
@@ -20,12 +26,32 @@ def register_init(func):
     return func
 
 
+class SweepResult(struct.PyTreeNode):
+    """Result of `Algorithm.train_sweep`. `axes` names the leading axes of every leaf
+    of `train_state` and `evaluation`, and `overrides` holds the hyperparameter values
+    along the `config` axis.
+    """
+
+    train_state: Any
+    evaluation: Any
+    axes: Tuple[str, ...] = struct.field(pytree_node=False)
+    overrides: Dict[str, chex.Array]
+
+
 class Algorithm(struct.PyTreeNode):
     env: Environment = struct.field(pytree_node=False)
     env_params: Any = struct.field(pytree_node=True)
     eval_callback: Callable = struct.field(pytree_node=False)
     eval_freq: int = struct.field(pytree_node=False, default=4_096)
     skip_initial_evaluation: bool = struct.field(pytree_node=False, default=False)
+    eval_mode: str = struct.field(pytree_node=False, default="episodes")
+    num_eval_seeds: int = struct.field(pytree_node=False, default=128)
+    num_eval_episodes: int = struct.field(pytree_node=False, default=None)
+    eval_max_steps: int = struct.field(pytree_node=False, default=None)
+    collect_metrics: bool = struct.field(pytree_node=False, default=False)
+    metrics_callback: Callable = struct.field(pytree_node=False, default=None)
+    env_params_sampler: Callable = struct.field(pytree_node=False, default=None)
+    num_eval_variants: int = struct.field(pytree_node=False, default=None)
 
     # Common parameters (excluding algorithm-specific ones)
     total_timesteps: int = struct.field(pytree_node=False, default=131_072)
@@ -38,19 +64,80 @@ class Algorithm(struct.PyTreeNode):
         env, env_params = cls.create_env(config)
         agent = cls.create_agent(config, env, env_params)
 
+        eval_mode = config.get("eval_mode", "episodes")
+        if eval_mode not in ("episodes", "rollout", "training_episodes"):
+            raise ValueError(f"Unknown eval_mode: {eval_mode}")
+
+        train_env = env
+        if eval_mode == "training_episodes":
+            train_env = EpisodeStatisticsWrapper(env)
+
         def eval_callback(algo, ts, rng):
+            if algo.eval_mode == "training_episodes":
+                # Length and return of the last completed episode of each training
+                # environment, the return is NaN if none has ended yet
+                env_state = ts.env_state
+                return (
+                    env_state.returned_episode_length,
+                    env_state.returned_episode_return,
+                )
+
             act = algo.make_act(ts)
-            max_steps = algo.env_params.max_steps_in_episode
-            return evaluate(act, rng, env, env_params, 128, max_steps)
+            max_steps = algo.eval_max_steps
+            if max_steps is None:
+                max_steps = algo.env_params.max_steps_in_episode
+
+            def evaluate_variant(env_params):
+                if algo.eval_mode == "rollout":
+                    # Fixed-step rollout returning an `EvalSummary`
+                    return evaluate_rollout(
+                        act,
+                        rng,
+                        env,
+                        env_params,
+                        algo.num_eval_seeds,
+                        algo.num_eval_episodes,
+                        max_steps,
+                    )
+
+                # One episode per seed, returns the length and return of each
+                return evaluate(
+                    act, rng, env, env_params, algo.num_eval_seeds, max_steps
+                )
+
+            if algo.env_params_sampler is not None and algo.num_eval_variants:
+                # Every variant is evaluated with the same seeds, results have a
+                # leading variant axis
+                return jax.vmap(evaluate_variant)(algo.eval_env_params())
+            # The parameters are read from `algo` rather than closed over, so that
+            # compiled programs that take `algo` as an argument evaluate its own
+            return evaluate_variant(algo.env_params)
 
         return cls(
-            env=env,
+            env=train_env,
             env_params=env_params,
             eval_callback=eval_callback,
             **agent,
             **config,
         )
 
+    def eval_env_params(self):
+        """The `num_eval_variants` environment variants that are evaluated if
+        `env_params_sampler` is set. They are sampled from a fixed key, so that every
+        evaluation uses the same variants.
+        """
+        rngs = jax.random.split(jax.random.PRNGKey(0), self.num_eval_variants)
+        return jax.vmap(self.env_params_sampler, in_axes=(0, None))(
+            rngs, self.env_params
+        )
+
+    def make_optimizer(self):
+        """Adam with the learning rate in its state rather than closed over, so that
+        train states initialized with a traced `algo`, e.g. by `compile`,
+        `train_in_place` or `train_sweep`, can be trained further.
+        """
+        return optax.inject_hyperparams(optax.adam)(learning_rate=self.learning_rate)
+
     def init_state(self, rng: chex.PRNGKey) -> Any:
         state_values = {}
         for name in dir(self):
@@ -66,10 +153,235 @@ class Algorithm(struct.PyTreeNode):
         clz = type(cls_name, (struct.PyTreeNode,), d)
         return clz(**state_values)
 
+    @property
+    def steps_per_train_iteration(self):
+        """Number of environment steps taken by one call to `train_iteration`."""
+        raise NotImplementedError
+
+    @property
+    def train_iterations_per_eval(self):
+        return np.ceil(self.eval_freq / self.steps_per_train_iteration).astype(int)
+
+    @property
+    def steps_per_eval(self):
+        return self.train_iterations_per_eval * self.steps_per_train_iteration
+
+    @property
+    def num_evals(self):
+        return np.ceil(self.total_timesteps / self.eval_freq).astype(int)
+
+    def train_iteration(self, ts):
+        raise NotImplementedError
+
+    def eval_iteration(self, ts, unused=None):
+        # Run a few training iterations
+        ts = jax.lax.fori_loop(
+            0,
+            self.train_iterations_per_eval,
+            lambda _, ts: self.train_iteration(ts),
+            ts,
+        )
+
+        # Run evaluation
+        return self.run_evaluation(ts)
+
+    def run_evaluation(self, ts):
+        """Evaluates the agent. If `collect_metrics` is set, the evaluation is paired
+        with the mean, min and max of every training metric since the previous
+        evaluation, which are also passed to `metrics_callback(global_step, metrics)`
+        if it is given.
+        """
+        evaluation = phase("eval", self.eval_callback, self, ts, ts.rng)
+        if not self.collect_metrics:
+            return ts, evaluation
+
+        metrics = summarize_metrics(ts.metrics)
+        if self.metrics_callback is not None:
+            jax.debug.callback(self.metrics_callback, ts.global_step, metrics)
+        ts = ts.replace(metrics=init_metrics(self.metric_names))
+        return ts, (evaluation, metrics)
+
+    def train(self, rng=None, train_state=None):
+        if train_state is None and rng is None:
+            raise ValueError("Either train_state or rng must be provided")
+
+        ts = train_state or self.init_state(rng)
+
+        if not self.skip_initial_evaluation:
+            ts, initial_evaluation = self.run_evaluation(ts)
+
+        ts, evaluation = jax.lax.scan(self.eval_iteration, ts, None, self.num_evals)
+
+        if not self.skip_initial_evaluation:
+            evaluation = jax.tree_map(
+                lambda i, ev: jnp.concatenate((jnp.expand_dims(i, 0), ev)),
+                initial_evaluation,
+                evaluation,
+            )
+
+        return ts, evaluation
+
+    def train_in_place(self, rng=None, train_state=None):
+        """Same as `jax.jit(algo.train)`, but with `train_state` donated, so that its
+        buffers, e.g. the replay buffer, are updated in place and continuing training
+        holds one train state in memory instead of two. `train_state` must not be
+        used after the call.
+        """
+        return _train_donated(self, rng, train_state)
+
+    def compile(
+        self, rng_shape: Tuple[int, ...] = (2,), cache_dir: str = None
+    ) -> CompiledTrain:
+        """Compiles `train` ahead of time for keys of shape `rng_shape`, leading axes
+        of which are vectorized over. The result is called as `compiled(algo, rng)`
+        and reports its compile time. If `cache_dir` is given, the serialized
+        executable is cached on disk, keyed by the algorithm class, static config
+        fields and environment spec.
+        """
+        return compile_train(self, rng_shape, cache_dir=cache_dir)
+
+    def train_chunked(
+        self,
+        rng=None,
+        train_state=None,
+        evals_per_chunk: int = 1,
+        checkpointer=None,
+        checkpoint_freq: int = 1,
+        trace_dir: str = None,
+        trace_window: Tuple[int, int] = (0, 1),
+    ):
+        """Same as `train`, but runs the training loop from the host in chunks of
+        `evals_per_chunk` evaluations. Every chunk reuses the same compiled program,
+        only a last, shorter chunk triggers another compilation. If a `checkpointer`
+        is given, the train state is saved at least every `checkpoint_freq`
+        evaluations and after the last chunk.
+
+        Training resumes from the `global_step` of `train_state`, e.g. one restored
+        with `checkpointer.restore(algo.init_state(rng))`, in which case only the
+        evaluations of the remaining steps are returned.
+
+        If `trace_dir` is given, a profiler trace is captured for the chunks that
+        start within the evaluations `trace_window = (start, stop)`.
+        """
+        if train_state is None and rng is None:
+            raise ValueError("Either train_state or rng must be provided")
+
+        ts = train_state or jax.jit(self.init_state)(rng)
+
+        def run_chunk(ts, num_evals):
+            return jax.lax.scan(self.eval_iteration, ts, None, num_evals)
+
+        run_chunk = jax.jit(run_chunk, static_argnums=1)
+
+        evaluations = []
+        completed = int(ts.global_step) // self.steps_per_eval
+        if completed == 0 and not self.skip_initial_evaluation:
+            ts, initial_evaluation = jax.jit(self.run_evaluation)(ts)
+            evaluations.append(jax.tree_map(lambda x: x[None], initial_evaluation))
+
+        last_saved = completed
+        tracing = False
+        while completed < self.num_evals:
+            trace = trace_dir is not None
+            trace = trace and trace_window[0] <= completed < trace_window[1]
+            if trace and not tracing:
+                jax.profiler.start_trace(trace_dir)
+                tracing = True
+            elif tracing and not trace:
+                jax.profiler.stop_trace()
+                tracing = False
+
+            num_evals = min(evals_per_chunk, self.num_evals - completed)
+            ts, evaluation = run_chunk(ts, num_evals)
+            if tracing:
+                jax.block_until_ready(ts)
+            evaluations.append(evaluation)
+            completed += num_evals
+
+            done = completed == self.num_evals
+            if checkpointer is not None:
+                if done or completed - last_saved >= checkpoint_freq:
+                    checkpointer.save(int(ts.global_step), ts)
+                    last_saved = completed
+
+        if tracing:
+            jax.profiler.stop_trace()
+        if checkpointer is not None:
+            checkpointer.wait()
+
+        if not evaluations:
+            return ts, None
+        return ts, jax.tree_map(lambda *ev: jnp.concatenate(ev), *evaluations)
+
+    def profile(self, rng=None, train_state=None, **kwargs):
+        """Runs `train_chunked` with timing markers around the phases of training,
+        e.g. collecting transitions, sampling, updating and evaluating, and returns
+        the train state, evaluation and a `PhaseTimer` with a per-phase breakdown.
+        Keyword arguments such as `trace_dir` are passed to `train_chunked`.
+        """
+        with time_phases() as timer:
+            ts, evaluation = self.train_chunked(rng, train_state, **kwargs)
+        return ts, evaluation, timer
+
+    def train_sweep(self, rngs: chex.PRNGKey, overrides: Dict[str, chex.Array] = None):
+        """Trains one agent per seed in `rngs` for every configuration in `overrides`,
+        vectorized with `vmap` so that the whole sweep compiles to one program, e.g.
+        `jax.jit(algo.train_sweep)(rngs, {"learning_rate": jnp.array([1e-4, 3e-4])})`.
+
+        Args:
+            rngs (chex.PRNGKey): Batch of keys with shape `(num_seeds, 2)`.
+            overrides (Dict[str, chex.Array]): Maps hyperparameters to arrays of values
+            with a shared leading axis of length `num_configs`. Only fields marked
+            `pytree_node=True` can be swept, since the others change the structure of
+            the compiled program.
+
+        Returns:
+            SweepResult: Train states and evaluations with leading axes `("config",
+            "seed")`, or only `("seed",)` if no overrides are given.
+        """
+        if getattr(self, "host_replay", False):
+            raise ValueError(
+                "Host replay cannot be used in sweeps, since its ordered host "
+                "callbacks cannot be batched with vmap"
+            )
+
+        overrides = dict(overrides or {})
+        pytree_fields = {
+            f.name for f in fields(self) if f.metadata.get("pytree_node", True)
+        }
+        for name in overrides:
+            if name not in pytree_fields:
+                raise ValueError(
+                    f"Cannot sweep over {name}, only pytree fields can be batched"
+                )
+
+        if not overrides:
+            ts, evaluation = jax.vmap(self.train)(rngs)
+            return SweepResult(ts, evaluation, ("seed",), overrides)
+
+        def train_config(values):
+            return jax.vmap(self.replace(**values).train)(rngs)
+
+        ts, evaluation = jax.vmap(train_config)(overrides)
+        return SweepResult(ts, evaluation, ("config", "seed"), overrides)
+
     @register_init
     def init_base_state(self, rng: chex.PRNGKey):
+        if self.collect_metrics:
+            return {"rng": rng, "metrics": init_metrics(self.metric_names)}
         return {"rng": rng}
 
+    @property
+    def metric_names(self) -> Tuple[str, ...]:
+        """Names of the metrics recorded with `log_metrics`."""
+        return ()
+
+    def log_metrics(self, ts, metrics: Dict[str, chex.Array]):
+        """Records training metrics, e.g. losses, if `collect_metrics` is set."""
+        if not self.collect_metrics:
+            return ts
+        return ts.replace(metrics=update_metrics(ts.metrics, metrics))
+
     @classmethod
     def create_env(cls, config):
         if isinstance(config["env"], str):
@@ -106,3 +418,8 @@ class Algorithm(struct.PyTreeNode):
     @property
     def config(self):
         return asdict(self)
+
+
+@partial(jax.jit, donate_argnums=2)
+def _train_donated(algo, rng, train_state):
+    return algo.train(rng, train_state)
@@ -13,7 +13,13 @@ from RLinJAX.algos.mixins import (
     TargetNetworkMixin,
 )
 from RLinJAX.buffers import Minibatch
-from RLinJAX.networks import DiscreteQNetwork, DuelingQNetwork, EpsilonGreedyPolicy
+from RLinJAX.networks import (
+    DiscreteQNetwork,
+    DuelingQNetwork,
+    EpsilonGreedyPolicy,
+    pop_dtypes,
+)
+from RLinJAX.profiling import phase
 
 
 class DQN(
@@ -26,6 +32,7 @@ class DQN(
     agent: nn.Module = struct.field(pytree_node=False, default=None)
     num_epochs: int = struct.field(pytree_node=False, default=1)
     ddqn: bool = struct.field(pytree_node=True, default=True)
+    n_step: int = struct.field(pytree_node=False, default=1)
 
     def make_act(self, ts):
         def act(obs, rng):
@@ -50,6 +57,7 @@ class DQN(
         agent_kwargs = config.pop("agent_kwargs", {})
         activation = agent_kwargs.pop("activation", "swish")
         agent_kwargs["activation"] = getattr(nn, activation)
+        agent_kwargs.update(pop_dtypes(config))
 
         action_dim = env.action_space(env_params).n
         agent = EpsilonGreedyPolicy(agent_cls)(
@@ -62,10 +70,14 @@ class DQN(
     def initialize_network_params(self, rng):
         obs_ph = jnp.empty([1, *self.env.observation_space(self.env_params).shape])
         q_params = self.agent.init(rng, obs_ph)
-        tx = optax.adam(learning_rate=self.learning_rate)
+        tx = self.make_optimizer()
         q_ts = TrainState.create(apply_fn=(), params=q_params, tx=tx)
         return {"q_ts": q_ts, "q_target_params": q_params}
 
+    @property
+    def metric_names(self):
+        return ("loss", "q_value", "td_error")
+
     def train_iteration(self, ts):
         start_training = ts.global_step > self.fill_buffer
         old_global_step = ts.global_step
@@ -75,30 +87,25 @@ class DQN(
 
         # Collect transitions
         uniform = jnp.logical_not(start_training)
-        ts, batch = self.collect_transitions(ts, epsilon, uniform=uniform)
-        ts = ts.replace(replay_buffer=ts.replay_buffer.extend(batch))
+        ts, batch = phase(
+            "collect", self.collect_transitions, ts, epsilon, uniform=uniform
+        )
+        replay_buffer = phase("extend", ts.replay_buffer.extend, batch)
+        ts = ts.replace(replay_buffer=replay_buffer)
 
         # Perform updates to q network
-        def update_iteration(ts):
-            # Sample minibatch
+        def update_iteration(ts, xs):
+            minibatch, index, weight = xs
+            ts, td_error = self.update(ts, minibatch, weight)
+            ts = self.update_priorities(ts, index, td_error)
+            return ts, None
+
+        def do_updates(ts):
             rng, rng_sample = jax.random.split(ts.rng)
             ts = ts.replace(rng=rng)
-            minibatch = ts.replay_buffer.sample(self.batch_size, rng_sample)
-            if self.normalize_observations:
-                minibatch = minibatch._replace(
-                    obs=self.normalize_obs(ts.rms_state, minibatch.obs),
-                    next_obs=self.normalize_obs(ts.rms_state, minibatch.next_obs),
-                )
-
-            # Update network
-            ts = self.update(ts, minibatch)
+            ts, _ = self.sample_and_update(ts, rng_sample, update_iteration)
             return ts
 
-        def do_updates(ts):
-            return jax.lax.fori_loop(
-                0, self.num_epochs, lambda _, ts: update_iteration(ts), ts
-            )
-
         ts = jax.lax.cond(start_training, lambda: do_updates(ts), lambda: ts)
 
         # Update target network
@@ -115,7 +122,7 @@ class DQN(
                 ts.q_target_params,
             )
         ts = ts.replace(q_target_params=target_params)
-       
+
         return ts
 
     def collect_transitions(self, ts, epsilon, uniform=False):
@@ -143,7 +150,7 @@ class DQN(
         ts = ts.replace(rng=rng)
         rng_steps = jax.random.split(rng_steps, self.num_envs)
         next_obs, env_state, rewards, dones, _ = self.vmap_step(
-            rng_steps, ts.env_state, actions, self.env_params
+            rng_steps, ts.env_state, actions, self.train_env_params(ts)
         )
         if self.normalize_observations:
             ts = ts.replace(rms_state=self.update_rms(ts.rms_state, next_obs))
@@ -160,9 +167,10 @@ class DQN(
             env_state=env_state,
             global_step=ts.global_step + self.num_envs,
         )
+        ts = self.resample_env_params(ts, dones)
         return ts, minibatch
 
-    def update(self, ts, mb):
+    def update(self, ts, mb, weight=1.0):
         next_q_target_values = self.agent.apply(ts.q_target_params, mb.next_obs)
 
         def vanilla_targets(q_params):
@@ -182,10 +190,17 @@ class DQN(
                 self.ddqn, ddqn_targets, vanilla_targets, q_params
             )
             mask_done = jnp.logical_not(mb.done)
-            targets = mb.reward + mask_done * self.gamma * next_q_values_target
-            loss = optax.l2_loss(q_values, targets).mean()
-            return loss
+            discount = self.gamma**self.n_step
+            targets = mb.reward + mask_done * discount * next_q_values_target
+            loss = (weight * optax.l2_loss(q_values, targets)).mean()
+            return loss, (targets - q_values, q_values)
 
-        grads = jax.grad(loss_fn)(ts.q_ts.params)
+        (loss, (td_error, q_values)), grads = jax.value_and_grad(loss_fn, has_aux=True)(
+            ts.q_ts.params
+        )
         ts = ts.replace(q_ts=ts.q_ts.apply_gradients(grads=grads))
-        return ts
+        ts = self.log_metrics(
+            ts,
+            {"loss": loss, "q_value": q_values, "td_error": jnp.abs(td_error)},
+        )
+        return ts, td_error
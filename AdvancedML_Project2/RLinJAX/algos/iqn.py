@@ -17,7 +17,8 @@ from RLinJAX.algos.mixins import (
     TargetNetworkMixin,
 )
 from RLinJAX.buffers import Minibatch
-from RLinJAX.networks import ImplicitQuantileNetwork
+from RLinJAX.networks import ImplicitQuantileNetwork, module_fields, pop_dtypes
+from RLinJAX.profiling import phase
 
 
 def EpsilonGreedyPolicy(iqn: nn.Module) -> Type[nn.Module]:
@@ -32,9 +33,16 @@ def EpsilonGreedyPolicy(iqn: nn.Module) -> Type[nn.Module]:
             action = action_dist.sample(seed=rng_epsilon)
             return action
 
+        def __reduce__(self):
+            return _epsilon_greedy_policy, (iqn, module_fields(self))
+
     return EpsilonGreedyPolicy
 
 
+def _epsilon_greedy_policy(iqn, fields):
+    return EpsilonGreedyPolicy(iqn)(**fields)
+
+
 class IQN(
     EpsilonGreedyMixin,
     ReplayBufferMixin,
@@ -47,6 +55,7 @@ class IQN(
     num_tau_samples: int = struct.field(pytree_node=False, default=64)
     num_tau_prime_samples: int = struct.field(pytree_node=False, default=64)
     kappa: chex.Scalar = struct.field(pytree_node=True, default=1.0)
+    n_step: int = struct.field(pytree_node=False, default=1)
 
     def make_act(self, ts):
         def act(obs, rng):
@@ -68,6 +77,7 @@ class IQN(
         agent_kwargs["activation"] = getattr(nn, activation)
         hidden_layer_sizes = agent_kwargs.pop("hidden_layer_sizes", (64, 64))
         agent_kwargs["hidden_layer_sizes"] = tuple(hidden_layer_sizes)
+        agent_kwargs.update(pop_dtypes(config))
 
         action_dim = env.action_space(env_params).n
         agent = EpsilonGreedyPolicy(ImplicitQuantileNetwork)(
@@ -79,10 +89,14 @@ class IQN(
     def initialize_network_params(self, rng):
         obs_ph = jnp.empty([1, *self.env.observation_space(self.env_params).shape])
         q_params = self.agent.init(rng, obs_ph, rng)
-        tx = optax.adam(learning_rate=self.learning_rate)
+        tx = self.make_optimizer()
         q_ts = TrainState.create(apply_fn=(), params=q_params, tx=tx)
         return {"q_ts": q_ts, "q_target_params": q_params}
 
+    @property
+    def metric_names(self):
+        return ("loss", "q_value")
+
     def train_iteration(self, ts):
         start_training = ts.global_step > self.fill_buffer
         old_global_step = ts.global_step
@@ -92,30 +106,25 @@ class IQN(
 
         # Collect transitions
         uniform = jnp.logical_not(start_training)
-        ts, batch = self.collect_transitions(ts, epsilon, uniform=uniform)
-        ts = ts.replace(replay_buffer=ts.replay_buffer.extend(batch))
+        ts, batch = phase(
+            "collect", self.collect_transitions, ts, epsilon, uniform=uniform
+        )
+        replay_buffer = phase("extend", ts.replay_buffer.extend, batch)
+        ts = ts.replace(replay_buffer=replay_buffer)
 
         # Perform updates to q network
-        def update_iteration(ts):
-            # Sample minibatch
+        def update_iteration(ts, xs):
+            minibatch, index, weight = xs
+            ts, loss = self.update(ts, minibatch, weight)
+            ts = self.update_priorities(ts, index, loss)
+            return ts, None
+
+        def do_updates(ts):
             rng, rng_sample = jax.random.split(ts.rng)
             ts = ts.replace(rng=rng)
-            minibatch = ts.replay_buffer.sample(self.batch_size, rng_sample)
-            if self.normalize_observations:
-                minibatch = minibatch._replace(
-                    obs=self.normalize_obs(ts.rms_state, minibatch.obs),
-                    next_obs=self.normalize_obs(ts.rms_state, minibatch.next_obs),
-                )
-
-            # Update network
-            ts = self.update(ts, minibatch)
+            ts, _ = self.sample_and_update(ts, rng_sample, update_iteration)
             return ts
 
-        def do_updates(ts):
-            return jax.lax.fori_loop(
-                0, self.num_epochs, lambda _, ts: update_iteration(ts), ts
-            )
-
         ts = jax.lax.cond(start_training, lambda: do_updates(ts), lambda: ts)
 
         # Update target network
@@ -159,7 +168,7 @@ class IQN(
         ts = ts.replace(rng=rng)
         rng_steps = jax.random.split(rng_steps, self.num_envs)
         next_obs, env_state, rewards, dones, _ = self.vmap_step(
-            rng_steps, ts.env_state, actions, self.env_params
+            rng_steps, ts.env_state, actions, self.train_env_params(ts)
         )
         if self.normalize_observations:
             ts = ts.replace(rms_state=self.update_rms(ts.rms_state, next_obs))
@@ -176,25 +185,23 @@ class IQN(
             env_state=env_state,
             global_step=ts.global_step + self.num_envs,
         )
+        ts = self.resample_env_params(ts, dones)
         return ts, minibatch
 
-    def update(self, ts, mb):
-        # Move tau to axis 1, leaving batch as leading axis
-        vmapped_apply = jax.vmap(self.agent.apply, in_axes=(None, None, 0), out_axes=1)
-
-        # Split off multiple keys for tau and tau_prime
+    def update(self, ts, mb, weight=1.0):
         rng, rng_action, rng_tau, rng_tau_prime = jax.random.split(ts.rng, 4)
         ts = ts.replace(rng=rng)
-        rng_tau = jax.random.split(rng_tau, self.num_tau_samples)
-        rng_tau_prime = jax.random.split(rng_tau_prime, self.num_tau_prime_samples)
 
         best_action = self.agent.apply(
             ts.q_ts.params, mb.next_obs, rng_action, method="best_action"
         )
-        zs, _ = vmapped_apply(ts.q_ts.params, mb.next_obs, rng_tau_prime)
+        zs, _ = self.agent.apply(
+            ts.q_ts.params, mb.next_obs, rng_tau_prime, self.num_tau_prime_samples
+        )
         best_z = jnp.take_along_axis(zs, best_action[:, None, None], axis=2).squeeze(2)
 
-        targets = mb.reward[:, None] + self.gamma * (1 - mb.done[:, None]) * best_z
+        discount = self.gamma**self.n_step
+        targets = mb.reward[:, None] + discount * (1 - mb.done[:, None]) * best_z
         assert targets.shape == (
             self.batch_size,
             self.num_tau_prime_samples,
@@ -208,7 +215,7 @@ class IQN(
             return jnp.abs(tau - (td_err < 0)) * l / self.kappa
 
         def loss_fn(q_params):
-            z, tau = vmapped_apply(q_params, mb.obs, rng_tau)
+            z, tau = self.agent.apply(q_params, mb.obs, rng_tau, self.num_tau_samples)
             z = jnp.take_along_axis(z, mb.action[:, None, None], axis=2).squeeze(2)
             assert z.shape == (self.batch_size, self.num_tau_samples), z.shape
 
@@ -225,10 +232,14 @@ class IQN(
                 self.num_tau_samples,
                 self.num_tau_prime_samples,
             )
-            loss = rho(td_err, tau).sum(axis=1)
-            return loss.mean()
+            # Quantile loss per transition, also used as its priority
+            loss = rho(td_err, tau).sum(axis=1).mean(axis=1)
+            return (weight * loss).mean(), (loss, z)
 
-        grads = jax.grad(loss_fn)(ts.q_ts.params)
+        (mean_loss, (loss, z)), grads = jax.value_and_grad(loss_fn, has_aux=True)(
+            ts.q_ts.params
+        )
         # jax.debug.print("grads {}", jnp.abs(jnp.hstack([a.ravel() for a in jax.tree_leaves(grads)])).mean())
         ts = ts.replace(q_ts=ts.q_ts.apply_gradients(grads=grads))
-        return ts
+        ts = self.log_metrics(ts, {"loss": mean_loss, "q_value": z})
+        return ts, loss
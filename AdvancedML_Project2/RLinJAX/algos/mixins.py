@@ -1,12 +1,27 @@
+from dataclasses import fields
+
 import chex
 import jax
 import numpy as np
 from flax import struct
 from jax import numpy as jnp
+from jax.experimental.shard_map import shard_map
+from jax.sharding import Mesh
+from jax.sharding import PartitionSpec as P
 from optax import linear_schedule
 
 from RLinJAX.algos.algorithm import register_init
-from RLinJAX.buffers import ReplayBuffer
+from RLinJAX.buffers import (
+    HostReplayBuffer,
+    PrioritizedReplayBuffer,
+    ReplayBuffer,
+    make_codec,
+    n_step_transitions,
+)
+from RLinJAX.profiling import phase
+
+# Name of the mesh axis that environment lanes are split over in data-parallel training
+DEVICE_AXIS = "devices"
 
 
 class EpsilonGreedyMixin(struct.PyTreeNode):
@@ -26,21 +41,66 @@ class EpsilonGreedyMixin(struct.PyTreeNode):
 class VectorizedEnvMixin(struct.PyTreeNode):
     num_envs: int = struct.field(pytree_node=False, default=1)
 
+    @property
+    def env_params_axis(self):
+        # Sampled environment parameters have one entry per environment
+        return None if self.env_params_sampler is None else 0
+
     @property
     def vmap_reset(self):
-        return jax.vmap(self.env.reset, in_axes=(0, None))
+        return jax.vmap(self.env.reset, in_axes=(0, self.env_params_axis))
 
     @property
     def vmap_step(self):
-        return jax.vmap(self.env.step, in_axes=(0, 0, 0, None))
+        return jax.vmap(self.env.step, in_axes=(0, 0, 0, self.env_params_axis))
+
+    def train_env_params(self, ts):
+        """Parameters of the training environments, one variant per environment if
+        `env_params_sampler` is set.
+        """
+        if self.env_params_sampler is None:
+            return self.env_params
+        return ts.env_params
+
+    def resample_env_params(self, ts, done):
+        """Replaces the parameters of the environments whose episode ended by new
+        variants if `env_params_sampler` is set, so that every episode is played on a
+        variant of its own. Environments reset themselves within `step`, so the first
+        state of an episode is drawn with the parameters of the previous episode.
+        """
+        if self.env_params_sampler is None:
+            return ts
+
+        rng, params_rng = jax.random.split(ts.rng)
+        env_params = jax.vmap(self.env_params_sampler, in_axes=(0, None))(
+            jax.random.split(params_rng, self.num_envs), self.env_params
+        )
+        env_params = jax.tree.map(
+            lambda new, old: jnp.where(
+                jnp.expand_dims(done, tuple(range(1, old.ndim))), new, old
+            ),
+            env_params,
+            ts.env_params,
+        )
+        return ts.replace(rng=rng, env_params=env_params)
 
     @register_init
     def initialize_env_state(self, rng):
         rng, env_rng = jax.random.split(rng)
+        env_params, state = self.env_params, {}
+        if self.env_params_sampler is not None:
+            # Every environment starts with its own variant, see resample_env_params
+            env_rng, params_rng = jax.random.split(env_rng)
+            env_params = jax.vmap(self.env_params_sampler, in_axes=(0, None))(
+                jax.random.split(params_rng, self.num_envs), self.env_params
+            )
+            state["env_params"] = env_params
+
         obs, env_state = self.vmap_reset(
-            jax.random.split(env_rng, self.num_envs), self.env_params
+            jax.random.split(env_rng, self.num_envs), env_params
         )
         return {
+            **state,
             "env_state": env_state,
             "last_obs": obs,
             "global_step": 0,
@@ -52,54 +112,144 @@ class ReplayBufferMixin(VectorizedEnvMixin):
     buffer_size: int = struct.field(pytree_node=False, default=131_072)
     fill_buffer: int = struct.field(pytree_node=False, default=2_048)
     batch_size: int = struct.field(pytree_node=False, default=256)
+    compact_replay: bool = struct.field(pytree_node=False, default=False)
+    obs_storage_dtype: str = struct.field(pytree_node=False, default=None)
+    reward_storage_dtype: str = struct.field(pytree_node=False, default=None)
+    prioritized_replay: bool = struct.field(pytree_node=False, default=False)
+    host_replay: bool = struct.field(pytree_node=False, default=False)
+    host_replay_path: str = struct.field(pytree_node=False, default=None)
+    priority_exponent: chex.Scalar = struct.field(pytree_node=True, default=0.6)
+    priority_eps: chex.Scalar = struct.field(pytree_node=True, default=1e-6)
+    importance_sampling_exponent: chex.Scalar = struct.field(
+        pytree_node=True, default=0.4
+    )
+
+    @classmethod
+    def create(cls, **config):
+        algo = super().create(**config)
+        if algo.host_replay:
+            # Host replay buffers can only sample uniformly from whole transitions
+            if algo.prioritized_replay:
+                raise ValueError("Host replay does not support prioritized replay")
+            if getattr(algo, "n_step", 1) > 1:
+                raise ValueError("Host replay does not support n-step returns")
+            if algo.compact_replay:
+                raise ValueError("Host replay does not support the compact layout")
+        return algo
+
+    @property
+    def steps_per_train_iteration(self):
+        return self.num_envs
+
+    @property
+    def gradient_steps_per_train_iteration(self):
+        return self.num_epochs
+
+    @property
+    def importance_sampling_schedule(self):
+        return linear_schedule(
+            self.importance_sampling_exponent, 1.0, self.total_timesteps
+        )
 
     @register_init
     def initialize_replay_buffer(self, rng):
-        buf = ReplayBuffer.empty(self.buffer_size, self.obs_space, self.action_space)
+        num_lanes = self.num_envs if self.compact_replay else None
+        codecs = {
+            "obs_codec": make_codec(self.obs_storage_dtype, self.obs_space),
+            "reward_codec": make_codec(self.reward_storage_dtype),
+        }
+        args = (self.buffer_size, self.obs_space, self.action_space, num_lanes)
+
+        if self.host_replay:
+            buf = HostReplayBuffer.empty(*args, **codecs, path=self.host_replay_path)
+        elif self.prioritized_replay:
+            buf = PrioritizedReplayBuffer.empty(*args, **codecs)
+        else:
+            buf = ReplayBuffer.empty(*args, **codecs)
         return {"replay_buffer": buf}
 
-    def train(self, rng=None, train_state=None):
-        if train_state is None and rng is None:
-            raise ValueError("Either train_state or rng must be provided")
-
-        ts = train_state or self.init_state(rng)
-
-        if not self.skip_initial_evaluation:
-            initial_evaluation = self.eval_callback(self, ts, ts.rng)
+    def sample_minibatches(self, ts, rng, num_batches):
+        """Samples `num_batches` minibatches from the replay buffer at once. Returns
+        the stacked minibatches, the sampled buffer indices and the importance sampling
+        weight of each transition. Indices are only returned and weights differ from
+        one if `prioritized_replay` is set. If the algorithm has an `n_step` field
+        larger than one, the minibatches contain n-step transitions.
+        """
+        buf = ts.replay_buffer
+        n_step = getattr(self, "n_step", 1)
+        if n_step == 1 and not self.prioritized_replay:
+            minibatches = buf.sample_many(num_batches, self.batch_size, rng)
+            return minibatches, None, jnp.ones((num_batches, self.batch_size))
+
+        def sample_index(rng):
+            if n_step == 1:
+                return buf.sample_index(self.batch_size, rng)
+            return buf.sample_window_index(self.batch_size, rng, n_step, self.num_envs)
+
+        index = jax.vmap(sample_index)(jax.random.split(rng, num_batches))
+        if n_step == 1:
+            minibatches = buf.gather(index)
+        else:
+            windows = buf.gather(buf.window_index(index, n_step, self.num_envs))
+            minibatches = n_step_transitions(windows, self.gamma)
+
+        if not self.prioritized_replay:
+            return minibatches, None, jnp.ones((num_batches, self.batch_size))
+
+        beta = self.importance_sampling_schedule(ts.global_step)
+        weight = buf.importance_weights(index, beta)
+        return minibatches, index, weight
+
+    def sample_and_update(self, ts, rng, update_iteration):
+        """Runs `update_iteration(ts, (minibatch, index, weight))` on `num_epochs`
+        minibatches and returns the train state and the stacked minibatches. The
+        minibatches of all epochs are sampled at once, except with prioritized replay,
+        where each epoch samples with the priorities updated by the previous epochs.
+        """
+
+        def normalize(ts, minibatch):
+            if not getattr(self, "normalize_observations", False):
+                return minibatch
+            return minibatch._replace(
+                obs=self.normalize_obs(ts.rms_state, minibatch.obs),
+                next_obs=self.normalize_obs(ts.rms_state, minibatch.next_obs),
+            )
 
-        def eval_iteration(ts, unused):
-            # Run a few trainig iterations
-            ts = jax.lax.fori_loop(
-                0,
-                np.ceil(self.eval_freq / self.num_envs).astype(int),
-                lambda _, ts: self.train_iteration(ts),
-                ts,
+        if not self.prioritized_replay:
+            minibatches, index, weight = phase(
+                "sample", self.sample_minibatches, ts, rng, num_batches=self.num_epochs
             )
+            minibatches = normalize(ts, minibatches)
+            xs = (minibatches, index, weight)
+            ts, _ = phase("update", jax.lax.scan, update_iteration, ts, xs)
+            return ts, minibatches
 
-            # Run evaluation
-            return ts, self.eval_callback(self, ts, ts.rng)
+        def sample_and_update_epoch(ts, rng):
+            xs = self.sample_minibatches(ts, rng, num_batches=1)
+            minibatch, index, weight = jax.tree.map(lambda x: x[0], xs)
+            minibatch = normalize(ts, minibatch)
+            ts, _ = update_iteration(ts, (minibatch, index, weight))
+            return ts, minibatch
 
-        ts, evaluation = jax.lax.scan(
-            eval_iteration,
-            ts,
-            None,
-            np.ceil(self.total_timesteps / self.eval_freq).astype(int),
-        )
+        rngs = jax.random.split(rng, self.num_epochs)
+        return phase("update", jax.lax.scan, sample_and_update_epoch, ts, rngs)
 
-        if not self.skip_initial_evaluation:
-            evaluation = jax.tree_map(
-                lambda i, ev: jnp.concatenate((jnp.expand_dims(i, 0), ev)),
-                initial_evaluation,
-                evaluation,
-            )
+    def update_priorities(self, ts, index, td_error):
+        if not self.prioritized_replay:
+            return ts
 
-        return ts, evaluation
+        priority = (jnp.abs(td_error) + self.priority_eps) ** self.priority_exponent
+        buf = ts.replay_buffer.update_priorities(index, priority)
+        return ts.replace(replay_buffer=buf)
 
 
 class OnPolicyMixin(VectorizedEnvMixin):
     num_envs: int = struct.field(pytree_node=False, default=64)  # overwrite default
     num_steps: int = struct.field(pytree_node=False, default=64)
     num_minibatches: int = struct.field(pytree_node=False, default=16)
+    num_devices: int = struct.field(pytree_node=False, default=1)
+    num_microbatches: int = struct.field(pytree_node=False, default=1)
+    remat: bool = struct.field(pytree_node=False, default=False)
 
     @property
     def minibatch_size(self):
@@ -110,50 +260,151 @@ class OnPolicyMixin(VectorizedEnvMixin):
     def iteration_size(self):
         return self.minibatch_size * self.num_minibatches
 
-    def shuffle_and_split(self, data, rng):
-        permutation = jax.random.permutation(rng, self.iteration_size)
-
-        def _shuffle_and_split(x):
-            x = x.reshape((self.iteration_size, *x.shape[2:]))
-            x = jnp.take(x, permutation, axis=0)
-            return x.reshape(self.num_minibatches, -1, *x.shape[1:])
-
-        return jax.tree_util.tree_map(_shuffle_and_split, data)
-
-    def train(self, rng=None, train_state=None):
-        if train_state is None and rng is None:
-            raise ValueError("Either train_state or rng must be provided")
+    @property
+    def steps_per_train_iteration(self):
+        return self.num_envs * self.num_steps
 
-        ts = train_state or self.init_state(rng)
+    @property
+    def gradient_steps_per_train_iteration(self):
+        return self.num_epochs * self.num_minibatches
 
-        if not self.skip_initial_evaluation:
-            initial_evaluation = self.eval_callback(self, ts, ts.rng)
+    def flatten_rollout(self, data):
+        """Merges the step and environment axes of a rollout."""
+        return jax.tree_util.tree_map(
+            lambda x: x.reshape((self.iteration_size, *x.shape[2:])), data
+        )
 
-        def eval_iteration(ts, unused):
-            # Run a few training iterations
-            iteration_steps = self.num_envs * self.num_steps
-            num_iterations = np.ceil(self.eval_freq / iteration_steps).astype(int)
-            ts = jax.lax.fori_loop(
-                0,
-                num_iterations,
-                lambda _, ts: self.train_iteration(ts),
-                ts,
+    def minibatch_indices(self, rng):
+        """Returns a random partition of the flattened rollout into minibatches, as an
+        array of shape `(num_minibatches, minibatch_size)`.
+        """
+        permutation = jax.random.permutation(rng, self.iteration_size)
+        return permutation.reshape(self.num_minibatches, self.minibatch_size)
+
+    def take_minibatch(self, data, index):
+        return jax.tree_util.tree_map(lambda x: jnp.take(x, index, axis=0), data)
+
+    def update_minibatches(self, ts, data, rng, update_fn):
+        """Runs `update_fn(ts, minibatch)` on all minibatches of the flattened rollout
+        `data`. Instead of shuffling the whole rollout, only the rows of the current
+        minibatch are gathered in each step.
+        """
+        ts, _ = jax.lax.scan(
+            lambda ts, index: (update_fn(ts, self.take_minibatch(data, index)), None),
+            ts,
+            self.minibatch_indices(rng),
+        )
+        return ts
+
+    def eval_iteration(self, ts, unused=None):
+        if self.num_devices == 1:
+            return super().eval_iteration(ts, unused)
+
+        ts = self.train_data_parallel(ts, self.train_iterations_per_eval)
+        return self.run_evaluation(ts)
+
+    def train_data_parallel(self, ts, num_iterations):
+        """Runs `num_iterations` training iterations with the environment lanes split
+        evenly across `num_devices` devices. Each device collects and trains on the
+        rollouts of its own lanes, while gradients, observation statistics and
+        metrics are averaged across devices, so that the networks stay replicated.
+        Every device splits its rollout into `num_minibatches` minibatches, so the
+        effective minibatch size is the same as on a single device.
+
+        On CPU, multiple host devices are exposed by setting
+        `XLA_FLAGS=--xla_force_host_platform_device_count=N` before importing JAX.
+        """
+        if self.num_envs % self.num_devices != 0:
+            raise ValueError(
+                f"num_envs ({self.num_envs}) must be divisible by num_devices "
+                f"({self.num_devices})"
+            )
+        devices = jax.devices()[: self.num_devices]
+        if len(devices) < self.num_devices:
+            raise ValueError(
+                f"num_devices is {self.num_devices}, but only {len(devices)} devices "
+                "are available"
             )
 
-            # Run evaluation
-            return ts, self.eval_callback(self, ts, ts.rng)
+        mesh = Mesh(np.array(devices), (DEVICE_AXIS,))
+        lanes = ("env_params", "env_state", "last_obs", "last_done")
+        specs = ts.replace(
+            **{f.name: P(DEVICE_AXIS) if f.name in lanes else P() for f in fields(ts)}
+        )
+        shard = self.replace(num_envs=self.num_envs // self.num_devices)
+
+        def train_iteration(_, ts):
+            # Lanes of different devices need different keys, the key in the train
+            # state stays the same on all devices
+            rng, rng_shard = jax.random.split(ts.rng)
+            rng_shard = jax.random.fold_in(rng_shard, jax.lax.axis_index(DEVICE_AXIS))
+            global_step = ts.global_step + self.steps_per_train_iteration
+
+            ts = shard.train_iteration(ts.replace(rng=rng_shard))
+            return ts.replace(rng=rng, global_step=global_step)
+
+        def train_shard(ts):
+            return jax.lax.fori_loop(0, num_iterations, train_iteration, ts)
+
+        # Replication is not checked, since it cannot be inferred through the
+        # `custom_vmap`s of some environments, e.g. the gymnasium adapter. Replicated
+        # fields stay equal on all devices since their updates are averaged.
+        return shard_map(
+            train_shard, mesh, in_specs=(specs,), out_specs=specs, check_rep=False
+        )(ts)
+
+    def all_reduce(self, tree):
+        """Averages `tree`, e.g. gradients, over the devices of data-parallel
+        training. Returns it unchanged on a single device.
+        """
+        if self.num_devices == 1:
+            return tree
+        return jax.lax.pmean(tree, DEVICE_AXIS)
+
+    def accumulate_gradients(self, loss_fn, params, batch):
+        """Returns `jax.grad(loss_fn, has_aux=True)(params, batch)`. If
+        `num_microbatches` is larger than one, the batch is split into that many
+        micro-batches, whose gradients are computed one after another in a `scan` and
+        averaged, so that only the activations of one micro-batch are held in memory.
+        For losses that are means over the batch, this is the gradient of the whole
+        batch. Scalar auxiliary outputs are averaged, others are concatenated.
+
+        If `remat` is set, the forward pass is recomputed during the backward pass
+        instead of keeping its activations.
+        """
+        if self.remat:
+            loss_fn = jax.checkpoint(loss_fn)
+        grad_fn = jax.grad(loss_fn, has_aux=True)
+        if self.num_microbatches == 1:
+            return grad_fn(params, batch)
+
+        batch_size = jax.tree_util.tree_leaves(batch)[0].shape[0]
+        if batch_size % self.num_microbatches != 0:
+            raise ValueError(
+                f"The minibatch size ({batch_size}) must be divisible by "
+                f"num_microbatches ({self.num_microbatches})"
+            )
 
-        num_evals = np.ceil(self.total_timesteps / self.eval_freq).astype(int)
-        ts, evaluation = jax.lax.scan(eval_iteration, ts, None, num_evals)
+        def accumulate(grads, microbatch):
+            microbatch_grads, aux = grad_fn(params, microbatch)
+            return jax.tree_map(jnp.add, grads, microbatch_grads), aux
 
-        if not self.skip_initial_evaluation:
-            evaluation = jax.tree_map(
-                lambda i, ev: jnp.concatenate((jnp.expand_dims(i, 0), ev)),
-                initial_evaluation,
-                evaluation,
-            )
+        microbatches = jax.tree_map(
+            lambda x: x.reshape(self.num_microbatches, -1, *x.shape[1:]), batch
+        )
+        grads = jax.tree_map(jnp.zeros_like, params)
+        grads, aux = jax.lax.scan(accumulate, grads, microbatches)
+        grads = jax.tree_map(lambda g: g / self.num_microbatches, grads)
+        aux = jax.tree_map(
+            lambda x: x.mean(axis=0) if x.ndim == 1 else x.reshape(-1, *x.shape[2:]),
+            aux,
+        )
+        return grads, aux
 
-        return ts, evaluation
+    def log_metrics(self, ts, metrics):
+        if self.collect_metrics and self.num_devices > 1:
+            metrics = self.all_reduce({k: jnp.mean(v) for k, v in metrics.items()})
+        return super().log_metrics(ts, metrics)
 
 
 class TargetNetworkMixin(struct.PyTreeNode):
@@ -197,6 +448,14 @@ class NormalizeObservationsMixin(struct.PyTreeNode):
         batch_count = batch.shape[0]
         batch_mean, batch_var = batch.mean(axis=0), batch.var(axis=0)
 
+        num_devices = getattr(self, "num_devices", 1)
+        if num_devices > 1:
+            # Merge the statistics of the batches of all devices
+            batch_square = jax.lax.pmean(batch_var + batch_mean**2, DEVICE_AXIS)
+            batch_mean = jax.lax.pmean(batch_mean, DEVICE_AXIS)
+            batch_var = batch_square - batch_mean**2
+            batch_count = batch_count * num_devices
+
         delta = batch_mean - rms_state.mean
         tot_count = rms_state.count + batch_count
 
@@ -2,7 +2,6 @@ import chex
 import gymnax
 import jax
 import numpy as np
-import optax
 from flax import linen as nn
 from flax import struct
 from flax.training.train_state import TrainState
@@ -10,7 +9,8 @@ from jax import numpy as jnp
 
 from RLinJAX.algos.algorithm import Algorithm, register_init
 from RLinJAX.algos.mixins import NormalizeObservationsMixin, OnPolicyMixin
-from RLinJAX.networks import DiscretePolicy, GaussianPolicy, VNetwork
+from RLinJAX.networks import DiscretePolicy, GaussianPolicy, VNetwork, pop_dtypes
+from RLinJAX.profiling import phase
 
 
 class Trajectory(struct.PyTreeNode):
@@ -59,6 +59,7 @@ class PPO(OnPolicyMixin, NormalizeObservationsMixin, Algorithm):
 
         hidden_layer_sizes = agent_kwargs.pop("hidden_layer_sizes", (64, 64))
         agent_kwargs["hidden_layer_sizes"] = tuple(hidden_layer_sizes)
+        agent_kwargs.update(pop_dtypes(config))
 
         if discrete:
             actor = DiscretePolicy(action_space.n, **agent_kwargs)
@@ -80,31 +81,41 @@ class PPO(OnPolicyMixin, NormalizeObservationsMixin, Algorithm):
         actor_params = self.actor.init(rng_actor, obs_ph, rng_actor)
         critic_params = self.critic.init(rng_critic, obs_ph)
 
-        tx = optax.adam(learning_rate=self.learning_rate)
+        tx = self.make_optimizer()
         actor_ts = TrainState.create(apply_fn=(), params=actor_params, tx=tx)
         critic_ts = TrainState.create(apply_fn=(), params=critic_params, tx=tx)
         return {"actor_ts": actor_ts, "critic_ts": critic_ts}
 
+    @property
+    def metric_names(self):
+        return (
+            "actor_loss",
+            "critic_loss",
+            "entropy",
+            "approx_kl",
+            "clip_fraction",
+            "value",
+        )
+
     def train_iteration(self, ts):
-        ts, trajectories = self.collect_trajectories(ts)
+        ts, trajectories = phase("collect", self.collect_trajectories, ts)
 
         last_val = self.critic.apply(ts.critic_ts.params, ts.last_obs)
         last_val = jnp.where(ts.last_done, 0, last_val)
-        advantages, targets = self.calculate_gae(trajectories, last_val)
+        advantages, targets = phase(
+            "advantages", self.calculate_gae, trajectories, last_val
+        )
+
+        batch = AdvantageMinibatch(trajectories, advantages, targets)
+        batch = self.flatten_rollout(batch)
 
         def update_epoch(ts, unused):
             rng, minibatch_rng = jax.random.split(ts.rng)
             ts = ts.replace(rng=rng)
-            batch = AdvantageMinibatch(trajectories, advantages, targets)
-            minibatches = self.shuffle_and_split(batch, minibatch_rng)
-            ts, _ = jax.lax.scan(
-                lambda ts, mbs: (self.update(ts, mbs), None),
-                ts,
-                minibatches,
-            )
+            ts = self.update_minibatches(ts, batch, minibatch_rng, self.update)
             return ts, None
 
-        ts, _ = jax.lax.scan(update_epoch, ts, None, self.num_epochs)
+        ts, _ = phase("update", jax.lax.scan, update_epoch, ts, None, self.num_epochs)
         return ts
 
     def collect_trajectories(self, ts):
@@ -130,7 +141,9 @@ class PPO(OnPolicyMixin, NormalizeObservationsMixin, Algorithm):
                 action = jnp.clip(unclipped_action, low, high)
 
             # Step environment
-            t = self.vmap_step(rng_steps, ts.env_state, action, self.env_params)
+            t = self.vmap_step(
+                rng_steps, ts.env_state, action, self.train_env_params(ts)
+            )
             next_obs, env_state, reward, done, _ = t
 
             if self.normalize_observations:
@@ -147,6 +160,7 @@ class PPO(OnPolicyMixin, NormalizeObservationsMixin, Algorithm):
                 last_done=done,
                 global_step=ts.global_step + self.num_envs,
             )
+            ts = self.resample_env_params(ts, done)
             return ts, transition
 
         ts, trajectories = jax.lax.scan(env_step, ts, None, self.num_steps)
@@ -174,7 +188,13 @@ class PPO(OnPolicyMixin, NormalizeObservationsMixin, Algorithm):
         return advantages, advantages + trajectories.value
 
     def update_actor(self, ts, batch):
-        def actor_loss_fn(params):
+        # Normalized over the whole minibatch, also when it is split into micro-batches
+        advantages = (batch.advantages - batch.advantages.mean()) / (
+            batch.advantages.std() + 1e-8
+        )
+        batch = batch.replace(advantages=advantages)
+
+        def actor_loss_fn(params, batch):
             log_prob, entropy = self.actor.apply(
                 params,
                 batch.trajectories.obs,
@@ -185,20 +205,30 @@ class PPO(OnPolicyMixin, NormalizeObservationsMixin, Algorithm):
 
             # Calculate actor loss
             ratio = jnp.exp(log_prob - batch.trajectories.log_prob)
-            advantages = (batch.advantages - batch.advantages.mean()) / (
-                batch.advantages.std() + 1e-8
-            )
+            advantages = batch.advantages
             clipped_ratio = jnp.clip(ratio, 1 - self.clip_eps, 1 + self.clip_eps)
             pi_loss1 = ratio * advantages
             pi_loss2 = clipped_ratio * advantages
             pi_loss = -jnp.minimum(pi_loss1, pi_loss2).mean()
-            return pi_loss - self.ent_coef * entropy
 
-        grads = jax.grad(actor_loss_fn)(ts.actor_ts.params)
-        return ts.replace(actor_ts=ts.actor_ts.apply_gradients(grads=grads))
+            log_ratio = log_prob - batch.trajectories.log_prob
+            metrics = {
+                "actor_loss": pi_loss,
+                "entropy": entropy,
+                "approx_kl": (ratio - 1 - log_ratio).mean(),
+                "clip_fraction": (jnp.abs(ratio - 1) > self.clip_eps).mean(),
+            }
+            return pi_loss - self.ent_coef * entropy, metrics
+
+        grads, metrics = self.accumulate_gradients(
+            actor_loss_fn, ts.actor_ts.params, batch
+        )
+        grads = self.all_reduce(grads)
+        ts = ts.replace(actor_ts=ts.actor_ts.apply_gradients(grads=grads))
+        return self.log_metrics(ts, metrics)
 
     def update_critic(self, ts, batch):
-        def critic_loss_fn(params):
+        def critic_loss_fn(params, batch):
             value = self.critic.apply(params, batch.trajectories.obs)
             value_pred_clipped = batch.trajectories.value + (
                 value - batch.trajectories.value
@@ -206,10 +236,14 @@ class PPO(OnPolicyMixin, NormalizeObservationsMixin, Algorithm):
             value_losses = jnp.square(value - batch.targets)
             value_losses_clipped = jnp.square(value_pred_clipped - batch.targets)
             value_loss = 0.5 * jnp.maximum(value_losses, value_losses_clipped).mean()
-            return self.vf_coef * value_loss
+            return self.vf_coef * value_loss, (value_loss, value)
 
-        grads = jax.grad(critic_loss_fn)(ts.critic_ts.params)
-        return ts.replace(critic_ts=ts.critic_ts.apply_gradients(grads=grads))
+        grads, (value_loss, value) = self.accumulate_gradients(
+            critic_loss_fn, ts.critic_ts.params, batch
+        )
+        grads = self.all_reduce(grads)
+        ts = ts.replace(critic_ts=ts.critic_ts.apply_gradients(grads=grads))
+        return self.log_metrics(ts, {"critic_loss": value_loss, "value": value})
 
     def update(self, ts, batch):
         ts = self.update_actor(ts, batch)
@@ -18,8 +18,9 @@ from RLinJAX.algos.mixins import (
     NormalizeObservationsMixin,
     OnPolicyMixin,
 )
-from RLinJAX.networks import DiscreteQNetwork, EpsilonGreedyPolicy
+from RLinJAX.networks import DiscreteQNetwork, EpsilonGreedyPolicy, pop_dtypes
 from RLinJAX.normalize import FloatObsWrapper
+from RLinJAX.profiling import phase
 
 
 class Trajectory(struct.PyTreeNode):
@@ -56,7 +57,8 @@ class PQN(OnPolicyMixin, EpsilonGreedyMixin, NormalizeObservationsMixin, Algorit
     @classmethod
     def create_agent(cls, config, env, env_params):
         agent_kwargs = config.pop("agent_kwargs", {})
-        agent_kwargs["activation"] = lambda x: nn.relu(nn.LayerNorm()(x))
+        agent_kwargs["activation"] = lambda x: nn.relu(nn.LayerNorm(dtype=x.dtype)(x))
+        agent_kwargs.update(pop_dtypes(config))
 
         action_dim = env.action_space(env_params).n
         agent = EpsilonGreedyPolicy(DiscreteQNetwork)(
@@ -75,32 +77,31 @@ class PQN(OnPolicyMixin, EpsilonGreedyMixin, NormalizeObservationsMixin, Algorit
     def initialize_network_params(self, rng):
         obs_ph = jnp.empty([1, *self.env.observation_space(self.env_params).shape])
         q_params = self.agent.init(rng, obs_ph)
-        tx = optax.adam(learning_rate=self.learning_rate)
+        tx = self.make_optimizer()
         q_ts = TrainState.create(apply_fn=(), params=q_params, tx=tx)
         return {"q_ts": q_ts}
 
+    @property
+    def metric_names(self):
+        return ("loss", "q_value")
+
     def train_iteration(self, ts):
         epsilon = self.epsilon_schedule(ts.global_step)
-        ts, trajectories = self.collect_trajectories(ts, epsilon)
+        ts, trajectories = phase("collect", self.collect_trajectories, ts, epsilon)
 
         max_last_q = self.agent.apply(ts.q_ts.params, ts.last_obs).max(axis=1)
         max_last_q = jnp.where(ts.last_done, 0, max_last_q)
-        targets = self.calculate_targets(trajectories, max_last_q)
+        targets = phase("targets", self.calculate_targets, trajectories, max_last_q)
+
+        batch = self.flatten_rollout(TargetMinibatch(trajectories, targets))
 
         def update_epoch(ts, unused):
             rng, minibatch_rng = jax.random.split(ts.rng)
             ts = ts.replace(rng=rng)
-
-            batch = TargetMinibatch(trajectories, targets)
-            minibatches = self.shuffle_and_split(batch, minibatch_rng)
-            ts, _ = jax.lax.scan(
-                lambda ts, mbs: (self.update(ts, mbs), None),
-                ts,
-                minibatches,
-            )
+            ts = self.update_minibatches(ts, batch, minibatch_rng, self.update)
             return ts, None
 
-        ts, _ = jax.lax.scan(update_epoch, ts, None, self.num_epochs)
+        ts, _ = phase("update", jax.lax.scan, update_epoch, ts, None, self.num_epochs)
         return ts
 
     def collect_trajectories(self, ts, epsilon):
@@ -113,7 +114,9 @@ class PQN(OnPolicyMixin, EpsilonGreedyMixin, NormalizeObservationsMixin, Algorit
             )
 
             rng_step = jax.random.split(rng_step, self.num_envs)
-            transition = self.vmap_step(rng_step, ts.env_state, action, self.env_params)
+            transition = self.vmap_step(
+                rng_step, ts.env_state, action, self.train_env_params(ts)
+            )
             next_obs, env_state, reward, done, _ = transition
             next_q = self.agent.apply(ts.q_ts.params, next_obs)
 
@@ -129,6 +132,7 @@ class PQN(OnPolicyMixin, EpsilonGreedyMixin, NormalizeObservationsMixin, Algorit
                 last_done=done,
                 global_step=ts.global_step + self.num_envs,
             )
+            ts = self.resample_env_params(ts, done)
             return ts, transition
 
         ts, trajectories = jax.lax.scan(env_step, ts, None, self.num_steps)
@@ -154,12 +158,16 @@ class PQN(OnPolicyMixin, EpsilonGreedyMixin, NormalizeObservationsMixin, Algorit
         return targets
 
     def update(self, ts, minibatch):
-        tr, ta = minibatch.trajectories, minibatch.targets
-
-        def loss_fn(params):
+        def loss_fn(params, minibatch):
+            tr, ta = minibatch.trajectories, minibatch.targets
             q_values = self.agent.apply(params, tr.obs, tr.action, method="take")
-            return optax.l2_loss(q_values, ta).mean()
+            loss = optax.l2_loss(q_values, ta).mean()
+            return loss, (loss, q_values)
 
-        grads = jax.grad(loss_fn)(ts.q_ts.params)
+        grads, (loss, q_values) = self.accumulate_gradients(
+            loss_fn, ts.q_ts.params, minibatch
+        )
+        grads = self.all_reduce(grads)
         ts = ts.replace(q_ts=ts.q_ts.apply_gradients(grads=grads))
+        ts = self.log_metrics(ts, {"loss": loss, "q_value": q_values})
         return ts
@@ -18,10 +18,12 @@ from RLinJAX.algos.mixins import (
 from RLinJAX.buffers import Minibatch
 from RLinJAX.networks import (
     DiscretePolicy,
-    DiscreteQNetwork,
-    QNetwork,
+    EnsembleDiscreteQNetwork,
+    EnsembleQNetwork,
     SquashedGaussianPolicy,
+    pop_dtypes,
 )
+from RLinJAX.profiling import phase
 
 
 class SAC(
@@ -54,11 +56,16 @@ class SAC(
         agent_kwargs["activation"] = getattr(nn, activation)
         layers = config.pop("hidden_layer_sizes", (64, 64))
         agent_kwargs["hidden_layer_sizes"] = tuple(layers)
+        agent_kwargs.update(pop_dtypes(config))
 
+        # All critics are computed by one network with stacked parameters
+        num_critics = config.get("num_critics", 2)
         action_space = env.action_space(env_params)
         if isinstance(action_space, gymnax.environments.spaces.Discrete):
             actor = DiscretePolicy(action_space.n, **agent_kwargs)
-            critic = DiscreteQNetwork(action_dim=action_space.n, **agent_kwargs)
+            critic = EnsembleDiscreteQNetwork(
+                action_dim=action_space.n, num_members=num_critics, **agent_kwargs
+            )
         else:
             actor = SquashedGaussianPolicy(
                 np.prod(action_space.shape),
@@ -66,7 +73,7 @@ class SAC(
                 log_std_range=(-10, 2),
                 **agent_kwargs,
             )
-            critic = QNetwork(**agent_kwargs)
+            critic = EnsembleQNetwork(num_members=num_critics, **agent_kwargs)
         return {"actor": actor, "critic": critic}
 
     @property
@@ -75,15 +82,6 @@ class SAC(
             return -self.target_entropy_ratio * np.log(1 / self.action_dim)
         return -self.action_dim
 
-    @property
-    def vmap_critic(self, method="__call__"):
-        def apply(*args):
-            return self.critic.apply(*args, method=method)
-
-        if self.discrete:
-            return jax.vmap(apply, in_axes=(0, None))
-        return jax.vmap(apply, in_axes=(0, None, None))
-
     @register_init
     def initialize_network_params(self, rng):
         obs_ph = jnp.empty((1, *self.obs_space.shape))
@@ -91,18 +89,13 @@ class SAC(
         rng, rng_actor, rng_critic = jax.random.split(rng, 3)
         actor_params = self.actor.init(rng_actor, obs_ph, rng_actor)
 
-        rng_critic = jax.random.split(rng_critic, self.num_critics)
         if self.discrete:
-            critic_params = jax.vmap(self.critic.init, in_axes=(0, None))(
-                rng_critic, obs_ph
-            )
+            critic_params = self.critic.init(rng_critic, obs_ph)
         else:
             act_ph = jnp.empty((1, *self.env.action_space(self.env_params).shape))
-            critic_params = jax.vmap(self.critic.init, in_axes=(0, None, None))(
-                rng_critic, obs_ph, act_ph
-            )
+            critic_params = self.critic.init(rng_critic, obs_ph, act_ph)
 
-        tx = optax.adam(learning_rate=self.learning_rate)
+        tx = self.make_optimizer()
         actor_ts = TrainState.create(apply_fn=(), params=actor_params, tx=tx)
         critic_ts = TrainState.create(apply_fn=(), params=critic_params, tx=tx)
         critic_target_params = critic_params
@@ -120,33 +113,30 @@ class SAC(
             "alpha_ts": alpha_ts,
         }
 
+    @property
+    def metric_names(self):
+        return ("actor_loss", "critic_loss", "q_value", "entropy", "alpha")
+
     def train_iteration(self, ts):
         # Collect transitions
         old_global_step = ts.global_step
 
-        ts, batch = self.collect_transitions(ts)
-        ts = ts.replace(replay_buffer=ts.replay_buffer.extend(batch))
+        ts, batch = phase("collect", self.collect_transitions, ts)
+        replay_buffer = phase("extend", ts.replay_buffer.extend, batch)
+        ts = ts.replace(replay_buffer=replay_buffer)
+
+        def update_iteration(ts, xs):
+            minibatch, index, weight = xs
+            ts, td_error = self.update(ts, minibatch, weight)
+            ts = self.update_priorities(ts, index, td_error)
+            return ts, None
 
-        def update_iteration(ts):
-            # Sample minibatch
+        def do_updates(ts):
             rng, rng_sample = jax.random.split(ts.rng)
             ts = ts.replace(rng=rng)
-            minibatch = ts.replay_buffer.sample(self.batch_size, rng_sample)
-            if self.normalize_observations:
-                minibatch = minibatch._replace(
-                    obs=self.normalize_obs(ts.rms_state, minibatch.obs),
-                    next_obs=self.normalize_obs(ts.rms_state, minibatch.next_obs),
-                )
-
-            # Update networks
-            ts = self.update(ts, minibatch)
+            ts, _ = self.sample_and_update(ts, rng_sample, update_iteration)
             return ts
 
-        def do_updates(ts):
-            return jax.lax.fori_loop(
-                0, self.num_epochs, lambda _, ts: update_iteration(ts), ts
-            )
-
         start_training = ts.global_step > self.fill_buffer
         ts = jax.lax.cond(start_training, lambda: do_updates(ts), lambda: ts)
 
@@ -190,7 +180,7 @@ class SAC(
         ts = ts.replace(rng=rng)
         rng_steps = jax.random.split(rng_steps, self.num_envs)
         next_obs, env_state, rewards, dones, _ = self.vmap_step(
-            rng_steps, ts.env_state, actions, self.env_params
+            rng_steps, ts.env_state, actions, self.train_env_params(ts)
         )
         if self.normalize_observations:
             ts = ts.replace(rms_state=self.update_rms(ts.rms_state, next_obs))
@@ -207,6 +197,7 @@ class SAC(
             env_state=env_state,
             global_step=ts.global_step + self.num_envs,
         )
+        ts = self.resample_env_params(ts, dones)
         return ts, minibatch
 
     def udpate_actor(self, ts, mb):
@@ -219,22 +210,31 @@ class SAC(
                 logprob = jnp.log(
                     self.actor.apply(params, mb.obs, method="_action_dist").probs
                 )
-                qs = self.vmap_critic(ts.critic_ts.params, mb.obs)
-                loss_pi = alpha * logprob - qs.min(axis=0)
+                q = self.critic.apply(ts.critic_ts.params, mb.obs, method="min")
+                loss_pi = alpha * logprob - q
                 loss_pi = jnp.sum(jnp.exp(logprob) * loss_pi, axis=1)
             else:
                 action, logprob = self.actor.apply(
                     params, mb.obs, action_rng, method="action_log_prob"
                 )
-                qs = self.vmap_critic(ts.critic_ts.params, mb.obs, action)
-                loss_pi = alpha * logprob - qs.min(axis=0)
+                q = self.critic.apply(ts.critic_ts.params, mb.obs, action, method="min")
+                loss_pi = alpha * logprob - q
             return loss_pi.mean(), logprob
 
-        grads, logprob = jax.grad(actor_loss_fn, has_aux=True)(ts.actor_ts.params)
+        (loss, logprob), grads = jax.value_and_grad(actor_loss_fn, has_aux=True)(
+            ts.actor_ts.params
+        )
         ts = ts.replace(actor_ts=ts.actor_ts.apply_gradients(grads=grads))
+
+        if self.discrete:
+            entropy = -jnp.sum(jnp.exp(logprob) * logprob, axis=1)
+        else:
+            entropy = -logprob
+        metrics = {"actor_loss": loss, "entropy": entropy, "alpha": alpha}
+        ts = self.log_metrics(ts, metrics)
         return ts, logprob
 
-    def update_critic(self, ts, mb):
+    def update_critic(self, ts, mb, weight=1.0):
         rng, action_rng = jax.random.split(ts.rng)
         ts = ts.replace(rng=rng)
         alpha = jnp.exp(ts.alpha_ts.params["log_alpha"])
@@ -246,13 +246,12 @@ class SAC(
                     ts.actor_ts.params, mb.next_obs, method="_action_dist"
                 )
                 logprob = jnp.log(action_dist.probs)
-                qs = self.vmap_critic(ts.critic_target_params, mb.next_obs)
-                q_target = jnp.min(qs, axis=0) - alpha * logprob
+                q_target = self.critic.apply(
+                    ts.critic_target_params, mb.next_obs, method="min"
+                )
+                q_target = q_target - alpha * logprob
                 q_target = jnp.sum(jnp.exp(logprob) * q_target, axis=1)
-                qs = jax.vmap(
-                    lambda *args: self.critic.apply(*args, method="take"),
-                    in_axes=(0, None, None),
-                )(params, mb.obs, mb.action)
+                qs = self.critic.apply(params, mb.obs, mb.action, method="take")
             else:
                 action, logprob = self.actor.apply(
                     ts.actor_ts.params,
@@ -260,17 +259,23 @@ class SAC(
                     action_rng,
                     method="action_log_prob",
                 )
-                qs = self.vmap_critic(ts.critic_target_params, mb.next_obs, action)
-                q_target = jnp.min(qs, axis=0) - alpha * logprob
-                qs = self.vmap_critic(params, mb.obs, mb.action)
+                q_target = self.critic.apply(
+                    ts.critic_target_params, mb.next_obs, action, method="min"
+                )
+                q_target = q_target - alpha * logprob
+                qs = self.critic.apply(params, mb.obs, mb.action)
 
             target = mb.reward + self.gamma * (1 - mb.done) * q_target
             losses = jax.vmap(lambda q: optax.l2_loss(q, target))(qs)
-            return losses.sum(axis=0).mean()
+            td_error = jnp.abs(target - qs).mean(axis=0)
+            return (weight * losses.sum(axis=0)).mean(), (td_error, qs)
 
-        grads = jax.grad(critic_loss_fn)(ts.critic_ts.params)
+        (loss, (td_error, qs)), grads = jax.value_and_grad(
+            critic_loss_fn, has_aux=True
+        )(ts.critic_ts.params)
         ts = ts.replace(critic_ts=ts.critic_ts.apply_gradients(grads=grads))
-        return ts
+        ts = self.log_metrics(ts, {"critic_loss": loss, "q_value": qs})
+        return ts, td_error
 
     def update_alpha(self, ts, logprob):
         def alpha_loss_fn(params, logprob):
@@ -284,8 +289,8 @@ class SAC(
         ts = ts.replace(alpha_ts=ts.alpha_ts.apply_gradients(grads=grads))
         return ts
 
-    def update(self, ts, mb):
+    def update(self, ts, mb, weight=1.0):
         ts, logprob = self.udpate_actor(ts, mb)
-        ts = self.update_critic(ts, mb)
+        ts, td_error = self.update_critic(ts, mb, weight)
         ts = self.update_alpha(ts, logprob)
-        return ts
+        return ts, td_error
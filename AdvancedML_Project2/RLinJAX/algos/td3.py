@@ -1,3 +1,5 @@
+from functools import partial
+
 import chex
 import jax
 import numpy as np
@@ -14,7 +16,8 @@ from RLinJAX.algos.mixins import (
     TargetNetworkMixin,
 )
 from RLinJAX.buffers import Minibatch
-from RLinJAX.networks import DeterministicPolicy, QNetwork
+from RLinJAX.networks import DeterministicPolicy, EnsembleQNetwork, pop_dtypes
+from RLinJAX.profiling import phase
 
 # Algorithm outline
 # num_eval_iterations = total_timesteps / eval_freq
@@ -56,9 +59,11 @@ class TD3(
 
     @classmethod
     def create_agent(cls, config, env, env_params):
+        dtypes = pop_dtypes(config)
         actor_kwargs = config.pop("actor_kwargs", {})
         activation = actor_kwargs.pop("activation", "swish")
         actor_kwargs["activation"] = getattr(nn, activation)
+        actor_kwargs.update(dtypes)
         action_range = (
             env.action_space(env_params).low,
             env.action_space(env_params).high,
@@ -71,24 +76,28 @@ class TD3(
         critic_kwargs = config.pop("critic_kwargs", {})
         activation = critic_kwargs.pop("activation", "swish")
         critic_kwargs["activation"] = getattr(nn, activation)
-        critic = QNetwork(hidden_layer_sizes=(64, 64), **critic_kwargs)
+        critic_kwargs.update(dtypes)
+        # All critics are computed by one network with stacked parameters
+        critic = EnsembleQNetwork(
+            hidden_layer_sizes=(64, 64),
+            num_members=config.get("num_critics", 2),
+            **critic_kwargs,
+        )
 
         return {"actor": actor, "critic": critic}
 
     @register_init
     def initialize_network_params(self, rng):
         rng, rng_actor, rng_critic = jax.random.split(rng, 3)
-        rng_critic = jax.random.split(rng_critic, self.num_critics)
         obs_ph = jnp.empty((1, *self.env.observation_space(self.env_params).shape))
         action_ph = jnp.empty((1, *self.env.action_space(self.env_params).shape))
 
-        tx = optax.adam(learning_rate=self.learning_rate)
+        tx = self.make_optimizer()
 
         actor_params = self.actor.init(rng_actor, obs_ph)
         actor_ts = TrainState.create(apply_fn=(), params=actor_params, tx=tx)
 
-        vmap_init = jax.vmap(self.critic.init, in_axes=(0, None, None))
-        critic_params = vmap_init(rng_critic, obs_ph, action_ph)
+        critic_params = self.critic.init(rng_critic, obs_ph, action_ph)
         critic_ts = TrainState.create(apply_fn=(), params=critic_params, tx=tx)
         return {
             "actor_ts": actor_ts,
@@ -98,53 +107,26 @@ class TD3(
         }
 
     @property
-    def vmap_critic(self):
-        return jax.vmap(self.critic.apply, in_axes=(0, None, None))
-
-    def train(self, rng=None, train_state=None):
-        if train_state is None and rng is None:
-            raise ValueError("Either train_state or rng must be provided")
-
-        ts = train_state or self.init_state(rng)
-
-        if not self.skip_initial_evaluation:
-            initial_evaluation = self.eval_callback(self, ts, ts.rng)
-
-        def eval_iteration(ts, unused):
-            # Run a few trainig iterations
-            steps_per_train_it = self.num_envs * self.policy_delay
-            num_train_its = np.ceil(self.eval_freq / steps_per_train_it).astype(int)
-            ts = jax.lax.fori_loop(
-                0,
-                num_train_its,
-                lambda _, ts: self.train_iteration(ts),
-                ts,
-            )
-
-            # Run evaluation
-            return ts, self.eval_callback(self, ts, ts.rng)
+    def steps_per_train_iteration(self):
+        return self.num_envs * self.policy_delay
 
-        ts, evaluation = jax.lax.scan(
-            eval_iteration,
-            ts,
-            None,
-            np.ceil(self.total_timesteps / self.eval_freq).astype(int),
-        )
-
-        if not self.skip_initial_evaluation:
-            evaluation = jax.tree_map(
-                lambda i, ev: jnp.concatenate((jnp.expand_dims(i, 0), ev)),
-                initial_evaluation,
-                evaluation,
-            )
+    @property
+    def gradient_steps_per_train_iteration(self):
+        # `policy_delay` critic updates and one policy update per epoch
+        return self.num_epochs * (self.policy_delay + 1)
 
-        return ts, evaluation
+    @property
+    def metric_names(self):
+        return ("critic_loss", "actor_loss", "q_value")
 
     def train_iteration(self, ts):
         old_global_step = ts.global_step
         placeholder_minibatch = jax.tree_map(
             lambda sdstr: jnp.empty((self.num_epochs, *sdstr.shape), sdstr.dtype),
-            ts.replay_buffer.sample(self.batch_size, jax.random.PRNGKey(0)),
+            jax.eval_shape(
+                partial(ts.replay_buffer.sample, self.batch_size),
+                jax.random.PRNGKey(0),
+            ),
         )
         ts, minibatch = jax.lax.fori_loop(
             0,
@@ -160,30 +142,29 @@ class TD3(
 
         # Collect transition
         uniform = jnp.logical_not(start_training)
-        ts, transitions = self.collect_transitions(ts, uniform=uniform)
-        ts = ts.replace(replay_buffer=ts.replay_buffer.extend(transitions))
-
-        def update_iteration(ts, unused):
-            # Sample minibatch
-            rng, rng_sample = jax.random.split(ts.rng)
-            ts = ts.replace(rng=rng)
-            minibatch = ts.replay_buffer.sample(self.batch_size, rng_sample)
-            if self.normalize_observations:
-                minibatch = minibatch._replace(
-                    obs=self.normalize_obs(ts.rms_state, minibatch.obs),
-                    next_obs=self.normalize_obs(ts.rms_state, minibatch.next_obs),
-                )
+        ts, transitions = phase(
+            "collect", self.collect_transitions, ts, uniform=uniform
+        )
+        replay_buffer = phase("extend", ts.replay_buffer.extend, transitions)
+        ts = ts.replace(replay_buffer=replay_buffer)
 
-            # Update network
-            ts = self.update_critic(ts, minibatch)
-            return ts, minibatch
+        def update_iteration(ts, xs):
+            minibatch, index, weight = xs
+            ts, td_error = self.update_critic(ts, minibatch, weight)
+            ts = self.update_priorities(ts, index, td_error)
+            return ts, None
 
         def do_updates(ts):
-            return jax.lax.scan(update_iteration, ts, None, self.num_epochs)
+            rng, rng_sample = jax.random.split(ts.rng)
+            ts = ts.replace(rng=rng)
+            return self.sample_and_update(ts, rng_sample, update_iteration)
 
         placeholder_minibatch = jax.tree_map(
             lambda sdstr: jnp.empty((self.num_epochs, *sdstr.shape), sdstr.dtype),
-            ts.replay_buffer.sample(self.batch_size, jax.random.PRNGKey(0)),
+            jax.eval_shape(
+                partial(ts.replay_buffer.sample, self.batch_size),
+                jax.random.PRNGKey(0),
+            ),
         )
         ts, minibatches = jax.lax.cond(
             start_training,
@@ -195,7 +176,9 @@ class TD3(
 
     def train_policy(self, ts, minibatches, old_global_step):
         def do_updates(ts):
-            ts, _ = jax.lax.scan(
+            ts, _ = phase(
+                "update",
+                jax.lax.scan,
                 lambda ts, minibatch: (self.update_actor(ts, minibatch), None),
                 ts,
                 minibatches,
@@ -255,7 +238,7 @@ class TD3(
         ts = ts.replace(rng=rng)
         rng_steps = jax.random.split(rng_steps, self.num_envs)
         next_obs, env_state, rewards, dones, _ = self.vmap_step(
-            rng_steps, ts.env_state, actions, self.env_params
+            rng_steps, ts.env_state, actions, self.train_env_params(ts)
         )
 
         if self.normalize_observations:
@@ -274,9 +257,10 @@ class TD3(
             env_state=env_state,
             global_step=ts.global_step + self.num_envs,
         )
+        ts = self.resample_env_params(ts, dones)
         return ts, minibatch
 
-    def update_critic(self, ts, minibatch):
+    def update_critic(self, ts, minibatch, weight=1.0):
         def critic_loss_fn(params):
             action = self.actor.apply(ts.actor_target_params, minibatch.next_obs)
             noise = jnp.clip(
@@ -287,27 +271,29 @@ class TD3(
             action_low, action_high = self.action_space.low, self.action_space.high
             action = jnp.clip(action + noise, action_low, action_high)
 
-            qs_target = self.vmap_critic(
-                ts.critic_target_params, minibatch.next_obs, action
+            q_target = self.critic.apply(
+                ts.critic_target_params, minibatch.next_obs, action, method="min"
             )
-            q_target = jnp.min(qs_target, axis=0)
             target = minibatch.reward + (1 - minibatch.done) * self.gamma * q_target
-            q1, q2 = self.vmap_critic(params, minibatch.obs, minibatch.action)
+            qs = self.critic.apply(params, minibatch.obs, minibatch.action)
 
-            loss_q1 = optax.l2_loss(q1, target).mean()
-            loss_q2 = optax.l2_loss(q2, target).mean()
-            return loss_q1 + loss_q2
+            losses = jax.vmap(lambda q: (weight * optax.l2_loss(q, target)).mean())(qs)
+            td_error = jnp.abs(target - qs).mean(axis=0)
+            return losses.sum(), (td_error, qs[0])
 
-        grads = jax.grad(critic_loss_fn)(ts.critic_ts.params)
+        (loss, (td_error, q1)), grads = jax.value_and_grad(
+            critic_loss_fn, has_aux=True
+        )(ts.critic_ts.params)
         ts = ts.replace(critic_ts=ts.critic_ts.apply_gradients(grads=grads))
-        return ts
+        ts = self.log_metrics(ts, {"critic_loss": loss, "q_value": q1})
+        return ts, td_error
 
     def update_actor(self, ts, minibatch):
         def actor_loss_fn(params):
             action = self.actor.apply(params, minibatch.obs)
-            q = self.vmap_critic(ts.critic_ts.params, minibatch.obs, action)
+            q = self.critic.apply(ts.critic_ts.params, minibatch.obs, action)
             return -q.mean()
 
-        grads = jax.grad(actor_loss_fn)(ts.actor_ts.params)
+        loss, grads = jax.value_and_grad(actor_loss_fn)(ts.actor_ts.params)
         ts = ts.replace(actor_ts=ts.actor_ts.apply_gradients(grads=grads))
-        return ts
+        return self.log_metrics(ts, {"actor_loss": loss})
@@ -0,0 +1,167 @@
+import multiprocessing
+import threading
+from dataclasses import fields
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing.shared_memory import SharedMemory
+from types import SimpleNamespace
+from typing import Any, Tuple
+
+import jax
+import numpy as np
+from jax import numpy as jnp
+
+_worker = {}
+
+
+def _import_cloudpickle():
+    try:
+        import cloudpickle
+    except ImportError as e:
+        raise ImportError(
+            "AsyncEvaluator requires cloudpickle, install it with "
+            "`pip install cloudpickle`"
+        ) from e
+    return cloudpickle
+
+
+def _snapshot(ts):
+    # Evaluation only needs the policy, i.e. the parameters of the networks, and the
+    # observation normalization, e.g. not the replay buffer or optimizer states
+    snapshot = {"rng": ts.rng}
+    for field in fields(ts):
+        value = getattr(ts, field.name)
+        if field.name.endswith("_ts"):
+            snapshot[field.name] = value.replace(opt_state=None)
+        elif field.name == "rms_state":
+            snapshot[field.name] = value
+    return snapshot
+
+
+def _init_worker(payload: bytes):
+    algo = _import_cloudpickle().loads(payload)
+
+    def evaluate(snapshot):
+        ts = SimpleNamespace(**snapshot)
+        return algo.eval_callback(algo, ts, ts.rng)
+
+    _worker["evaluate"] = jax.jit(evaluate)
+
+
+def _evaluate(
+    name: str,
+    layout: Tuple[Tuple[int, Tuple[int, ...], str], ...],
+    treedef: bytes,
+):
+    shm = SharedMemory(name=name)
+    try:
+        leaves = [
+            np.ndarray(shape, dtype, buffer=shm.buf, offset=offset).copy()
+            for offset, shape, dtype in layout
+        ]
+    finally:
+        shm.close()
+
+    # The snapshot contains train states, whose classes the workers cannot import
+    treedef = _import_cloudpickle().loads(treedef)
+    snapshot = jax.tree_util.tree_unflatten(treedef, leaves)
+    return jax.device_get(_worker["evaluate"](snapshot))
+
+
+class AsyncEvaluator:
+    """
+    Evaluates snapshots of the train state in a pool of worker processes, so that
+    training does not wait for evaluation, e.g.
+
+        evaluator = AsyncEvaluator(algo, num_workers=2)
+        ts, _ = jax.jit(evaluator.wrap(algo).train)(rng)
+        global_steps, evaluation = evaluator.join()
+
+    At every evaluation, the parameters of the networks and the observation
+    normalization state are copied to shared memory by a host callback, and
+    evaluated with the original `eval_callback` by a worker. The algorithm is sent
+    to the workers once with `cloudpickle`, which has to be installed. Workers are
+    started with `spawn`, so scripts using this class need an
+    `if __name__ == "__main__"` guard. The `training_episodes` evaluation mode
+    reads the training environments and is not supported.
+    """
+
+    def __init__(self, algo, num_workers: int = 1):
+        if algo.eval_mode == "training_episodes":
+            raise ValueError(
+                "The training_episodes evaluation mode cannot be run asynchronously"
+            )
+
+        cloudpickle = _import_cloudpickle()
+        ctx = multiprocessing.get_context("spawn")
+        self._pool = ProcessPoolExecutor(
+            num_workers,
+            mp_context=ctx,
+            initializer=_init_worker,
+            initargs=(cloudpickle.dumps(algo),),
+        )
+        self._lock = threading.Lock()
+        self._pending = []
+
+    def wrap(self, algo):
+        """Returns `algo` with an `eval_callback` that hands the train state to the
+        workers and only returns the global step it belongs to.
+        """
+        return algo.replace(eval_callback=self.eval_callback)
+
+    def eval_callback(self, algo, ts, rng):
+        jax.debug.callback(self.submit, ts.global_step, _snapshot(ts))
+        return ts.global_step
+
+    def submit(self, global_step: Any, snapshot: Any):
+        leaves, treedef = jax.tree_util.tree_flatten(snapshot)
+        leaves = [np.asarray(x) for x in leaves]
+        layout, offset = [], 0
+        for x in leaves:
+            offset = -(-offset // x.dtype.alignment) * x.dtype.alignment
+            layout.append((offset, x.shape, x.dtype.str))
+            offset += x.nbytes
+
+        shm = SharedMemory(create=True, size=max(offset, 1))
+        for x, (offset, shape, dtype) in zip(leaves, layout):
+            np.ndarray(shape, dtype, buffer=shm.buf, offset=offset)[...] = x
+
+        treedef = _import_cloudpickle().dumps(treedef)
+        future = self._pool.submit(_evaluate, shm.name, tuple(layout), treedef)
+        with self._lock:
+            self._pending.append((int(global_step), future, shm))
+
+    def join(self) -> Tuple[jnp.ndarray, Any]:
+        """Waits for all submitted evaluations and returns their global steps and
+        results, stacked along the first axis and sorted by global step.
+        """
+        with self._lock:
+            pending, self._pending = self._pending, []
+
+        results = []
+        for global_step, future, shm in pending:
+            try:
+                results.append((global_step, future.result()))
+            finally:
+                shm.close()
+                shm.unlink()
+
+        if not results:
+            return jnp.zeros(0, dtype=int), None
+        results.sort(key=lambda r: r[0])
+        global_steps = jnp.array([r[0] for r in results])
+        evaluation = jax.tree_map(lambda *x: jnp.stack(x), *[r[1] for r in results])
+        return global_steps, evaluation
+
+    def close(self):
+        self.join()
+        self._pool.shutdown()
+
+    def __deepcopy__(self, memo):
+        # Copies of the algorithm, e.g. in `Algorithm.config`, share the worker pool
+        return self
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
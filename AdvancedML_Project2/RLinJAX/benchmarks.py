@@ -0,0 +1,290 @@
+"""
+Throughput benchmarks of the algorithms in RLinJAX. Run e.g.
+
+    python -m RLinJAX.benchmarks --algos dqn ppo --baseline baseline.json
+
+to benchmark every combination of algorithm, environment and number of parallel
+environments, and to flag regressions with respect to a previously stored result.
+
+Data-parallel scaling of the on-policy algorithms is benchmarked with e.g.
+`--num-devices 1 2 4 8`. On CPU, the host is split into multiple devices by setting
+`XLA_FLAGS=--xla_force_host_platform_device_count=8` before running the benchmarks.
+"""
+
+import argparse
+import json
+import statistics
+import sys
+import time
+from typing import Dict, Iterable, List, NamedTuple, Optional
+
+import gymnax
+import jax
+
+from RLinJAX import get_algo
+from RLinJAX.compat import create
+
+ALGOS = ("dqn", "iqn", "ppo", "pqn", "sac", "td3")
+ENVS = ("CartPole-v1", "Pendulum-v1")
+NUM_ENVS = (1, 16)
+
+_discrete_only = {"dqn", "iqn", "pqn"}
+_continuous_only = {"td3"}
+_data_parallel = {"ppo", "pqn"}
+
+# Metrics where larger values are better, all others are better when smaller
+_higher_is_better = {"steps_per_second", "gradient_steps_per_second"}
+
+
+class BenchmarkResult(NamedTuple):
+    algo: str
+    env: str
+    num_envs: int
+    total_timesteps: int
+    compile_time: float
+    run_time: float
+    steps_per_second: float
+    gradient_steps_per_second: float
+    peak_memory: Optional[int]
+    dtype: str = "float32"
+    num_devices: int = 1
+
+    @property
+    def key(self):
+        # Excludes the dtype, so that mixed precision can be compared to a float32
+        # baseline
+        return (self.algo, self.env, self.num_envs, self.num_devices)
+
+
+def supports(algo_name: str, env: str, num_devices: int = 1) -> bool:
+    if num_devices > 1 and algo_name not in _data_parallel:
+        return False
+    env, env_params = create(env)
+    action_space = env.action_space(env_params)
+    discrete = isinstance(action_space, gymnax.environments.spaces.Discrete)
+    if discrete:
+        return algo_name not in _continuous_only
+    return algo_name not in _discrete_only
+
+
+def num_gradient_steps(algo) -> int:
+    """Number of gradient steps taken by `algo.train`. Algorithms with a replay
+    buffer only start training once it contains `fill_buffer` transitions.
+    """
+    num_iterations = algo.num_evals * algo.train_iterations_per_eval
+    steps = algo.steps_per_train_iteration
+    fill_buffer = getattr(algo, "fill_buffer", -1)
+    training = sum(1 for i in range(num_iterations) if i * steps > fill_buffer)
+    return training * algo.gradient_steps_per_train_iteration
+
+
+def peak_memory(compiled) -> Optional[int]:
+    """Memory needed by the arguments, outputs and temporaries of the compiled train
+    function. The peak reported by the device is not used, since it is a high-water
+    mark of the whole process and would include all previous benchmarks.
+    """
+    try:
+        analysis = compiled.executable.memory_analysis()
+    except Exception:
+        return None
+    if analysis is None:
+        return None
+    return int(
+        analysis.argument_size_in_bytes
+        + analysis.output_size_in_bytes
+        + analysis.temp_size_in_bytes
+        - analysis.alias_size_in_bytes
+    )
+
+
+def benchmark(
+    algo_name: str,
+    env: str,
+    num_envs: int,
+    total_timesteps: int = 65_536,
+    num_repeats: int = 3,
+    seed: int = 0,
+    cache_dir: Optional[str] = None,
+    dtype: str = "float32",
+    num_devices: int = 1,
+    **config,
+) -> BenchmarkResult:
+    """Compiles and runs `train` of one configuration. Training is evaluated only
+    once, at the end, and the run time is the median over `num_repeats` runs after
+    a warm-up run. The networks compute in `dtype`, their parameters are float32.
+    The environments are split across `num_devices` devices if it is larger than one.
+    """
+    if num_devices > 1:
+        config["num_devices"] = num_devices
+    algo = get_algo(algo_name).create(
+        env=env,
+        num_envs=num_envs,
+        total_timesteps=total_timesteps,
+        eval_freq=total_timesteps,
+        skip_initial_evaluation=True,
+        dtype=dtype,
+        **config,
+    )
+    compiled = algo.compile(cache_dir=cache_dir)
+
+    rng = jax.random.PRNGKey(seed)
+    jax.block_until_ready(compiled(algo, rng))
+
+    run_times = []
+    for _ in range(num_repeats):
+        rng, rng_run = jax.random.split(rng)
+        start = time.perf_counter()
+        jax.block_until_ready(compiled(algo, rng_run))
+        run_times.append(time.perf_counter() - start)
+    run_time = statistics.median(run_times)
+
+    num_steps = algo.num_evals * algo.steps_per_eval
+    return BenchmarkResult(
+        algo=algo_name,
+        env=env,
+        num_envs=num_envs,
+        total_timesteps=int(num_steps),
+        compile_time=compiled.compile_time,
+        run_time=run_time,
+        steps_per_second=num_steps / run_time,
+        gradient_steps_per_second=num_gradient_steps(algo) / run_time,
+        peak_memory=peak_memory(compiled),
+        dtype=dtype,
+        num_devices=num_devices,
+    )
+
+
+def run_benchmarks(
+    algos: Iterable[str] = ALGOS,
+    envs: Iterable[str] = ENVS,
+    num_envs: Iterable[int] = NUM_ENVS,
+    num_devices: Iterable[int] = (1,),
+    verbose: bool = True,
+    **kwargs,
+) -> List[BenchmarkResult]:
+    """Benchmarks every supported combination of algorithm, environment, number
+    of parallel environments and number of devices. Keyword arguments are passed to
+    `benchmark`.
+    """
+    configs = [
+        (algo_name, env, n, d)
+        for algo_name in algos
+        for env in envs
+        for n in num_envs
+        for d in num_devices
+        if supports(algo_name, env, d) and n % d == 0
+    ]
+
+    results = []
+    for algo_name, env, n, d in configs:
+        result = benchmark(algo_name, env, n, num_devices=d, **kwargs)
+        if verbose:
+            print(
+                f"{algo_name:>4} {env:<20} num_envs={n:<5} devices={d:<3} "
+                f"compile {result.compile_time:7.2f}s  "
+                f"{result.steps_per_second:12.0f} steps/s  "
+                f"{result.gradient_steps_per_second:10.0f} grad steps/s  "
+                f"{(result.peak_memory or 0) / 2**20:8.1f} MiB"
+            )
+        results.append(result)
+    return results
+
+
+def save_results(results: List[BenchmarkResult], path: str):
+    device = jax.devices()[0]
+    data = {
+        "jax_version": jax.__version__,
+        "device": f"{device.platform}:{device.device_kind}",
+        "results": [r._asdict() for r in results],
+    }
+    with open(path, "w") as f:
+        json.dump(data, f, indent=2)
+
+
+def load_results(path: str) -> List[BenchmarkResult]:
+    with open(path) as f:
+        data = json.load(f)
+    return [BenchmarkResult(**r) for r in data["results"]]
+
+
+def compare(
+    results: List[BenchmarkResult],
+    baseline: List[BenchmarkResult],
+    tolerance: float = 0.1,
+    metrics: Iterable[str] = ("steps_per_second", "gradient_steps_per_second"),
+) -> List[Dict]:
+    """Returns the metrics of `results` that are more than `tolerance` (relative)
+    worse than those of the matching configuration in `baseline`.
+    """
+    baseline = {b.key: b for b in baseline}
+    regressions = []
+    for result in results:
+        if result.key not in baseline:
+            continue
+        for metric in metrics:
+            value = getattr(result, metric)
+            reference = getattr(baseline[result.key], metric)
+            if value is None or reference is None or reference == 0:
+                continue
+            change = value / reference - 1
+            if metric not in _higher_is_better:
+                change = -change
+            if change < -tolerance:
+                regressions.append(
+                    {
+                        "algo": result.algo,
+                        "env": result.env,
+                        "num_envs": result.num_envs,
+                        "num_devices": result.num_devices,
+                        "metric": metric,
+                        "value": value,
+                        "baseline": reference,
+                        "change": change,
+                    }
+                )
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--algos", nargs="+", default=ALGOS)
+    parser.add_argument("--envs", nargs="+", default=ENVS)
+    parser.add_argument("--num-envs", nargs="+", type=int, default=NUM_ENVS)
+    parser.add_argument("--num-devices", nargs="+", type=int, default=[1])
+    parser.add_argument("--total-timesteps", type=int, default=65_536)
+    parser.add_argument("--num-repeats", type=int, default=3)
+    parser.add_argument("--cache-dir", default=None)
+    parser.add_argument("--dtype", default="float32", help="e.g. bfloat16")
+    parser.add_argument("--output", default="benchmark_results.json")
+    parser.add_argument("--baseline", default=None)
+    parser.add_argument("--tolerance", type=float, default=0.1)
+    args = parser.parse_args(argv)
+
+    results = run_benchmarks(
+        args.algos,
+        args.envs,
+        args.num_envs,
+        args.num_devices,
+        total_timesteps=args.total_timesteps,
+        num_repeats=args.num_repeats,
+        cache_dir=args.cache_dir,
+        dtype=args.dtype,
+    )
+    save_results(results, args.output)
+
+    if args.baseline is None:
+        return 0
+
+    regressions = compare(results, load_results(args.baseline), args.tolerance)
+    for r in regressions:
+        print(
+            f"REGRESSION {r['algo']} {r['env']} num_envs={r['num_envs']} "
+            f"devices={r['num_devices']}: "
+            f"{r['metric']} {r['value']:.1f} vs. {r['baseline']:.1f} "
+            f"({r['change']:+.1%})"
+        )
+    return 1 if regressions else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,11 +1,16 @@
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
 from functools import partial
-from typing import NamedTuple, Union
+from typing import Any, NamedTuple, Optional, Union
 
 import chex
 import jax
+import numpy as np
 from flax import struct
 from gymnax.environments import spaces
 from jax import numpy as jnp
+from jax.experimental import io_callback
 
 
 class CircularBuffer(struct.PyTreeNode):
@@ -22,6 +27,37 @@ class CircularBuffer(struct.PyTreeNode):
     def num_entries(self):
         return jnp.where(self.full, self.size, self.index)
 
+    def window_index(
+        self, index: chex.Array, length: int, stride: int = 1
+    ) -> chex.Array:
+        """Returns the indices of the windows of `length` entries starting at `index`,
+        taking every `stride`-th entry. The window axis is appended to `index`.
+        """
+        return (index[..., None] + stride * jnp.arange(length)) % self.size
+
+    @partial(jax.jit, static_argnames=("num", "length", "stride"))
+    def sample_window_index(
+        self, num: int, rng: chex.PRNGKey, length: int, stride: int = 1
+    ) -> chex.Array:
+        """Samples the start indices of `num` windows uniformly at random, such that
+        all entries of the windows have been written.
+        """
+        oldest = jnp.where(self.full, self.index, 0)
+        num_valid = jnp.maximum(self.num_entries - (length - 1) * stride, 1)
+        offset = jax.random.randint(rng, (num,), 0, num_valid)
+        return (oldest + offset) % self.size
+
+    def clip_window_index(
+        self, index: chex.Array, length: int, stride: int = 1
+    ) -> chex.Array:
+        """Moves window starts that would reach past the most recent entry back to
+        the last start whose window has been fully written.
+        """
+        oldest = jnp.where(self.full, self.index, 0)
+        num_valid = jnp.maximum(self.num_entries - (length - 1) * stride, 1)
+        offset = jnp.minimum((index - oldest) % self.size, num_valid - 1)
+        return (oldest + offset) % self.size
+
     @jax.jit
     def append(self, a: chex.ArrayTree) -> "CircularBuffer":
         data = jax.tree_map(lambda arr, a_: arr.at[self.index].set(a_), self.data, a)
@@ -42,6 +78,98 @@ class CircularBuffer(struct.PyTreeNode):
         full = jnp.logical_or(self.full, next_index == 0)
         return self.replace(data=data, index=next_index, full=full)
 
+    @partial(jax.jit, donate_argnums=0)
+    def append_in_place(self, a: chex.ArrayTree) -> "CircularBuffer":
+        """Same as `append`, but donates the buffer, so that `a` is written into its
+        arrays instead of a copy of them. The buffer must not be used afterwards.
+        """
+        return self.append(a)
+
+    @partial(jax.jit, donate_argnums=0)
+    def extend_in_place(self, batch: chex.ArrayTree) -> "CircularBuffer":
+        """Same as `extend`, but donates the buffer, see `append_in_place`."""
+        return self.extend(batch)
+
+
+def _expand_to(mask, x):
+    return mask.reshape(mask.shape + (1,) * (x.ndim - mask.ndim))
+
+
+class Codec(struct.PyTreeNode):
+    """Stores arrays of type `dtype` as `storage_dtype`."""
+
+    dtype: Any = struct.field(pytree_node=False)
+    storage_dtype: Any = struct.field(pytree_node=False)
+
+    def encode(self, x: chex.Array) -> chex.Array:
+        return x.astype(self.storage_dtype)
+
+    def decode(self, x: chex.Array) -> chex.Array:
+        return x.astype(self.dtype)
+
+
+class QuantizedCodec(Codec):
+    """Stores floating point arrays with values in a known range as integers, by
+    mapping the range linearly onto all values representable by `storage_dtype`.
+    """
+
+    scale: chex.Array
+    offset: chex.Array
+
+    def encode(self, x: chex.Array) -> chex.Array:
+        info = jnp.iinfo(self.storage_dtype)
+        x = jnp.round((x - self.offset) / self.scale)
+        return jnp.clip(x, info.min, info.max).astype(self.storage_dtype)
+
+    def decode(self, x: chex.Array) -> chex.Array:
+        return (x.astype(jnp.float32) * self.scale + self.offset).astype(self.dtype)
+
+
+def make_codec(storage_dtype, space=None) -> Optional[Codec]:
+    """Returns a codec storing values from `space` as `storage_dtype`. Floating point
+    values are quantized when stored as integers, which requires a bounded `Box`
+    space. If `space` is None, the values are assumed to be float32 scalars.
+    """
+    if storage_dtype is None:
+        return None
+
+    storage_dtype = jnp.dtype(storage_dtype)
+    dtype = jnp.dtype(jnp.float32 if space is None else space.dtype)
+    quantize = jnp.issubdtype(storage_dtype, jnp.integer) and jnp.issubdtype(
+        dtype, jnp.floating
+    )
+    if not quantize:
+        return Codec(dtype=dtype, storage_dtype=storage_dtype)
+
+    if not isinstance(space, spaces.Box):
+        raise ValueError(f"Cannot quantize values without bounds to {storage_dtype}")
+    low = jnp.broadcast_to(jnp.asarray(space.low, dtype=jnp.float32), space.shape)
+    high = jnp.broadcast_to(jnp.asarray(space.high, dtype=jnp.float32), space.shape)
+    try:
+        bounded = bool(jnp.isfinite(low).all() and jnp.isfinite(high).all())
+    except jax.errors.ConcretizationTypeError:
+        # Bounds that depend on traced env params cannot be checked
+        bounded = True
+    if not bounded:
+        raise ValueError(
+            f"Cannot quantize values of an unbounded space to {storage_dtype}"
+        )
+
+    info = jnp.iinfo(storage_dtype)
+    scale = (high - low) / (float(info.max) - float(info.min))
+    scale = jnp.where(scale > 0, scale, 1.0)
+    offset = low - info.min * scale
+    return QuantizedCodec(
+        dtype=dtype,
+        storage_dtype=storage_dtype,
+        scale=scale,
+        offset=offset,
+    )
+
+
+def _storage_dtype(codec, dtype):
+    return dtype if codec is None else codec.storage_dtype
+
 
 class Minibatch(NamedTuple):
     obs: chex.Array
@@ -51,13 +179,53 @@ class Minibatch(NamedTuple):
     next_obs: chex.Array
 
 
+def n_step_transitions(windows: Minibatch, gamma: chex.Scalar) -> Minibatch:
+    """Reduces windows of consecutive transitions to n-step transitions. The window
+    axis is the last axis of `windows.reward`. Rewards after the end of an episode are
+    masked out and `done` is set if the episode ends anywhere within the window, so
+    that the n-step target is `reward + (1 - done) * gamma ** n * Q(next_obs)`.
+    """
+    axis = windows.reward.ndim - 1
+    n = windows.reward.shape[axis]
+
+    not_done = 1 - windows.done.astype(jnp.float32)
+    alive = jnp.concatenate(
+        [jnp.ones_like(not_done[..., :1]), jnp.cumprod(not_done, axis=axis)[..., :-1]],
+        axis=axis,
+    )
+    discount = gamma ** jnp.arange(n)
+    return Minibatch(
+        obs=jnp.take(windows.obs, 0, axis=axis),
+        action=jnp.take(windows.action, 0, axis=axis),
+        reward=(windows.reward * alive * discount).sum(axis=axis),
+        done=windows.done.any(axis=axis),
+        next_obs=jnp.take(windows.next_obs, n - 1, axis=axis),
+    )
+
+
 class ReplayBuffer(CircularBuffer):
     """
     Circular buffer for storing transitions. Implements appending and sampling
     while being `jit`-able.
+
+    If `num_lanes` is set, the buffer uses a compact layout that stores every
+    observation only once. It expects each call to `extend` to add one transition per
+    environment lane, so that the next observation of the transition at index `i` is
+    the observation at index `i + num_lanes`. Only the next observations of the most
+    recently added transitions are kept separately in `last_next_obs`. Since the
+    environments reset automatically, the terminal observation of an episode is not
+    stored; transitions with `done` return their own observation as `next_obs`
+    instead, which is never bootstrapped from.
+
+    Observations and rewards can be stored in a lower precision by passing a `Codec`.
+    Transitions are encoded in `extend` and decoded right after the gather in
+    `sample`, so that XLA can fuse both.
     """
 
     data: Minibatch
+    num_lanes: Optional[int] = struct.field(pytree_node=False, default=None)
+    last_next_obs: Optional[chex.Array] = None
+    codecs: Optional[Minibatch] = None
 
     @classmethod
     def empty(
@@ -65,6 +233,9 @@ class ReplayBuffer(CircularBuffer):
         size: int,
         obs_space: Union[spaces.Discrete, spaces.Box],
         action_space: Union[spaces.Discrete, spaces.Box],
+        num_lanes: Optional[int] = None,
+        obs_codec: Optional[Codec] = None,
+        reward_codec: Optional[Codec] = None,
     ) -> "ReplayBuffer":
         """Returns an empty replay buffer with the given size and shapes.
 
@@ -72,19 +243,86 @@ class ReplayBuffer(CircularBuffer):
             size (int): Maximum number of transitions to store.
             obs_shape (chex.Shape): Shape of the observations.
             action_shape (chex.Shape): Shape of the actions.
+            num_lanes (Optional[int]): Number of environment lanes added per call to
+            `extend`. If given, the buffer uses the compact layout and `size` is
+            rounded down to a multiple of `num_lanes`.
+            obs_codec (Optional[Codec]): Codec for storing observations.
+            reward_codec (Optional[Codec]): Codec for storing rewards.
 
         Returns:
             ReplayBuffer: The initialized replay buffer.
         """
+        obs_dtype = _storage_dtype(obs_codec, obs_space.dtype)
+        reward_dtype = _storage_dtype(reward_codec, jnp.float32)
+        if num_lanes is None:
+            next_obs = jnp.empty((size, *obs_space.shape)).astype(obs_dtype)
+            last_next_obs = None
+        else:
+            size = max(size // num_lanes, 1) * num_lanes
+            next_obs = None
+            last_next_obs = jnp.zeros((num_lanes, *obs_space.shape), obs_dtype)
+
+        if obs_codec is None and reward_codec is None:
+            codecs = None
+        else:
+            codecs = Minibatch(obs_codec, None, reward_codec, None, obs_codec)
+
         # Skip checking sizes as we know they are correct here
         data = Minibatch(
-            obs=jnp.empty((size, *obs_space.shape)).astype(obs_space.dtype),
+            obs=jnp.empty((size, *obs_space.shape)).astype(obs_dtype),
             action=jnp.empty((size, *action_space.shape)).astype(action_space.dtype),
-            reward=jnp.empty(size),
+            reward=jnp.empty(size).astype(reward_dtype),
             done=jnp.empty(size).astype(bool),
-            next_obs=jnp.empty((size, *obs_space.shape)).astype(obs_space.dtype),
+            next_obs=next_obs,
+        )
+        return cls(
+            size=size,
+            data=data,
+            index=0,
+            full=False,
+            num_lanes=num_lanes,
+            last_next_obs=last_next_obs,
+            codecs=codecs,
         )
-        return cls(size=size, data=data, index=0, full=False)
+
+    @property
+    def compact(self):
+        return self.num_lanes is not None
+
+    def encode(self, batch: Minibatch) -> Minibatch:
+        if self.codecs is None:
+            return batch
+        return Minibatch(
+            *(
+                x if codec is None or x is None else codec.encode(x)
+                for codec, x in zip(self.codecs, batch)
+            )
+        )
+
+    def decode(self, batch: Minibatch) -> Minibatch:
+        if self.codecs is None:
+            return batch
+        return Minibatch(
+            *(
+                x if codec is None or x is None else codec.decode(x)
+                for codec, x in zip(self.codecs, batch)
+            )
+        )
+
+    @jax.jit
+    def append(self, a: Minibatch) -> "ReplayBuffer":
+        if self.compact:
+            raise ValueError("Compact replay buffers only support `extend`")
+        return super().append(self.encode(a))
+
+    @jax.jit
+    def extend(self, batch: Minibatch) -> "ReplayBuffer":
+        batch = self.encode(batch)
+        if not self.compact:
+            return super().extend(batch)
+
+        buf = super().extend(batch._replace(next_obs=None))
+        return buf.replace(last_next_obs=batch.next_obs)
 
     def __getattr__(self, name):
         if name in self.data._fields:
@@ -103,5 +341,356 @@ class ReplayBuffer(CircularBuffer):
         Returns:
             Minibatch: A minibatch of randomly sampled transitions.
         """
-        minibatch_index = jax.random.randint(rng, (num,), 0, self.num_entries)
-        return jax.tree_map(lambda arr: arr[minibatch_index], self.data)
+        return self.gather(self.sample_index(num, rng))
+
+    @partial(jax.jit, static_argnames=("num_batches", "batch_size"))
+    def sample_many(
+        self, num_batches: int, batch_size: int, rng: chex.PRNGKey
+    ) -> Minibatch:
+        """Samples `num_batches` minibatches at once. The indices of all minibatches are
+        drawn in one pass and each field is gathered only once, which is cheaper than
+        calling `sample` repeatedly.
+
+        Args:
+            num_batches (int): The number of minibatches to sample.
+            batch_size (int): The size of each minibatch.
+            rng (chex.PRNGKey): The random number generator key.
+
+        Returns:
+            Minibatch: Minibatches stacked along the leading axis, i.e. each field has
+            shape `(num_batches, batch_size, ...)`.
+        """
+        rngs = jax.random.split(rng, num_batches)
+        index = jax.vmap(lambda rng: self.sample_index(batch_size, rng))(rngs)
+        return self.gather(index)
+
+    @partial(jax.jit, static_argnames=("num"))
+    def sample_index(self, num: int, rng: chex.PRNGKey) -> chex.Array:
+        """Samples `num` indices of stored transitions uniformly at random."""
+        return jax.random.randint(rng, (num,), 0, self.num_entries)
+
+    def gather(self, index: chex.Array) -> Minibatch:
+        """Returns the transitions stored at `index`."""
+        minibatch = jax.tree_map(lambda arr: arr[index], self.data)
+        if not self.compact:
+            return self.decode(minibatch)
+
+        # The successor of the most recent transitions has not been stored yet
+        is_last = (self.index - index - 1) % self.size < self.num_lanes
+        next_index = (index + self.num_lanes) % self.size
+        next_obs = jnp.where(
+            _expand_to(is_last, minibatch.obs),
+            self.last_next_obs[index % self.num_lanes],
+            self.data.obs[next_index],
+        )
+        next_obs = jnp.where(
+            _expand_to(minibatch.done, next_obs), minibatch.obs, next_obs
+        )
+        return self.decode(minibatch._replace(next_obs=next_obs))
+
+
+class SumTree(struct.PyTreeNode):
+    """
+    Array-backed binary sum tree. Node `i` holds the sum of nodes `2i` and `2i + 1`,
+    the root is node 1 and the leaves are stored in `nodes[capacity:]`. Both updates
+    and prefix-sum searches are batched and take O(log N) steps, so they can be used
+    inside `jit` and `scan`.
+    """
+
+    capacity: int = struct.field(pytree_node=False)
+    nodes: chex.Array
+
+    @classmethod
+    def empty(cls, size: int) -> "SumTree":
+        capacity = 1 << max(size - 1, 0).bit_length()
+        return cls(capacity=capacity, nodes=jnp.zeros(2 * capacity))
+
+    @property
+    def depth(self):
+        return self.capacity.bit_length() - 1
+
+    @property
+    def total(self):
+        return self.nodes[1]
+
+    def get(self, index: chex.Array) -> chex.Array:
+        return self.nodes[index + self.capacity]
+
+    def set(self, index: chex.Array, values: chex.Array) -> "SumTree":
+        """Sets the leaves at `index` to `values` and recomputes their ancestors."""
+        node = index + self.capacity
+        nodes = self.nodes.at[node].set(values)
+        for _ in range(self.depth):
+            node = node // 2
+            nodes = nodes.at[node].set(nodes[2 * node] + nodes[2 * node + 1])
+        return self.replace(nodes=nodes)
+
+    def find(self, values: chex.Array) -> chex.Array:
+        """Returns the leaf indices at which the prefix sums first exceed `values`."""
+
+        def descend(_, node_and_value):
+            node, value = node_and_value
+            left = self.nodes[2 * node]
+            go_right = value >= left
+            value = jnp.where(go_right, value - left, value)
+            return 2 * node + go_right, value
+
+        node = jnp.ones(values.shape, dtype=int)
+        node, _ = jax.lax.fori_loop(0, self.depth, descend, (node, values))
+        return node - self.capacity
+
+
+class PrioritizedReplayBuffer(ReplayBuffer):
+    """
+    Replay buffer that samples transitions proportionally to their priority. The
+    priorities are stored in a `SumTree` and new transitions are inserted with the
+    highest priority seen so far, so that every transition is sampled at least once
+    with high probability.
+    """
+
+    priorities: SumTree = None
+    max_priority: float = None
+
+    @classmethod
+    def empty(
+        cls,
+        size: int,
+        obs_space: Union[spaces.Discrete, spaces.Box],
+        action_space: Union[spaces.Discrete, spaces.Box],
+        num_lanes: Optional[int] = None,
+        obs_codec: Optional[Codec] = None,
+        reward_codec: Optional[Codec] = None,
+    ) -> "PrioritizedReplayBuffer":
+        buf = super().empty(
+            size, obs_space, action_space, num_lanes, obs_codec, reward_codec
+        )
+        return buf.replace(
+            priorities=SumTree.empty(buf.size), max_priority=jnp.array(1.0)
+        )
+
+    @jax.jit
+    def append(self, a: chex.ArrayTree) -> "PrioritizedReplayBuffer":
+        priorities = self.priorities.set(self.index, self.max_priority)
+        return super().append(a).replace(priorities=priorities)
+
+    @jax.jit
+    def extend(self, batch: chex.ArrayTree) -> "PrioritizedReplayBuffer":
+        batch_flat, _ = jax.tree_util.tree_flatten(batch)
+        batch_size = batch_flat[0].shape[0]
+
+        idx = (self.index + jnp.arange(batch_size)) % self.size
+        priorities = self.priorities.set(idx, jnp.full(batch_size, self.max_priority))
+        return super().extend(batch).replace(priorities=priorities)
+
+    @partial(jax.jit, static_argnames=("num"))
+    def sample_index(self, num: int, rng: chex.PRNGKey) -> chex.Array:
+        """Samples `num` indices proportionally to their priority. Sampling is
+        stratified, i.e. the total priority is split into `num` equally sized segments
+        and one index is drawn from each of them.
+        """
+        u = jax.random.uniform(rng, (num,))
+        values = (jnp.arange(num) + u) / num * self.priorities.total
+        index = self.priorities.find(values)
+        # Guard against rounding errors pushing the search into unused leaves
+        return jnp.minimum(index, self.num_entries - 1)
+
+    @partial(jax.jit, static_argnames=("num", "length", "stride"))
+    def sample_window_index(
+        self, num: int, rng: chex.PRNGKey, length: int, stride: int = 1
+    ) -> chex.Array:
+        """Samples window starts proportionally to their priority. Starts whose window
+        is not fully written yet are moved back to the most recent valid start.
+        """
+        index = self.sample_index(num, rng)
+        return self.clip_window_index(index, length, stride)
+
+    def importance_weights(self, index: chex.Array, beta: chex.Scalar) -> chex.Array:
+        """Importance sampling weights correcting for the non-uniform sampling of
+        `index`, normalized such that the largest weight in the minibatch is 1.
+        """
+        probs = self.priorities.get(index) / self.priorities.total
+        weights = (self.num_entries * probs) ** -beta
+        return weights / weights.max(axis=-1, keepdims=True)
+
+    @jax.jit
+    def update_priorities(
+        self, index: chex.Array, priorities: chex.Array
+    ) -> "PrioritizedReplayBuffer":
+        """Sets the priorities of the transitions at `index`."""
+        return self.replace(
+            priorities=self.priorities.set(index, priorities),
+            max_priority=jnp.maximum(self.max_priority, priorities.max()),
+        )
+
+    @partial(jax.jit, donate_argnums=0)
+    def update_priorities_in_place(
+        self, index: chex.Array, priorities: chex.Array
+    ) -> "PrioritizedReplayBuffer":
+        """Same as `update_priorities`, but donates the buffer, see
+        `append_in_place`.
+        """
+        return self.update_priorities(index, priorities)
+
+
+class HostStorage:
+    """
+    Ring of transitions kept in host memory, backed by memory-mapped files if `path`
+    is given. Minibatches are sampled on the host from the key of each call, and the
+    next minibatch is gathered by a background thread while the current one is being
+    used, so that reading from disk overlaps with the computation on the device. A
+    call therefore returns the minibatch drawn with the key of the previous call of
+    the same size, if any. Existing files with matching shapes are reopened instead
+    of overwritten, so that a checkpointed run can resume with the transitions it
+    has already collected.
+    """
+
+    def __init__(self, size, fields, path=None):
+        if path is not None:
+            os.makedirs(path, exist_ok=True)
+
+        def allocate(name, shape_dtype):
+            shape = (size, *shape_dtype.shape)
+            if path is None:
+                return np.zeros(shape, shape_dtype.dtype)
+            filename = os.path.join(path, f"{name}.npy")
+            if os.path.exists(filename):
+                # Reopen files of a previous run so that training can be resumed
+                arr = np.lib.format.open_memmap(filename, "r+")
+                if arr.shape == shape and arr.dtype == shape_dtype.dtype:
+                    return arr
+                del arr
+            return np.lib.format.open_memmap(filename, "w+", shape_dtype.dtype, shape)
+
+        self.size = size
+        self.arrays = type(fields)(
+            *(allocate(name, f) for name, f in zip(fields._fields, fields))
+        )
+        self._lock = threading.Lock()
+        self._executor = ThreadPoolExecutor(max_workers=1)
+        self._prefetched = None
+
+    def write(self, index, batch):
+        with self._lock:
+            batch_size = len(batch[0])
+            idx = (int(index) + np.arange(batch_size)) % self.size
+            for arr, b in zip(self.arrays, batch):
+                arr[idx] = np.asarray(b)
+
+    def _gather(self, idx):
+        with self._lock:
+            return type(self.arrays)(*(np.asarray(arr[idx]) for arr in self.arrays))
+
+    def sample(self, num, num_entries, key):
+        num, num_entries = int(num), int(num_entries)
+        rng = np.random.default_rng(np.asarray(key).tolist())
+
+        def sample_index():
+            return np.sort(rng.integers(0, max(num_entries, 1), num))
+
+        if self._prefetched is not None and self._prefetched[0] == num:
+            minibatch = self._prefetched[1].result()
+        else:
+            minibatch = self._gather(sample_index())
+
+        # Transitions added before the next call will not be part of the prefetched
+        # minibatch, which is only a small fraction of the buffer
+        future = self._executor.submit(self._gather, sample_index())
+        self._prefetched = (num, future)
+        return minibatch
+
+    def save(self, directory):
+        """Writes a copy of the transitions to `directory`."""
+        os.makedirs(directory, exist_ok=True)
+        with self._lock:
+            for name, arr in zip(self.arrays._fields, self.arrays):
+                np.save(os.path.join(directory, f"{name}.npy"), arr)
+
+    def load(self, directory):
+        """Replaces the transitions by the ones written to `directory` by `save`."""
+        with self._lock:
+            for name, arr in zip(self.arrays._fields, self.arrays):
+                arr[...] = np.load(os.path.join(directory, f"{name}.npy"), "r")
+            # A prefetched minibatch holds transitions from before the load
+            self._prefetched = None
+
+
+class HostReplayBuffer(ReplayBuffer):
+    """
+    Replay buffer that keeps its transitions in a `HostStorage` instead of device
+    memory, so that its size is only limited by host memory or disk space. Only the
+    write position is part of the pytree, the transitions are moved between host and
+    device via ordered `io_callback`s, which cannot be batched with `jax.vmap`.
+    Minibatches are drawn on the host, see `HostStorage`.
+    """
+
+    storage: HostStorage = struct.field(pytree_node=False, default=None)
+
+    @classmethod
+    def empty(
+        cls,
+        size: int,
+        obs_space: Union[spaces.Discrete, spaces.Box],
+        action_space: Union[spaces.Discrete, spaces.Box],
+        num_lanes: Optional[int] = None,
+        obs_codec: Optional[Codec] = None,
+        reward_codec: Optional[Codec] = None,
+        path: Optional[str] = None,
+    ) -> "HostReplayBuffer":
+        if num_lanes is not None:
+            raise ValueError("Host replay buffers do not support the compact layout")
+
+        if obs_codec is None and reward_codec is None:
+            codecs = None
+        else:
+            codecs = Minibatch(obs_codec, None, reward_codec, None, obs_codec)
+
+        def shape_dtype(shape, dtype):
+            return jax.ShapeDtypeStruct(shape, jax.dtypes.canonicalize_dtype(dtype))
+
+        obs_dtype = _storage_dtype(obs_codec, obs_space.dtype)
+        obs = shape_dtype(obs_space.shape, obs_dtype)
+        fields = Minibatch(
+            obs=obs,
+            action=shape_dtype(action_space.shape, action_space.dtype),
+            reward=shape_dtype((), _storage_dtype(reward_codec, jnp.float32)),
+            done=shape_dtype((), jnp.bool_),
+            next_obs=obs,
+        )
+        storage = HostStorage(size, fields, path)
+        return cls(
+            size=size, data=None, index=0, full=False, codecs=codecs, storage=storage
+        )
+
+    @jax.jit
+    def append(self, a: Minibatch) -> "HostReplayBuffer":
+        return self.extend(jax.tree_map(lambda x: jnp.expand_dims(x, 0), a))
+
+    @jax.jit
+    def extend(self, batch: Minibatch) -> "HostReplayBuffer":
+        batch = self.encode(batch)
+        io_callback(self.storage.write, None, self.index, batch, ordered=True)
+
+        batch_size = batch.obs.shape[0]
+        next_index = (self.index + batch_size) % self.size
+        full = jnp.logical_or(self.full, next_index == 0)
+        return self.replace(index=next_index, full=full)
+
+    @partial(jax.jit, static_argnames=("num"))
+    def sample(self, num: int, rng: chex.PRNGKey) -> Minibatch:
+        result_shape = jax.tree_map(
+            lambda arr: jax.ShapeDtypeStruct((num, *arr.shape[1:]), arr.dtype),
+            self.storage.arrays,
+        )
+        minibatch = io_callback(
+            self.storage.sample, result_shape, num, self.num_entries, rng, ordered=True
+        )
+        return self.decode(minibatch)
+
+    @partial(jax.jit, static_argnames=("num_batches", "batch_size"))
+    def sample_many(
+        self, num_batches: int, batch_size: int, rng: chex.PRNGKey
+    ) -> Minibatch:
+        minibatch = self.sample(num_batches * batch_size, rng)
+        return jax.tree_map(
+            lambda x: x.reshape(num_batches, batch_size, *x.shape[1:]), minibatch
+        )
@@ -0,0 +1,100 @@
+import os
+import re
+import shutil
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, List, Optional
+
+import jax
+from flax import serialization
+
+from RLinJAX.buffers import HostReplayBuffer
+
+
+class Checkpointer:
+    """
+    Saves train states, including their replay buffers, to `directory`. Train states
+    are copied to the host when `save` is called, but serialized and written to disk
+    by a background thread, so that training can continue in the meantime. Only the
+    `max_to_keep` most recent checkpoints are kept.
+
+    The transitions of host replay buffers are not part of the pytree and keep
+    changing after `save`, so a copy of them is written next to every checkpoint
+    before `save` returns.
+    """
+
+    pattern = re.compile(r"checkpoint_(\d+)\.msgpack")
+
+    def __init__(self, directory: str, max_to_keep: Optional[int] = 3):
+        os.makedirs(directory, exist_ok=True)
+        self.directory = directory
+        self.max_to_keep = max_to_keep
+        self._executor = ThreadPoolExecutor(max_workers=1)
+        self._lock = threading.Lock()
+        self._pending = []
+
+    def path(self, step: int) -> str:
+        return os.path.join(self.directory, f"checkpoint_{step}.msgpack")
+
+    def replay_path(self, step: int) -> str:
+        return os.path.join(self.directory, f"checkpoint_{step}_replay")
+
+    @property
+    def steps(self) -> List[int]:
+        matches = (self.pattern.fullmatch(f) for f in os.listdir(self.directory))
+        return sorted(int(m.group(1)) for m in matches if m is not None)
+
+    @property
+    def latest_step(self) -> Optional[int]:
+        steps = self.steps
+        return steps[-1] if steps else None
+
+    def save(self, step: int, ts: Any):
+        # Waits for the computation of `ts`, including its writes to host replay
+        ts = jax.device_get(ts)
+        buffer = getattr(ts, "replay_buffer", None)
+        if isinstance(buffer, HostReplayBuffer):
+            buffer.storage.save(self.replay_path(step))
+
+        with self._lock:
+            self._pending = [f for f in self._pending if not f.done()]
+            self._pending.append(self._executor.submit(self._write, step, ts))
+
+    def _write(self, step: int, ts: Any):
+        path = self.path(step)
+        with open(f"{path}.tmp", "wb") as f:
+            f.write(serialization.to_bytes(ts))
+        os.replace(f"{path}.tmp", path)
+
+        if self.max_to_keep is not None:
+            for old_step in self.steps[: -self.max_to_keep]:
+                os.remove(self.path(old_step))
+                shutil.rmtree(self.replay_path(old_step), ignore_errors=True)
+
+    def wait(self):
+        """Blocks until all pending checkpoints are written."""
+        with self._lock:
+            pending, self._pending = self._pending, []
+        for future in pending:
+            future.result()
+
+    def restore(self, target: Any, step: Optional[int] = None) -> Any:
+        """Restores a train state with the same structure as `target`, which can be
+        created with `algo.init_state(rng)`. Defaults to the latest checkpoint.
+        """
+        self.wait()
+        step = self.latest_step if step is None else step
+        if step is None:
+            raise FileNotFoundError(f"No checkpoints found in {self.directory}")
+
+        with open(self.path(step), "rb") as f:
+            ts = serialization.from_bytes(target, f.read())
+
+        buffer = getattr(ts, "replay_buffer", None)
+        if isinstance(buffer, HostReplayBuffer):
+            if not os.path.isdir(self.replay_path(step)):
+                raise FileNotFoundError(
+                    f"No host replay transitions found for checkpoint {step}"
+                )
+            buffer.storage.load(self.replay_path(step))
+        return ts
@@ -2,10 +2,16 @@ import importlib
 
 from gymnax import make
 
+from RLinJAX.compat.episode_statistics import (
+    EpisodeStatisticsState,
+    EpisodeStatisticsWrapper,
+)
+
 _create_fns = {
     "brax": ("RLinJAX.compat.brax2gymnax", "create_brax"),
     "navix": ("RLinJAX.compat.navix2gymnax", "create_navix"),
     "jumanji": ("RLinJAX.compat.jumanji2gymnax", "create_jumanji"),
+    "gymnasium": ("RLinJAX.compat.gymnasium2gymnax", "create_gymnasium"),
 }
 
 
@@ -20,4 +26,4 @@ def create(env, **kwargs):
     return create_fn(env_name, **kwargs)
 
 
-__all__ = ["create"]
+__all__ = ["create", "EpisodeStatisticsState", "EpisodeStatisticsWrapper"]
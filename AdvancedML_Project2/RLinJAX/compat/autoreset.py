@@ -0,0 +1,172 @@
+import dataclasses
+from functools import partial
+from typing import Any, Union
+
+import chex
+import jax
+from flax import struct
+from jax import numpy as jnp
+from jax.custom_batching import custom_vmap
+
+
+def select_tree(pred, on_true, on_false):
+    return jax.tree.map(lambda x, y: jax.lax.select(pred, x, y), on_true, on_false)
+
+
+@dataclasses.dataclass(frozen=True)
+class EagerReset:
+    """Computes a reset at every step and selects it where the episode ended, like
+    gymnax environments do.
+    """
+
+    def reset(self, env, key, params):
+        return env.reset_env(key, params)
+
+    def step(self, env, key, state, action, params):
+        key, key_reset = jax.random.split(key)
+        obs_st, state_st, reward, done, info = env.step_env(key, state, action, params)
+        obs_re, state_re = env.reset_env(key_reset, params)
+        obs, state = select_tree(done, (obs_re, state_re), (obs_st, state_st))
+        return obs, state, reward, done, info
+
+
+@dataclasses.dataclass(frozen=True)
+class CondReset:
+    """Computes a reset only when the episode ended, using `jax.lax.cond`. This only
+    saves time when stepping a single environment: under `jax.vmap`, the condition
+    is batched and both branches are computed, as with `EagerReset`.
+    """
+
+    def reset(self, env, key, params):
+        return env.reset_env(key, params)
+
+    def step(self, env, key, state, action, params):
+        key, key_reset = jax.random.split(key)
+        obs, state, reward, done, info = env.step_env(key, state, action, params)
+        obs, state = jax.lax.cond(
+            done,
+            lambda: env.reset_env(key_reset, params),
+            lambda: (obs, state),
+        )
+        return obs, state, reward, done, info
+
+
+@struct.dataclass
+class ResetPoolState:
+    env_state: Any
+    pool_obs: Any
+    pool_state: Any
+    num_episodes: chex.Array
+    num_steps: chex.Array
+
+
+@dataclasses.dataclass(frozen=True)
+class PoolReset:
+    """
+    Starts new episodes from a pool of `pool_size` reset states that is generated
+    when the environment is reset and regenerated every `refresh_freq` steps, so
+    that a step costs 1 / `refresh_freq` of `pool_size` resets instead of a reset.
+    Every environment has its own pool, which it goes through in order.
+
+    Under `jax.vmap`, all pools are refreshed together, as soon as one of them is
+    due, so that the refresh is skipped with a real `jax.lax.cond` at other steps.
+    The environment state is a `ResetPoolState`.
+    """
+
+    pool_size: int = 16
+    refresh_freq: int = 1000
+
+    def generate(self, env, key, params):
+        keys = jax.random.split(key, self.pool_size)
+        return jax.vmap(env.reset_env, in_axes=(0, None))(keys, params)
+
+    def refresh(self, env, key, state, params):
+        pool_obs, pool_state = self.generate(env, key, params)
+        return state.replace(pool_obs=pool_obs, pool_state=pool_state)
+
+    def reset(self, env, key, params):
+        key, key_pool = jax.random.split(key)
+        obs, env_state = env.reset_env(key, params)
+        pool_obs, pool_state = self.generate(env, key_pool, params)
+        state = ResetPoolState(
+            env_state=env_state,
+            pool_obs=pool_obs,
+            pool_state=pool_state,
+            num_episodes=jnp.array(0),
+            num_steps=jnp.array(0),
+        )
+        return obs, state
+
+    def step_without_refresh(self, env, key, state, action, params):
+        key, key_refresh = jax.random.split(key)
+        obs_st, env_state_st, reward, done, info = env.step_env(
+            key, state.env_state, action, params
+        )
+        index = state.num_episodes % self.pool_size
+        obs_re, env_state_re = jax.tree.map(
+            lambda x: x[index], (state.pool_obs, state.pool_state)
+        )
+        obs, env_state = select_tree(
+            done, (obs_re, env_state_re), (obs_st, env_state_st)
+        )
+        state = state.replace(
+            env_state=env_state,
+            num_episodes=state.num_episodes + done,
+            num_steps=state.num_steps + 1,
+        )
+        return (obs, state, reward, done, info), key_refresh
+
+    def step(self, env, key, state, action, params):
+        @custom_vmap
+        def step(key, state, action, params):
+            transition, key_refresh = self.step_without_refresh(
+                env, key, state, action, params
+            )
+            obs, state, reward, done, info = transition
+            state = jax.lax.cond(
+                state.num_steps % self.refresh_freq == 0,
+                lambda s: self.refresh(env, key_refresh, s, params),
+                lambda s: s,
+                state,
+            )
+            return obs, state, reward, done, info
+
+        @step.def_vmap
+        def step_batched(axis_size, in_batched, key, state, action, params):
+            in_axes = tuple(
+                jax.tree.map(lambda batched: 0 if batched else None, b)
+                for b in in_batched
+            )
+            transition, key_refresh = jax.vmap(
+                partial(self.step_without_refresh, env),
+                in_axes=in_axes,
+                axis_size=axis_size,
+            )(key, state, action, params)
+            obs, state, reward, done, info = transition
+            refresh = jax.vmap(partial(self.refresh, env), in_axes=(0, 0, in_axes[3]))
+            state = jax.lax.cond(
+                jnp.any(state.num_steps % self.refresh_freq == 0),
+                lambda s: refresh(key_refresh, s, params),
+                lambda s: s,
+                state,
+            )
+            transition = (obs, state, reward, done, info)
+            return transition, jax.tree.map(lambda _: True, transition)
+
+        return step(key, state, action, params)
+
+
+_strategies = {"eager": EagerReset, "cond": CondReset, "pool": PoolReset}
+
+
+def make_reset_strategy(strategy: Union[str, Any]):
+    """Returns the reset strategy `strategy`, which is either a strategy or one of
+    "eager", "cond" and "pool" for the strategy with its default arguments.
+    """
+    if not isinstance(strategy, str):
+        return strategy
+    if strategy not in _strategies:
+        raise ValueError(
+            f"Unknown reset strategy {strategy}, expected one of {list(_strategies)}"
+        )
+    return _strategies[strategy]()
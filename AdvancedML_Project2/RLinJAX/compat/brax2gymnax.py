@@ -1,6 +1,8 @@
 import warnings
 from copy import copy
+from functools import partial
 
+import jax
 from brax.envs import Env as BraxEnv
 from brax.envs import create
 from flax import struct
@@ -8,10 +10,12 @@ from gymnax.environments import spaces
 from gymnax.environments.environment import Environment as GymnaxEnv
 from jax import numpy as jnp
 
+from RLinJAX.compat.autoreset import make_reset_strategy
 
-def create_brax(env_name, **kwargs):
+
+def create_brax(env_name, reset_strategy="eager", **kwargs):
     env = create(env_name, **kwargs)
-    env = Brax2GymnaxEnv(env)
+    env = Brax2GymnaxEnv(env, reset_strategy=reset_strategy)
     return env, env.default_params
 
 
@@ -22,14 +26,27 @@ class EnvParams:
 
 
 class Brax2GymnaxEnv(GymnaxEnv):
-    def __init__(self, env: BraxEnv):
+    def __init__(self, env: BraxEnv, reset_strategy="eager"):
         self.env = env
         self.max_steps_in_episode = env.episode_length
+        self.reset_strategy = make_reset_strategy(reset_strategy)
 
     @property
     def default_params(self):
         return EnvParams(max_steps_in_episode=self.max_steps_in_episode)
 
+    @partial(jax.jit, static_argnums=(0,))
+    def step(self, key, state, action, params=None):
+        if params is None:
+            params = self.default_params
+        return self.reset_strategy.step(self, key, state, action, params)
+
+    @partial(jax.jit, static_argnums=(0,))
+    def reset(self, key, params=None):
+        if params is None:
+            params = self.default_params
+        return self.reset_strategy.reset(self, key, params)
+
     def step_env(self, key, state, action, params):
         state = self.env.step(state, action)
         return state.obs, state, state.reward, state.done.astype(bool), state.info
@@ -0,0 +1,74 @@
+from functools import partial
+from typing import Any, Optional, Tuple, Union
+
+import chex
+import jax
+from flax import struct
+from gymnax.environments import environment
+from jax import numpy as jnp
+
+
+@struct.dataclass
+class EpisodeStatisticsState:
+    env_state: Any
+    episode_return: chex.Array
+    episode_length: chex.Array
+    returned_episode_return: chex.Array
+    returned_episode_length: chex.Array
+
+
+class EpisodeStatisticsWrapper(environment.Environment):
+    """
+    Tracks the return and length of the running episode in the environment state,
+    as well as those of the last completed episode. The return of the last episode
+    is NaN until the first episode ends. Relies on the wrapped environment resetting
+    itself at the end of an episode, as gymnax environments do.
+    """
+
+    def __init__(self, env):
+        self.env = env
+
+    def __getattribute__(self, name: str) -> Any:
+        if name in ["env", "reset", "step"]:
+            return super().__getattribute__(name)
+        return self.env.__getattribute__(name)
+
+    @partial(jax.jit, static_argnums=(0,))
+    def reset(
+        self, key: chex.PRNGKey, params: Optional[environment.EnvParams] = None
+    ) -> Tuple[chex.Array, EpisodeStatisticsState]:
+        obs, env_state = self.env.reset(key, params)
+        state = EpisodeStatisticsState(
+            env_state=env_state,
+            episode_return=jnp.array(0.0),
+            episode_length=jnp.array(0),
+            returned_episode_return=jnp.array(jnp.nan),
+            returned_episode_length=jnp.array(0),
+        )
+        return obs, state
+
+    @partial(jax.jit, static_argnums=(0,))
+    def step(
+        self,
+        key: chex.PRNGKey,
+        state: EpisodeStatisticsState,
+        action: Union[int, float],
+        params: Optional[environment.EnvParams] = None,
+    ) -> Tuple[chex.Array, EpisodeStatisticsState, float, bool, dict]:
+        obs, env_state, reward, done, info = self.env.step(
+            key, state.env_state, action, params
+        )
+        episode_return = state.episode_return + reward.squeeze()
+        episode_length = state.episode_length + 1
+        state = EpisodeStatisticsState(
+            env_state=env_state,
+            episode_return=jnp.where(done, 0.0, episode_return),
+            episode_length=jnp.where(done, 0, episode_length),
+            returned_episode_return=jnp.where(
+                done, episode_return, state.returned_episode_return
+            ),
+            returned_episode_length=jnp.where(
+                done, episode_length, state.returned_episode_length
+            ),
+        )
+        return obs, state, reward, done, info
@@ -0,0 +1,367 @@
+import itertools
+import multiprocessing
+import os
+import weakref
+from functools import partial
+from multiprocessing.shared_memory import SharedMemory
+
+import chex
+import gymnasium
+import jax
+import numpy as np
+from flax import struct
+from gymnax.environments import spaces
+from gymnax.environments.environment import Environment as GymnaxEnv
+from gymnax.environments.environment import EnvParams
+from jax import numpy as jnp
+from jax.custom_batching import custom_vmap
+from jax.experimental import io_callback
+
+# Environment groups of one size that are kept alive at the same time, which is
+# enough for the training environments and the evaluation environments
+_GROUPS_PER_SIZE = 2
+
+
+def create_gymnasium(env_name, num_workers=None, **kwargs):
+    env = Gymnasium2GymnaxEnv(env_name, num_workers=num_workers, **kwargs)
+    return env, env.default_params
+
+
+def convert_space(space):
+    if isinstance(space, gymnasium.spaces.Discrete):
+        return spaces.Discrete(num_categories=int(space.n))
+    elif isinstance(space, gymnasium.spaces.Box):
+        return spaces.Box(
+            low=jnp.asarray(space.low),
+            high=jnp.asarray(space.high),
+            shape=space.shape,
+            dtype=space.dtype,
+        )
+    raise ValueError(f"Unsupported space {space}")
+
+
+def encode_obs(space, obs):
+    # Discrete observations are one-hot encoded
+    if isinstance(space, gymnasium.spaces.Discrete):
+        return np.eye(space.n, dtype=np.float32)[obs - space.start]
+    return obs
+
+
+def vectorized_io_callback(callback, result_shapes, *args):
+    """Calls `callback` through an `io_callback`, which JAX neither removes nor merges
+    with identical calls, since it has side effects. Under `jax.vmap`, `callback` is
+    called once with the whole batch, with the batch axes prepended to every argument
+    and result, instead of once per element.
+    """
+    base_ndims = [jnp.ndim(x) for x in args]
+
+    @custom_vmap
+    def call(*args):
+        batch_ndim = jnp.ndim(args[0]) - base_ndims[0]
+        batch_shape = jnp.shape(args[0])[:batch_ndim]
+        shapes = jax.tree.map(
+            lambda s: jax.ShapeDtypeStruct(batch_shape + s.shape, s.dtype),
+            result_shapes,
+        )
+        return io_callback(callback, shapes, *args)
+
+    @call.def_vmap
+    def call_batched(axis_size, in_batched, *args):
+        args = [
+            x if batched else jnp.broadcast_to(x, (axis_size, *jnp.shape(x)))
+            for x, batched in zip(args, in_batched)
+        ]
+        out = call(*args)
+        return out, jax.tree.map(lambda _: True, out)
+
+    return call(*args)
+
+
+@struct.dataclass
+class GymnasiumState:
+    group: chex.Array
+    lane: chex.Array
+
+
+def _run_worker(conn, env_name, kwargs, start, stop, buffers):
+    shms, arrays = [], {}
+    for name, (shm_name, shape, dtype) in buffers.items():
+        shms.append(SharedMemory(name=shm_name))
+        arrays[name] = np.ndarray(shape, dtype, buffer=shms[-1].buf)[start:stop]
+
+    envs = [gymnasium.make(env_name, **kwargs) for _ in range(stop - start)]
+    try:
+        while True:
+            command, data = conn.recv()
+            if command == "reset":
+                for i, (env, seed) in enumerate(zip(envs, data)):
+                    obs, _ = env.reset(seed=int(seed))
+                    arrays["obs"][i] = encode_obs(env.observation_space, obs)
+            elif command == "step":
+                # Only the environments in `data` are stepped
+                for i in data:
+                    env = envs[i]
+                    action = arrays["action"][i]
+                    if isinstance(env.action_space, gymnasium.spaces.Discrete):
+                        action = action.item()
+                    obs, reward, terminated, truncated, _ = env.step(action)
+                    done = terminated or truncated
+                    if done:
+                        obs, _ = env.reset()
+                    arrays["obs"][i] = encode_obs(env.observation_space, obs)
+                    arrays["reward"][i] = reward
+                    arrays["done"][i] = done
+            else:
+                break
+            conn.send(None)
+    finally:
+        for env in envs:
+            env.close()
+        for shm in shms:
+            shm.close()
+
+
+class _EnvGroup:
+    """A fixed number of copies of a gymnasium environment, split across worker
+    processes. Actions and observations are exchanged through shared memory, and
+    the pipes to the workers only carry commands.
+    """
+
+    def __init__(self, env_name, kwargs, num_envs, num_workers, obs_shape, action):
+        shapes = {
+            "obs": ((num_envs, *obs_shape), np.float32),
+            "action": ((num_envs, *action.shape), action.dtype),
+            "reward": ((num_envs,), np.float32),
+            "done": ((num_envs,), np.bool_),
+        }
+        self.shms, self.arrays, buffers = [], {}, {}
+        for name, (shape, dtype) in shapes.items():
+            size = max(int(np.prod(shape)) * np.dtype(dtype).itemsize, 1)
+            shm = SharedMemory(create=True, size=size)
+            self.shms.append(shm)
+            self.arrays[name] = np.ndarray(shape, dtype, buffer=shm.buf)
+            buffers[name] = (shm.name, shape, np.dtype(dtype).str)
+
+        ctx = multiprocessing.get_context("spawn")
+        bounds = np.linspace(0, num_envs, min(num_workers, num_envs) + 1).astype(int)
+        self.conns, self.processes = [], []
+        for start, stop in zip(bounds[:-1], bounds[1:]):
+            conn, worker_conn = ctx.Pipe()
+            process = ctx.Process(
+                target=_run_worker,
+                args=(worker_conn, env_name, kwargs, start, stop, buffers),
+                daemon=True,
+            )
+            process.start()
+            worker_conn.close()
+            self.conns.append(conn)
+            self.processes.append(process)
+
+        self.bounds = bounds
+        self.num_envs = num_envs
+        self.id = -1
+        self.last_used = 0
+
+    def _run(self, command, data):
+        # Workers without data are skipped
+        conns = []
+        for conn, worker_data in zip(self.conns, data):
+            if len(worker_data):
+                conn.send((command, worker_data))
+                conns.append(conn)
+        for conn in conns:
+            conn.recv()
+
+    def reset(self, seeds):
+        self._run("reset", np.split(seeds, self.bounds[1:-1]))
+        return self.arrays["obs"].copy()
+
+    def step(self, lanes, actions):
+        """Steps the environments of `lanes` only, the others keep their state."""
+        sorted_lanes = np.unique(lanes)
+        if sorted_lanes.size != lanes.size:
+            raise ValueError("An environment cannot be stepped twice in one step")
+        self.arrays["action"][lanes] = actions
+        split = np.split(sorted_lanes, np.searchsorted(sorted_lanes, self.bounds[1:-1]))
+        self._run("step", [w - start for w, start in zip(split, self.bounds[:-1])])
+        return tuple(self.arrays[k][lanes] for k in ("obs", "reward", "done"))
+
+    def close(self):
+        for conn in self.conns:
+            try:
+                conn.send(("close", None))
+            except (BrokenPipeError, OSError):
+                pass
+        for process in self.processes:
+            process.join(timeout=5)
+        for shm in self.shms:
+            shm.close()
+            shm.unlink()
+
+
+def _close_groups(groups):
+    for group in groups:
+        group.close()
+    groups.clear()
+
+
+class Gymnasium2GymnaxEnv(GymnaxEnv):
+    """
+    Exposes a `gymnasium` environment through the gymnax interface. The
+    environments run in worker processes and are reset and stepped by host
+    callbacks, which are vectorized, so that `jax.vmap` over `reset` and `step`
+    results in a single callback that steps all environments of the batch in
+    parallel.
+
+    A vectorized `reset` of a batch of environments starts a group of that size,
+    and the environment state only holds the group and the lane of each environment
+    in it. Groups are reused once more than `_GROUPS_PER_SIZE` groups of the same
+    size have been reset, and states that refer to a reused group are invalid.
+    Environments reset themselves at the end of an episode, as gymnax environments
+    do, and the key passed to `step` is ignored. A step only advances the
+    environments of its batch, e.g. the lanes of one device in data-parallel
+    training.
+
+    Observations only exist in the worker processes, so `get_obs` and `is_terminal`
+    are not supported.
+    """
+
+    def __init__(self, env_name, num_workers=None, **kwargs):
+        self.env_name = env_name
+        self.kwargs = kwargs
+        self.num_workers = num_workers or os.cpu_count() or 1
+
+        env = gymnasium.make(env_name, **kwargs)
+        self._observation_space = env.observation_space
+        self._action_space = env.action_space
+        self.max_steps_in_episode = (
+            env.spec.max_episode_steps if env.spec.max_episode_steps else 1000
+        )
+        env.close()
+
+        self._groups = []
+        self._group_ids = itertools.count()
+        self._clock = itertools.count(1)
+        self._finalizer = weakref.finalize(self, _close_groups, self._groups)
+
+    @property
+    def default_params(self):
+        return EnvParams(max_steps_in_episode=self.max_steps_in_episode)
+
+    @property
+    def name(self):
+        return self.env_name
+
+    def action_space(self, params=None):
+        return convert_space(self._action_space)
+
+    def observation_space(self, params=None):
+        space = self._observation_space
+        if isinstance(space, gymnasium.spaces.Discrete):
+            return spaces.Box(0.0, 1.0, (int(space.n),), dtype=jnp.float32)
+        space = convert_space(space)
+        return spaces.Box(space.low, space.high, space.shape, dtype=jnp.float32)
+
+    @property
+    def num_actions(self):
+        return self.action_space().num_categories
+
+    @partial(jax.jit, static_argnums=(0,))
+    def reset(self, key, params=None):
+        seed = jax.random.randint(key, (), 0, jnp.iinfo(jnp.int32).max)
+        result_shapes = (
+            jax.ShapeDtypeStruct(self.observation_space().shape, jnp.float32),
+            jax.ShapeDtypeStruct((), jnp.int32),
+            jax.ShapeDtypeStruct((), jnp.int32),
+        )
+        obs, group, lane = vectorized_io_callback(
+            self._reset_callback, result_shapes, seed
+        )
+        return obs, GymnasiumState(group=group, lane=lane)
+
+    @partial(jax.jit, static_argnums=(0,))
+    def step(self, key, state, action, params=None):
+        result_shapes = (
+            jax.ShapeDtypeStruct(self.observation_space().shape, jnp.float32),
+            jax.ShapeDtypeStruct((), jnp.float32),
+            jax.ShapeDtypeStruct((), jnp.bool_),
+            jax.ShapeDtypeStruct((), jnp.int32),
+            jax.ShapeDtypeStruct((), jnp.int32),
+        )
+        # The group and lane are passed through the callback, so that the next step
+        # depends on this one and callbacks cannot be reordered
+        obs, reward, done, group, lane = vectorized_io_callback(
+            self._step_callback, result_shapes, state.group, state.lane, action
+        )
+        return obs, GymnasiumState(group=group, lane=lane), reward, done, {}
+
+    def _reset_callback(self, seed):
+        seed = np.asarray(seed)
+        num_envs = max(seed.size, 1)
+        group = self._reset_group(num_envs)
+        obs = group.reset(seed.reshape(-1))
+        obs = obs.reshape(*seed.shape, *obs.shape[1:])
+        group_id = np.full(seed.shape, group.id, dtype=np.int32)
+        lane = np.arange(num_envs, dtype=np.int32).reshape(seed.shape)
+        return obs, group_id, lane
+
+    def _step_callback(self, group_id, lane, action):
+        group_id, lane = np.asarray(group_id), np.asarray(lane)
+        group = self._get_group(group_id)
+        action_shape = self._action_space.shape
+        obs, reward, done = group.step(
+            lane.reshape(-1), action.reshape(-1, *action_shape)
+        )
+        return (
+            obs.reshape(*lane.shape, *obs.shape[1:]),
+            reward.reshape(lane.shape),
+            done.reshape(lane.shape),
+            group_id.astype(np.int32),
+            lane.astype(np.int32),
+        )
+
+    def _reset_group(self, num_envs):
+        groups = [g for g in self._groups if g.num_envs == num_envs]
+        if len(groups) < _GROUPS_PER_SIZE:
+            action = self._action_space.sample()
+            group = _EnvGroup(
+                self.env_name,
+                self.kwargs,
+                num_envs,
+                self.num_workers,
+                self.observation_space().shape,
+                np.asarray(action),
+            )
+            self._groups.append(group)
+        else:
+            group = min(groups, key=lambda g: g.last_used)
+        group.id = next(self._group_ids)
+        group.last_used = next(self._clock)
+        return group
+
+    def _get_group(self, group_id):
+        ids = np.unique(group_id)
+        if len(ids) != 1:
+            raise ValueError("All environments of a step must belong to one group")
+        for group in self._groups:
+            if group.id == ids[0]:
+                group.last_used = next(self._clock)
+                return group
+        raise ValueError(
+            f"Environment group {ids[0]} of {self.env_name} no longer exists, "
+            "because its environments were reset by a later call to reset"
+        )
+
+    def close(self):
+        self._finalizer()
+
+    def __deepcopy__(self, memo):
+        # Copies, e.g. in `Algorithm.config`, share the worker processes
+        return self
+
+    def __reduce__(self):
+        # Unpickled copies, e.g. in evaluation workers, start their own processes
+        return partial(Gymnasium2GymnaxEnv, **self.kwargs), (
+            self.env_name,
+            self.num_workers,
+        )
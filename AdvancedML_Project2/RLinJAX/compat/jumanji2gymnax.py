@@ -12,10 +12,12 @@ from jumanji.env import Environment as JumanjiEnv
 from jumanji.specs import Array, BoundedArray, DiscreteArray
 from jumanji.types import StepType
 
+from RLinJAX.compat.autoreset import make_reset_strategy
 
-def create_jumanji(env_name, flatten_obs=True, **kwargs):
+
+def create_jumanji(env_name, flatten_obs=True, reset_strategy="eager", **kwargs):
     env = jumanji.make(env_name, **kwargs)
-    env = Jumanji2GymnaxEnv(env)
+    env = Jumanji2GymnaxEnv(env, reset_strategy=reset_strategy)
     if flatten_obs:
         env = FlattenObsWrapper(env)
     return env, env.default_params
@@ -69,30 +71,27 @@ def observation_to_dict(obs):
 
 
 class Jumanji2GymnaxEnv(GymnaxEnv):
-    def __init__(self, env: JumanjiEnv):
+    def __init__(self, env: JumanjiEnv, reset_strategy="eager"):
         self.env = env
         self.max_steps_in_episode = getattr(env, "time_limit", 1000)
+        self.reset_strategy = make_reset_strategy(reset_strategy)
 
     @property
     def default_params(self):
         return EnvParams(max_steps_in_episode=self.max_steps_in_episode)
 
     @partial(jax.jit, static_argnums=(0,))
-    def step(self, key, state, action, params):
-        # We overwrite to tree map reset selection
+    def step(self, key, state, action, params=None):
+        # We overwrite to tree map reset selection, observations are dicts
         if params is None:
             params = self.default_params
-        key, key_reset = jax.random.split(key)
-        obs_st, state_st, reward, done, info = self.step_env(key, state, action, params)
-        obs_re, state_re = self.reset_env(key_reset, params)
-
-        # Tree map over observation as well, to
-        state, obs = jax.tree.map(
-            lambda x, y: jax.lax.select(done, x, y),
-            (state_re, obs_re),
-            (state_st, obs_st),
-        )
-        return obs, state, reward, done, info
+        return self.reset_strategy.step(self, key, state, action, params)
+
+    @partial(jax.jit, static_argnums=(0,))
+    def reset(self, key, params=None):
+        if params is None:
+            params = self.default_params
+        return self.reset_strategy.reset(self, key, params)
 
     def step_env(self, key, state, action, params):
         # Is this reasonable? Should we let Jumanji handle this?
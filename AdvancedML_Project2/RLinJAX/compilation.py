@@ -0,0 +1,179 @@
+import functools
+import hashlib
+import os
+import re
+import time
+from dataclasses import fields
+from typing import Any, Optional, Tuple
+
+import jax
+import numpy as np
+from jax import numpy as jnp
+from jax.experimental import serialize_executable
+
+
+def enable_compilation_cache(cache_dir: str, min_compile_time_secs: float = 1.0):
+    """Enables JAX's persistent compilation cache, so that programs that took longer
+    than `min_compile_time_secs` to compile are loaded from `cache_dir` by later
+    processes instead of being compiled again.
+    """
+    os.makedirs(cache_dir, exist_ok=True)
+    jax.config.update("jax_compilation_cache_dir", cache_dir)
+    jax.config.update(
+        "jax_persistent_cache_min_compile_time_secs", min_compile_time_secs
+    )
+
+
+def _stable_repr(value: Any, seen: Optional[set] = None) -> str:
+    seen = set() if seen is None else seen
+    if isinstance(value, (np.ndarray, jax.Array, np.generic)):
+        # Reprs of large arrays are truncated
+        value = np.asarray(value)
+        digest = hashlib.sha256(value.tobytes()).hexdigest()
+        return f"array({value.shape}, {value.dtype}, {digest})"
+    if isinstance(value, functools.partial):
+        args = [_stable_repr(x, seen) for x in (value.func, value.args, value.keywords)]
+        return f"partial({', '.join(args)})"
+    if callable(value) and hasattr(value, "__qualname__"):
+        name = f"{getattr(value, '__module__', '')}.{value.__qualname__}"
+        if id(value) in seen:
+            return name
+        seen.add(id(value))
+        # Values closed over by nested functions are constants of the compiled
+        # program, e.g. the bounds of a distribution of `env_params_sampler`
+        cells = []
+        for cell in getattr(value, "__closure__", None) or ():
+            try:
+                cells.append(_stable_repr(cell.cell_contents, seen))
+            except ValueError:
+                cells.append("<empty>")
+        return f"{name}({', '.join(cells)})" if cells else name
+    if isinstance(value, (list, tuple)):
+        items = ", ".join(_stable_repr(x, seen) for x in value)
+        return f"{type(value).__name__}({items})"
+    if isinstance(value, dict):
+        items = ", ".join(
+            f"{_stable_repr(k, seen)}: {_stable_repr(v, seen)}"
+            for k, v in value.items()
+        )
+        return f"{{{items}}}"
+    # Reprs of functions nested in other objects contain memory addresses
+    return re.sub(r" at 0x[0-9a-fA-F]+", "", repr(value))
+
+
+def cache_key(algo, rng_spec: jax.ShapeDtypeStruct) -> str:
+    """Key of the compiled train function of `algo`. It depends on the algorithm
+    class, its static config fields including the values closed over by static
+    functions, the environment spec and the shapes and dtypes, but not the values,
+    of the remaining config fields.
+    """
+    static = {
+        f.name: _stable_repr(getattr(algo, f.name))
+        for f in fields(algo)
+        if not f.metadata.get("pytree_node", True)
+    }
+    leaves, treedef = jax.tree_util.tree_flatten(algo)
+    avals = [(jnp.shape(x), jnp.result_type(x)) for x in leaves]
+    env_spec = (
+        getattr(algo.env, "name", type(algo.env).__name__),
+        _stable_repr(algo.obs_space),
+        _stable_repr(algo.action_space),
+    )
+    device = jax.devices()[0]
+    parts = (
+        f"{type(algo).__module__}.{type(algo).__qualname__}",
+        sorted(static.items()),
+        _stable_repr(treedef),
+        avals,
+        env_spec,
+        (rng_spec.shape, str(rng_spec.dtype)),
+        (jax.__version__, device.platform, device.device_kind),
+    )
+    return hashlib.sha256(repr(parts).encode()).hexdigest()
+
+
+class CompiledTrain:
+    """
+    Ahead-of-time compiled `train` function, called as `compiled(algo, rng)`. Since
+    `algo` is an argument, the executable can be reused for algorithms derived from
+    the one it was compiled for with `replace` of pytree fields, e.g. the learning
+    rate or `env_params`. Algorithms from separate calls to `create` have different
+    static callbacks and are rejected, even if they only differ in pytree fields.
+    Static fields and values closed over by static functions are compiled into the
+    executable. The returned train states do not depend on the traced `algo`, see
+    `Algorithm.make_optimizer`, so they can be trained further with `algo.train`.
+    `compile_time` measures compilation or, if `from_cache`, loading time.
+    """
+
+    def __init__(self, executable, compile_time: float, from_cache: bool = False):
+        self.executable = executable
+        self.compile_time = compile_time
+        self.from_cache = from_cache
+
+    def __call__(self, algo, rng: jax.Array):
+        return self.executable(algo, rng)
+
+    def serialize(self) -> bytes:
+        """Serializes the executable. Executables containing host callbacks, e.g.
+        of host replay buffers, cannot be serialized.
+        """
+        serialized, _, _ = serialize_executable.serialize(self.executable)
+        return serialized
+
+
+def _train_fn(rng_shape: Tuple[int, ...]):
+    def train(algo, rng):
+        return algo.train(rng)
+
+    # Leading axes of the keys are vectorized over, e.g. one per seed
+    for _ in rng_shape[:-1]:
+        train = jax.vmap(train, in_axes=(None, 0))
+    return jax.jit(train)
+
+
+def compile_train(
+    algo,
+    rng_shape: Tuple[int, ...] = (2,),
+    rng_dtype: Any = jnp.uint32,
+    cache_dir: Optional[str] = None,
+) -> CompiledTrain:
+    """Compiles `algo.train` for keys of shape `rng_shape`. If `cache_dir` is given,
+    serialized executables are stored in and loaded from it.
+    """
+    rng_spec = jax.ShapeDtypeStruct(rng_shape, rng_dtype)
+    train = _train_fn(rng_shape)
+
+    path = None
+    if cache_dir is not None:
+        os.makedirs(cache_dir, exist_ok=True)
+        path = os.path.join(cache_dir, f"{cache_key(algo, rng_spec)}.bin")
+
+    if path is not None and os.path.exists(path):
+        start = time.perf_counter()
+        with open(path, "rb") as f:
+            serialized = f.read()
+
+        # Tree definitions of the outputs contain dynamically created classes and
+        # cannot be pickled, so they are recovered by tracing
+        in_tree = jax.tree_util.tree_structure(((algo, rng_spec), {}))
+        out_tree = jax.tree_util.tree_structure(jax.eval_shape(train, algo, rng_spec))
+        executable = serialize_executable.deserialize_and_load(
+            serialized, in_tree, out_tree
+        )
+        return CompiledTrain(executable, time.perf_counter() - start, True)
+
+    start = time.perf_counter()
+    executable = train.lower(algo, rng_spec).compile()
+    compiled = CompiledTrain(executable, time.perf_counter() - start)
+
+    if path is not None:
+        try:
+            serialized = compiled.serialize()
+        except Exception:
+            # Not serializable, e.g. because of host callbacks
+            return compiled
+        with open(f"{path}.tmp", "wb") as f:
+            f.write(serialized)
+        os.replace(f"{path}.tmp", path)
+
+    return compiled
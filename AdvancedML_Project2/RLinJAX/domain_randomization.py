@@ -0,0 +1,42 @@
+"""
+Samplers of environment variants for domain-randomized training, e.g.
+
+    sampler = randomize(gravity=uniform(5.0, 15.0), force_mag=choice([5.0, 10.0]))
+    algo = PPO.create(env="CartPole-v1", env_params_sampler=sampler, ...)
+
+gives every training episode its own gravity and force. With
+`num_eval_variants`, evaluation reports the results of each of that many variants.
+"""
+
+from typing import Callable, Sequence
+
+import chex
+import jax
+from jax import numpy as jnp
+
+Distribution = Callable[[chex.PRNGKey], chex.Array]
+
+
+def uniform(low: float, high: float) -> Distribution:
+    return lambda rng: jax.random.uniform(rng, minval=low, maxval=high)
+
+
+def choice(values: Sequence) -> Distribution:
+    values = jnp.asarray(values)
+    return lambda rng: jax.random.choice(rng, values)
+
+
+def randomize(**distributions: Distribution):
+    """Returns an `env_params_sampler` that replaces each named field of the
+    environment parameters by a sample of its distribution.
+    """
+
+    def sample(rng, env_params):
+        rngs = jax.random.split(rng, len(distributions))
+        values = {
+            name: distribution(rng).astype(jnp.asarray(getattr(env_params, name)).dtype)
+            for (name, distribution), rng in zip(distributions.items(), rngs)
+        }
+        return env_params.replace(**values)
+
+    return sample
@@ -82,3 +82,121 @@ def evaluate(
     seeds = jax.random.split(rng, num_seeds)
     vmap_collect = jax.vmap(evaluate_single, in_axes=(None, None, None, 0, None))
     return vmap_collect(act, env, env_params, seeds, max_steps_in_episode)
+
+
+class EvalSummary(NamedTuple):
+    mean_return: chex.Array
+    std_return: chex.Array
+    min_return: chex.Array
+    max_return: chex.Array
+    mean_length: chex.Array
+    num_episodes: chex.Array
+
+
+class RolloutState(NamedTuple):
+    rng: chex.PRNGKey
+    env_state: Any
+    last_obs: chex.Array
+    return_: chex.Array
+    length: chex.Array
+    step: int = 0
+    num_episodes: int = 0
+    return_sum: float = 0.0
+    return_sq_sum: float = 0.0
+    return_min: float = jnp.inf
+    return_max: float = -jnp.inf
+    length_sum: int = 0
+
+
+@partial(jax.jit, static_argnames=("act", "env", "num_lanes"))
+def evaluate_rollout(
+    act: Callable[[chex.Array, chex.PRNGKey], chex.Array],
+    rng: chex.PRNGKey,
+    env: environment.Environment,
+    env_params: Any,
+    num_lanes: int = 16,
+    num_episodes: Optional[int] = None,
+    max_steps: Optional[int] = None,
+) -> EvalSummary:
+    """Evaluate a policy given by `act` by stepping `num_lanes` environments in
+    lockstep. Lanes are reset as soon as their episode ends, and the rollout stops
+    once `num_episodes` episodes are completed or after `max_steps` steps. Unlike
+    `evaluate`, no lane waits for the slowest episode, but since episodes are
+    collected in the order they end, short episodes are overrepresented if
+    `num_episodes > num_lanes`.
+
+    Args:
+        act (Callable[[chex.Array, chex.PRNGKey], chex.Array]): A policy represented as
+        a function of type (obs, rng) -> action.
+        rng (chex.PRNGKey): Initial seed.
+        env (environment.Environment): The environment to evaluate on.
+        env_params (Any): The parameters of the environment.
+        num_lanes (int): Number of environments stepped in parallel.
+        num_episodes (int): Number of episodes to complete, defaults to `num_lanes`.
+        max_steps (int): Maximum number of steps of the rollout, defaults to the
+        maximum length of an episode.
+
+    Returns:
+        EvalSummary: Statistics of the returns and lengths of all completed episodes.
+    """
+    if num_episodes is None:
+        num_episodes = num_lanes
+    if max_steps is None:
+        max_steps = env_params.max_steps_in_episode
+
+    rng, rng_reset = jax.random.split(rng)
+    rng_reset = jax.random.split(rng_reset, num_lanes)
+    obs, env_state = jax.vmap(env.reset, in_axes=(0, None))(rng_reset, env_params)
+    zeros = jnp.zeros(num_lanes)
+    state = RolloutState(rng, env_state, obs, zeros, zeros.astype(int))
+
+    def step(state):
+        rng, rng_act, rng_step = jax.random.split(state.rng, 3)
+        rng_act = jax.random.split(rng_act, num_lanes)
+        rng_step = jax.random.split(rng_step, num_lanes)
+        action = jax.vmap(act)(state.last_obs, rng_act)
+
+        # Environments reset themselves at the end of an episode
+        obs, env_state, reward, done, _ = jax.vmap(env.step, in_axes=(0, 0, 0, None))(
+            rng_step, state.env_state, action, env_params
+        )
+        return_ = state.return_ + reward.reshape(num_lanes)
+        length = state.length + 1
+
+        return RolloutState(
+            rng=rng,
+            env_state=env_state,
+            last_obs=obs,
+            return_=jnp.where(done, 0.0, return_),
+            length=jnp.where(done, 0, length),
+            step=state.step + 1,
+            num_episodes=state.num_episodes + done.sum(),
+            return_sum=state.return_sum + jnp.where(done, return_, 0).sum(),
+            return_sq_sum=state.return_sq_sum + jnp.where(done, return_**2, 0).sum(),
+            return_min=jnp.minimum(
+                state.return_min, jnp.where(done, return_, jnp.inf).min()
+            ),
+            return_max=jnp.maximum(
+                state.return_max, jnp.where(done, return_, -jnp.inf).max()
+            ),
+            length_sum=state.length_sum + jnp.where(done, length, 0).sum(),
+        )
+
+    def keep_going(state):
+        return jnp.logical_and(
+            state.num_episodes < num_episodes, state.step < max_steps
+        )
+
+    state = jax.lax.while_loop(keep_going, step, state)
+
+    # Statistics are NaN if no episode ended within `max_steps`
+    mean_return = state.return_sum / state.num_episodes
+    variance = state.return_sq_sum / state.num_episodes - mean_return**2
+    return EvalSummary(
+        mean_return=mean_return,
+        std_return=jnp.sqrt(jnp.maximum(variance, 0)),
+        min_return=state.return_min,
+        max_return=state.return_max,
+        mean_length=state.length_sum / state.num_episodes,
+        num_episodes=state.num_episodes,
+    )
@@ -0,0 +1,50 @@
+from typing import Dict, Iterable, NamedTuple
+
+import chex
+from jax import numpy as jnp
+
+
+class MetricStats(NamedTuple):
+    total: chex.Array
+    count: chex.Array
+    min: chex.Array
+    max: chex.Array
+
+    @classmethod
+    def empty(cls) -> "MetricStats":
+        return cls(
+            total=jnp.array(0.0),
+            count=jnp.array(0, dtype=jnp.int32),
+            min=jnp.array(jnp.inf),
+            max=jnp.array(-jnp.inf),
+        )
+
+    def update(self, value: chex.Array) -> "MetricStats":
+        value = jnp.mean(value).astype(self.total.dtype)
+        return MetricStats(
+            total=self.total + value,
+            count=self.count + 1,
+            min=jnp.minimum(self.min, value),
+            max=jnp.maximum(self.max, value),
+        )
+
+    def summary(self) -> Dict[str, chex.Array]:
+        # The mean is NaN if no values were recorded, e.g. before training starts
+        return {"mean": self.total / self.count, "min": self.min, "max": self.max}
+
+
+def init_metrics(names: Iterable[str]) -> Dict[str, MetricStats]:
+    return {name: MetricStats.empty() for name in names}
+
+
+def update_metrics(
+    stats: Dict[str, MetricStats], values: Dict[str, chex.Array]
+) -> Dict[str, MetricStats]:
+    """Adds one value per metric. Every metric in `values` must be in `stats`."""
+    return {**stats, **{k: stats[k].update(v) for k, v in values.items()}}
+
+
+def summarize_metrics(
+    stats: Dict[str, MetricStats],
+) -> Dict[str, Dict[str, chex.Array]]:
+    return {name: s.summary() for name, s in stats.items()}
@@ -1,22 +1,40 @@
+import dataclasses
 from collections.abc import Sequence
-from typing import Callable, Tuple, Type
+from typing import Any, Callable, Tuple, Type
 
 import distrax
-import jax
 from flax import linen as nn
 from flax.linen.initializers import constant
 from jax import numpy as jnp
 
 
+def _dtype_field():
+    # Keyword-only, so that subclasses can add fields without defaults
+    return dataclasses.field(default=jnp.float32, kw_only=True)
+
+
+def pop_dtypes(config: dict) -> dict:
+    """Pops the `dtype` that networks compute in and the `param_dtype` that their
+    parameters are stored in from `config`. Outputs of networks are always float32,
+    so that log-probabilities, TD targets and losses are computed in full precision.
+    """
+    return {
+        "dtype": jnp.dtype(config.pop("dtype", "float32")),
+        "param_dtype": jnp.dtype(config.pop("param_dtype", "float32")),
+    }
+
+
 class MLP(nn.Module):
     hidden_layer_sizes: Sequence[int]
     activation: Callable
+    dtype: Any = _dtype_field()
+    param_dtype: Any = _dtype_field()
 
     @nn.compact
     def __call__(self, x):
         x = x.reshape((x.shape[0], -1))
         for size in self.hidden_layer_sizes:
-            x = nn.Dense(size)(x)
+            x = nn.Dense(size, dtype=self.dtype, param_dtype=self.param_dtype)(x)
             x = self.activation(x)
         return x
 
@@ -28,14 +46,23 @@ class DiscretePolicy(nn.Module):
     action_dim: int
     hidden_layer_sizes: Sequence[int]
     activation: Callable
+    dtype: Any = _dtype_field()
+    param_dtype: Any = _dtype_field()
 
     def setup(self):
-        self.features = MLP(self.hidden_layer_sizes, self.activation)
-        self.action_logits = nn.Dense(self.action_dim)
+        self.features = MLP(
+            self.hidden_layer_sizes,
+            self.activation,
+            dtype=self.dtype,
+            param_dtype=self.param_dtype,
+        )
+        self.action_logits = nn.Dense(
+            self.action_dim, dtype=self.dtype, param_dtype=self.param_dtype
+        )
 
     def _action_dist(self, obs):
         features = self.features(obs)
-        action_logits = self.action_logits(features)
+        action_logits = self.action_logits(features).astype(jnp.float32)
         return distrax.Categorical(logits=action_logits)
 
     def __call__(self, obs, rng):
@@ -68,27 +95,55 @@ def EpsilonGreedyPolicy(qnet: nn.Module) -> Type[nn.Module]:
             action = action_dist.sample(seed=rng)
             return action
 
+        def __reduce__(self):
+            return _epsilon_greedy_policy, (qnet, module_fields(self))
+
     return EpsilonGreedyPolicy
 
 
+def _epsilon_greedy_policy(qnet, fields):
+    return EpsilonGreedyPolicy(qnet)(**fields)
+
+
+def module_fields(module: nn.Module) -> dict:
+    """Fields of an unbound module. Classes created within functions cannot be
+    pickled by reference, so they are pickled as their base class and fields.
+    """
+    return {
+        f.name: getattr(module, f.name)
+        for f in dataclasses.fields(module)
+        if f.name != "parent"
+    }
+
+
 class GaussianPolicy(nn.Module):
     action_dim: int
     action_range: Tuple[int, int]
     hidden_layer_sizes: Sequence[int]
     activation: Callable
+    dtype: Any = _dtype_field()
+    param_dtype: Any = _dtype_field()
 
     def setup(self):
-        self.features = MLP(self.hidden_layer_sizes, self.activation)
-        self.action_mean = nn.Dense(self.action_dim)
+        self.features = MLP(
+            self.hidden_layer_sizes,
+            self.activation,
+            dtype=self.dtype,
+            param_dtype=self.param_dtype,
+        )
+        self.action_mean = nn.Dense(
+            self.action_dim, dtype=self.dtype, param_dtype=self.param_dtype
+        )
         self.action_log_std = self.param(
-            "action_log_std", constant(0.0), (self.action_dim,)
+            "action_log_std", constant(0.0), (self.action_dim,), self.param_dtype
         )
 
     def _action_dist(self, obs):
         features = self.features(obs)
-        action_mean = self.action_mean(features)
+        action_mean = self.action_mean(features).astype(jnp.float32)
+        action_log_std = self.action_log_std.astype(jnp.float32)
         return distrax.MultivariateNormalDiag(
-            loc=action_mean, scale_diag=jnp.exp(self.action_log_std)
+            loc=action_mean, scale_diag=jnp.exp(action_log_std)
         )
 
     def __call__(self, obs, rng):
@@ -116,11 +171,22 @@ class SquashedGaussianPolicy(nn.Module):
     hidden_layer_sizes: Sequence[int]
     activation: Callable
     log_std_range: Tuple[float, float]
+    dtype: Any = _dtype_field()
+    param_dtype: Any = _dtype_field()
 
     def setup(self):
-        self.features = MLP(self.hidden_layer_sizes, self.activation)
-        self.action_mean = nn.Dense(self.action_dim)
-        self.action_log_std = nn.Dense(self.action_dim)
+        self.features = MLP(
+            self.hidden_layer_sizes,
+            self.activation,
+            dtype=self.dtype,
+            param_dtype=self.param_dtype,
+        )
+        self.action_mean = nn.Dense(
+            self.action_dim, dtype=self.dtype, param_dtype=self.param_dtype
+        )
+        self.action_log_std = nn.Dense(
+            self.action_dim, dtype=self.dtype, param_dtype=self.param_dtype
+        )
         self.bij = distrax.Tanh()
 
     @property
@@ -133,8 +199,8 @@ class SquashedGaussianPolicy(nn.Module):
 
     def _action_dist(self, obs):
         features = self.features(obs)
-        action_mean = self.action_mean(features)
-        action_log_std = self.action_log_std(features)
+        action_mean = self.action_mean(features).astype(jnp.float32)
+        action_log_std = self.action_log_std(features).astype(jnp.float32)
         action_log_std = jnp.clip(
             action_log_std, *self.log_std_range
         )  # TODO: tanh transform?
@@ -173,6 +239,8 @@ class BetaPolicy(nn.Module):
     action_range: Tuple[float, float]
     hidden_layer_sizes: Sequence[int]
     activation: Callable
+    dtype: Any = _dtype_field()
+    param_dtype: Any = _dtype_field()
 
     @property
     def action_loc(self):
@@ -187,14 +255,23 @@ class BetaPolicy(nn.Module):
         return action, *self.log_prob_entropy(obs, action)
 
     def setup(self):
-        self.features = MLP(self.hidden_layer_sizes, self.activation)
-        self.alpha = nn.Dense(self.action_dim)
-        self.beta = nn.Dense(self.action_dim)
+        self.features = MLP(
+            self.hidden_layer_sizes,
+            self.activation,
+            dtype=self.dtype,
+            param_dtype=self.param_dtype,
+        )
+        self.alpha = nn.Dense(
+            self.action_dim, dtype=self.dtype, param_dtype=self.param_dtype
+        )
+        self.beta = nn.Dense(
+            self.action_dim, dtype=self.dtype, param_dtype=self.param_dtype
+        )
 
     def _action_dist(self, obs):
         x = self.features(obs)
-        alpha = 1 + nn.softplus(self.alpha(x))
-        beta = 1 + nn.softplus(self.beta(x))
+        alpha = 1 + nn.softplus(self.alpha(x).astype(jnp.float32))
+        beta = 1 + nn.softplus(self.beta(x).astype(jnp.float32))
         return distrax.Beta(alpha, beta)
 
     def action_log_prob(self, obs, rng):
@@ -219,6 +296,8 @@ class DeterministicPolicy(nn.Module):
     action_range: Tuple[float, float]
     hidden_layer_sizes: Tuple[int]
     activation: Callable
+    dtype: Any = _dtype_field()
+    param_dtype: Any = _dtype_field()
 
     @property
     def action_loc(self):
@@ -231,10 +310,10 @@ class DeterministicPolicy(nn.Module):
     @nn.compact
     def __call__(self, x):
         for size in self.hidden_layer_sizes:
-            x = nn.Dense(size)(x)
+            x = nn.Dense(size, dtype=self.dtype, param_dtype=self.param_dtype)(x)
             x = self.activation(x)
-        x = nn.Dense(self.action_dim)(x)
-        x = jnp.tanh(x)
+        x = nn.Dense(self.action_dim, dtype=self.dtype, param_dtype=self.param_dtype)(x)
+        x = jnp.tanh(x.astype(jnp.float32))
 
         action = self.action_loc + x * self.action_scale
         return action
@@ -251,7 +330,11 @@ class VNetwork(MLP):
     @nn.compact
     def __call__(self, obs):
         x = super().__call__(obs)
-        return nn.Dense(1)(x).squeeze(1)
+        return (
+            nn.Dense(1, dtype=self.dtype, param_dtype=self.param_dtype)(x)
+            .squeeze(1)
+            .astype(jnp.float32)
+        )
 
 
 class QNetwork(MLP):
@@ -259,7 +342,11 @@ class QNetwork(MLP):
     def __call__(self, obs, action):
         x = jnp.concatenate([obs.reshape(obs.shape[0], -1), action], axis=-1)
         x = super().__call__(x)
-        return nn.Dense(1)(x).squeeze(1)
+        return (
+            nn.Dense(1, dtype=self.dtype, param_dtype=self.param_dtype)(x)
+            .squeeze(1)
+            .astype(jnp.float32)
+        )
 
 
 class DiscreteQNetwork(MLP):
@@ -268,7 +355,9 @@ class DiscreteQNetwork(MLP):
     @nn.compact
     def __call__(self, obs):
         x = super().__call__(obs)
-        return nn.Dense(self.action_dim)(x)
+        return nn.Dense(
+            self.action_dim, dtype=self.dtype, param_dtype=self.param_dtype
+        )(x).astype(jnp.float32)
 
     def take(self, obs, action):
         q_values = self(obs)
@@ -279,12 +368,23 @@ class DuelingQNetwork(nn.Module):
     hidden_layer_sizes: Sequence[int]
     activation: Callable
     action_dim: int
+    dtype: Any = _dtype_field()
+    param_dtype: Any = _dtype_field()
 
     @nn.compact
     def __call__(self, obs):
-        x = MLP(self.hidden_layer_sizes, self.activation)(obs)
-        value = nn.Dense(1)(x)
-        advantage = nn.Dense(self.action_dim)(x)
+        x = MLP(
+            self.hidden_layer_sizes,
+            self.activation,
+            dtype=self.dtype,
+            param_dtype=self.param_dtype,
+        )(obs)
+        value = nn.Dense(1, dtype=self.dtype, param_dtype=self.param_dtype)(x).astype(
+            jnp.float32
+        )
+        advantage = nn.Dense(
+            self.action_dim, dtype=self.dtype, param_dtype=self.param_dtype
+        )(x).astype(jnp.float32)
         advantage = advantage - jnp.mean(advantage, axis=-1, keepdims=True)
         return value + advantage
 
@@ -301,30 +401,148 @@ class ImplicitQuantileNetwork(nn.Module):
     risk_distortion: Callable = lambda tau: tau
     # risk_distortion: Callable = lambda tau: 0.8 * tau
     # Or e.g.: tau ** 0.71 / (tau ** 0.71 + (1 - tau) ** 0.71) ** (1 / 0.71)
+    dtype: Any = _dtype_field()
+    param_dtype: Any = _dtype_field()
 
     @property
     def embedding_dim(self):
         return self.hidden_layer_sizes[-1]
 
     @nn.compact
-    def __call__(self, obs, rng):
+    def __call__(self, obs, rng, num_tau=1):
+        """Returns `num_tau` quantiles per observation and action, and their
+        fractions tau, with shapes (batch, num_tau, action_dim) and (batch, num_tau).
+        The observation embedding does not depend on tau, so it is computed once and
+        broadcast against the embeddings of all fractions.
+        """
         x = obs.reshape(obs.shape[0], -1)
-        psi = MLP(self.hidden_layer_sizes, self.activation)(x)
-
-        tau = distrax.Uniform(0, 1).sample(seed=rng, sample_shape=obs.shape[0])
+        psi = MLP(
+            self.hidden_layer_sizes,
+            self.activation,
+            dtype=self.dtype,
+            param_dtype=self.param_dtype,
+        )(x)
+
+        tau = distrax.Uniform(0, 1).sample(
+            seed=rng, sample_shape=(obs.shape[0], num_tau)
+        )
         tau = self.risk_distortion(tau)
-        phi_input = jnp.cos(jnp.pi * jnp.outer(tau, jnp.arange(self.embedding_dim)))
-        phi = nn.relu(nn.Dense(self.embedding_dim)(phi_input))
+        phi_input = jnp.cos(jnp.pi * tau[..., None] * jnp.arange(self.embedding_dim))
+
+        # The dense layers see (batch * num_tau, features) inputs, as XLA computes
+        # the kernel gradients of inputs with more than one batch axis much slower
+        phi_input = phi_input.reshape(-1, self.embedding_dim)
+        phi = nn.relu(
+            nn.Dense(
+                self.embedding_dim, dtype=self.dtype, param_dtype=self.param_dtype
+            )(phi_input)
+        )
+        x = psi[:, None] * phi.reshape(*tau.shape, self.embedding_dim)
+        x = x.reshape(-1, self.embedding_dim)
 
-        x = nn.swish(nn.Dense(64)(psi * phi))
-        return nn.Dense(self.action_dim)(x), tau
+        x = nn.swish(nn.Dense(64, dtype=self.dtype, param_dtype=self.param_dtype)(x))
+        z = nn.Dense(self.action_dim, dtype=self.dtype, param_dtype=self.param_dtype)(x)
+        return z.reshape(*tau.shape, self.action_dim).astype(jnp.float32), tau
 
     def q(self, obs, rng, num_samples=32):
-        rng = jax.random.split(rng, num_samples)
-        zs, _ = jax.vmap(self, in_axes=(None, 0))(obs, rng)
-        return zs.mean(axis=0)
+        zs, _ = self(obs, rng, num_samples)
+        return zs.mean(axis=1)
 
     def best_action(self, obs, rng, num_samples=32):
         q = self.q(obs, rng, num_samples)
         best_action = jnp.argmax(q, axis=1)
         return best_action
+
+
+# Ensemble value networks
+
+
+class EnsembleDense(nn.Module):
+    """`num_members` dense layers with stacked parameters, computed with one batched
+    matmul. Inputs are either shared by all members, with shape (batch, features),
+    or per member, with shape (num_members, batch, features).
+    """
+
+    features: int
+    num_members: int
+    dtype: Any = _dtype_field()
+    param_dtype: Any = _dtype_field()
+
+    @nn.compact
+    def __call__(self, x):
+        kernel = self.param(
+            "kernel",
+            nn.initializers.lecun_normal(batch_axis=(0,)),
+            (self.num_members, x.shape[-1], self.features),
+            self.param_dtype,
+        )
+        bias = self.param(
+            "bias",
+            nn.initializers.zeros,
+            (self.num_members, self.features),
+            self.param_dtype,
+        )
+        x, kernel, bias = nn.dtypes.promote_dtype(x, kernel, bias, dtype=self.dtype)
+        if x.ndim == 2:
+            # Shared inputs are multiplied with the kernels of all members side by
+            # side, which is one large matmul instead of a batch of small ones
+            k, i, o = kernel.shape
+            x = x @ kernel.transpose(1, 0, 2).reshape(i, k * o)
+            x = x.reshape(-1, k, o).transpose(1, 0, 2)
+        else:
+            x = jnp.einsum("kbi,kio->kbo", x, kernel)
+        return x + bias[:, None]
+
+
+class EnsembleMLP(nn.Module):
+    hidden_layer_sizes: Sequence[int]
+    activation: Callable
+    num_members: int = dataclasses.field(default=2, kw_only=True)
+    dtype: Any = _dtype_field()
+    param_dtype: Any = _dtype_field()
+
+    def dense(self, features):
+        return EnsembleDense(
+            features, self.num_members, dtype=self.dtype, param_dtype=self.param_dtype
+        )
+
+    @nn.compact
+    def __call__(self, x):
+        x = x.reshape((x.shape[0], -1))
+        for size in self.hidden_layer_sizes:
+            x = self.dense(size)(x)
+            x = self.activation(x)
+        return x
+
+
+class EnsembleQNetwork(EnsembleMLP):
+    """Ensemble of `QNetwork`s, returns values of shape (num_members, batch)."""
+
+    @nn.compact
+    def __call__(self, obs, action):
+        x = jnp.concatenate([obs.reshape(obs.shape[0], -1), action], axis=-1)
+        x = super().__call__(x)
+        return self.dense(1)(x).squeeze(-1).astype(jnp.float32)
+
+    def min(self, obs, action):
+        return self(obs, action).min(axis=0)
+
+
+class EnsembleDiscreteQNetwork(EnsembleMLP):
+    """Ensemble of `DiscreteQNetwork`s, returns values of shape
+    (num_members, batch, action_dim).
+    """
+
+    action_dim: int
+
+    @nn.compact
+    def __call__(self, obs):
+        x = super().__call__(obs)
+        return self.dense(self.action_dim)(x).astype(jnp.float32)
+
+    def min(self, obs):
+        return self(obs).min(axis=0)
+
+    def take(self, obs, action):
+        q_values = self(obs)
+        return jnp.take_along_axis(q_values, action[None, :, None], axis=2).squeeze(2)
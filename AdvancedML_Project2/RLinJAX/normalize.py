@@ -61,6 +61,9 @@ class FloatObsWrapper:
         self.env = env
 
     def __getattr__(self, name: str) -> Any:
+        if name == "env":
+            # Not set yet, e.g. while the wrapper is being copied
+            raise AttributeError(name)
         if name in ["reset", "step"]:
             return super().__getattr__(name)
         return getattr(self.env, name)
@@ -0,0 +1,122 @@
+import contextlib
+import threading
+import time
+from collections import defaultdict
+from typing import Callable, Dict, Optional
+
+import jax
+import numpy as np
+from jax import numpy as jnp
+from jax.experimental import io_callback
+
+_local = threading.local()
+
+
+class PhaseTimer:
+    """Accumulates the wall-clock time spent in each phase of training."""
+
+    def __init__(self):
+        self.totals = defaultdict(float)
+        self.counts = defaultdict(int)
+        self._starts = {}
+
+    def start(self, name, token):
+        self._starts[name] = time.perf_counter()
+        return np.zeros((), np.int32)
+
+    def stop(self, name, token):
+        start = self._starts.pop(name, None)
+        if start is not None:
+            self.totals[name] += time.perf_counter() - start
+            self.counts[name] += 1
+        return np.zeros((), np.int32)
+
+    def breakdown(self) -> Dict[str, Dict[str, float]]:
+        total = sum(self.totals.values())
+        return {
+            name: {
+                "total": t,
+                "count": self.counts[name],
+                "mean": t / max(self.counts[name], 1),
+                "fraction": t / total if total > 0 else 0.0,
+            }
+            for name, t in sorted(self.totals.items(), key=lambda kv: -kv[1])
+        }
+
+    def summary(self) -> str:
+        lines = [f"{'phase':<10} {'total [s]':>10} {'calls':>8} {'share':>7}"]
+        for name, b in self.breakdown().items():
+            lines.append(
+                f"{name:<10} {b['total']:>10.3f} {b['count']:>8} {b['fraction']:>7.1%}"
+            )
+        return "\n".join(lines)
+
+
+def active_timer() -> Optional[PhaseTimer]:
+    return getattr(_local, "timer", None)
+
+
+@contextlib.contextmanager
+def time_phases():
+    """Inserts timing markers around every `phase` traced within this context, e.g.
+
+        with time_phases() as timer:
+            algo.train_chunked(rng)
+        print(timer.summary())
+
+    Markers are host callbacks that synchronize with the device, so the times are
+    approximate and training is slower than without them. Functions that were
+    compiled outside of this context are not instrumented.
+    """
+    previous = active_timer()
+    _local.timer = timer = PhaseTimer()
+    try:
+        yield timer
+    finally:
+        _local.timer = previous
+
+
+def _is_array(x):
+    return isinstance(x, (jax.Array, np.ndarray))
+
+
+def _token(tree):
+    # Cheap scalar that depends on every array in `tree`
+    leaves = [x for x in jax.tree_util.tree_leaves(tree) if _is_array(x)]
+    return sum(
+        (jnp.ravel(x)[0].astype(jnp.float32) * 0 for x in leaves if x.size > 0),
+        jnp.float32(0),
+    )
+
+
+def phase(name: str, fn: Callable, *args, **kwargs):
+    """Calls `fn` in the named scope `name`, so that its operations are grouped in
+    profiler traces. Within `time_phases`, the time spent in `fn` is also recorded.
+    """
+    timer = active_timer()
+    with jax.named_scope(name):
+        if timer is None:
+            return fn(*args, **kwargs)
+
+        result_shape = jax.ShapeDtypeStruct((), jnp.int32)
+        start = io_callback(
+            lambda t: timer.start(name, t), result_shape, _token(args), ordered=True
+        )
+
+        # XLA does not reorder operations across a conditional whose predicate is
+        # the result of the callback, so that `fn` only starts after it
+        leaves, treedef = jax.tree_util.tree_flatten(args)
+        arrays = [x for x in leaves if _is_array(x)]
+
+        def call(arrays):
+            arrays = iter(arrays)
+            args = [next(arrays) if _is_array(x) else x for x in leaves]
+            return fn(*jax.tree_util.tree_unflatten(treedef, args), **kwargs)
+
+        out = jax.lax.cond(start == 0, call, call, arrays)
+
+        # Ordered callbacks run in program order, so the next phase cannot start
+        # before this one is stopped
+        token = _token(out) + start
+        io_callback(lambda t: timer.stop(name, t), result_shape, token, ordered=True)
+        return out
@@ -0,0 +1,8 @@
+# Makes `RLinJAX` importable when the tests are run with `pytest` from this directory
+import os
+
+# Data-parallel training is tested on two CPU devices, which have to be requested
+# before JAX is imported
+os.environ["XLA_FLAGS"] = " ".join(
+    [os.environ.get("XLA_FLAGS", ""), "--xla_force_host_platform_device_count=2"]
+).strip()
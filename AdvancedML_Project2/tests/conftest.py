@@ -0,0 +1,23 @@
+import pytest
+from jax import numpy as jnp
+
+from RLinJAX.buffers import Minibatch
+
+
+@pytest.fixture
+def transitions():
+    """Returns a function that makes `num` CartPole transitions whose observations
+    count up from `start`, so that every transition can be identified.
+    """
+
+    def make(start, num):
+        obs = jnp.arange(start, start + num, dtype=jnp.float32)[:, None].repeat(4, 1)
+        return Minibatch(
+            obs=obs,
+            action=jnp.zeros(num, jnp.int32),
+            reward=jnp.ones(num),
+            done=jnp.zeros(num, bool),
+            next_obs=obs + 1,
+        )
+
+    return make
@@ -0,0 +1,38 @@
+import jax
+import numpy as np
+import pytest
+
+from RLinJAX import get_algo
+from RLinJAX.async_eval import AsyncEvaluator
+
+
+def create(**config):
+    return get_algo("dqn").create(
+        env="CartPole-v1",
+        total_timesteps=512,
+        eval_freq=256,
+        fill_buffer=64,
+        num_eval_seeds=4,
+        **config,
+    )
+
+
+@pytest.mark.parametrize("config", [{}, {"host_replay": True}])
+def test_async_evaluation_matches_synchronous_evaluation(config):
+    algo = create(normalize_observations=True, **config)
+    with AsyncEvaluator(algo) as evaluator:
+        ts, global_steps = jax.jit(evaluator.wrap(algo).train)(jax.random.PRNGKey(0))
+        steps, evaluation = evaluator.join()
+
+    np.testing.assert_array_equal(steps, global_steps)
+    assert steps.tolist() == [0, 256, 512]
+
+    # The last evaluation is of the final train state
+    expected = jax.jit(lambda ts: algo.eval_callback(algo, ts, ts.rng))(ts)
+    for result, value in zip(evaluation, expected):
+        np.testing.assert_allclose(result[-1], value)
+
+
+def test_async_evaluation_rejects_training_episodes():
+    with pytest.raises(ValueError, match="training_episodes"):
+        AsyncEvaluator(create(eval_mode="training_episodes"))
@@ -0,0 +1,92 @@
+from functools import partial
+
+import gymnax
+import jax
+import numpy as np
+import pytest
+
+from RLinJAX.compat.autoreset import (
+    CondReset,
+    EagerReset,
+    PoolReset,
+    make_reset_strategy,
+)
+
+
+def rollout(strategy, keys, num_steps):
+    """Steps CartPole with `strategy`, always pushing left, and returns the
+    observations and done flags of every step.
+    """
+    env, env_params = gymnax.make("CartPole-v1")
+
+    def run(key):
+        key, key_reset = jax.random.split(key)
+        obs, state = strategy.reset(env, key_reset, env_params)
+
+        def step(state, key):
+            obs, state, _, done, _ = strategy.step(env, key, state, 0, env_params)
+            return state, (obs, done)
+
+        _, (obs, done) = jax.lax.scan(step, state, jax.random.split(key, num_steps))
+        return obs, done
+
+    return jax.jit(jax.vmap(run))(keys)
+
+
+def test_cond_reset_matches_eager_reset():
+    keys = jax.random.split(jax.random.PRNGKey(0), 4)
+    obs, done = rollout(EagerReset(), keys, 50)
+    assert done.any()
+    cond_obs, cond_done = rollout(CondReset(), keys, 50)
+    np.testing.assert_allclose(cond_obs, obs, rtol=1e-6)
+    np.testing.assert_array_equal(cond_done, done)
+
+
+def test_eager_reset_matches_gymnax():
+    env, env_params = gymnax.make("CartPole-v1")
+    key = jax.random.PRNGKey(0)
+    obs, state = env.reset(key, env_params)
+    for key in jax.random.split(key, 20):
+        expected = env.step(key, state, 0, env_params)
+        transition = EagerReset().step(env, key, state, 0, env_params)
+        jax.tree.map(
+            partial(np.testing.assert_allclose, rtol=1e-6),
+            transition[:4],
+            expected[:4],
+        )
+        state = expected[1]
+
+
+def test_pool_reset_starts_episodes_from_the_pool():
+    env, env_params = gymnax.make("CartPole-v1")
+    strategy = PoolReset(pool_size=4, refresh_freq=1000)
+    obs, state = strategy.reset(env, jax.random.PRNGKey(0), env_params)
+
+    step = jax.jit(lambda key, state: strategy.step(env, key, state, 0, env_params))
+    for key in jax.random.split(jax.random.PRNGKey(1), 50):
+        pool_obs = state.pool_obs[state.num_episodes % 4]
+        obs, state, _, done, _ = step(key, state)
+        if done:
+            np.testing.assert_allclose(obs, pool_obs, rtol=1e-6)
+    assert state.num_episodes > 1 and state.num_steps == 50
+
+
+def test_pool_reset_refreshes_batched_pools_together():
+    keys = jax.random.split(jax.random.PRNGKey(0), 3)
+    strategy = PoolReset(pool_size=2, refresh_freq=5)
+    obs, done = rollout(strategy, keys, 30)
+    assert done.any()
+
+    # Refreshing all pools at once gives the same result as refreshing each lane
+    for i, key in enumerate(keys):
+        lane_obs, lane_done = rollout(strategy, key[None], 30)
+        np.testing.assert_allclose(lane_obs[0], obs[i], rtol=1e-6)
+        np.testing.assert_array_equal(lane_done[0], done[i])
+
+
+def test_make_reset_strategy():
+    assert make_reset_strategy("cond") == CondReset()
+    strategy = PoolReset(pool_size=8)
+    assert make_reset_strategy(strategy) is strategy
+    with pytest.raises(ValueError, match="Unknown reset strategy"):
+        make_reset_strategy("lazy")
@@ -0,0 +1,57 @@
+from RLinJAX import benchmarks, get_algo
+
+
+def result(steps_per_second, **fields):
+    return benchmarks.BenchmarkResult(
+        algo="ppo",
+        env="CartPole-v1",
+        num_envs=4,
+        total_timesteps=256,
+        compile_time=1.0,
+        run_time=256 / steps_per_second,
+        steps_per_second=steps_per_second,
+        gradient_steps_per_second=10.0,
+        peak_memory=None,
+        **fields,
+    )
+
+
+def test_supports_matches_action_spaces():
+    assert benchmarks.supports("dqn", "CartPole-v1")
+    assert not benchmarks.supports("dqn", "Pendulum-v1")
+    assert not benchmarks.supports("td3", "CartPole-v1")
+    assert benchmarks.supports("ppo", "CartPole-v1", num_devices=2)
+    assert not benchmarks.supports("sac", "Pendulum-v1", num_devices=2)
+
+
+def test_num_gradient_steps_skips_filling_the_buffer():
+    algo = get_algo("dqn").create(
+        env="CartPole-v1", num_envs=4, total_timesteps=64, eval_freq=64, fill_buffer=16
+    )
+    # Iterations collect steps 0, 4, ..., 60 and train once more than 16 are stored
+    assert benchmarks.num_gradient_steps(algo) == 11 * algo.num_epochs
+
+
+def test_compare_flags_regressions_beyond_tolerance():
+    baseline = [result(1000.0)]
+    assert benchmarks.compare([result(950.0)], baseline) == []
+    (regression,) = benchmarks.compare([result(800.0, dtype="bfloat16")], baseline)
+    assert regression["metric"] == "steps_per_second"
+    assert abs(regression["change"] + 0.2) < 1e-9
+    assert benchmarks.compare([result(800.0, num_devices=2)], baseline) == []
+
+
+def test_results_round_trip(tmp_path):
+    results = [result(1000.0), result(500.0, dtype="bfloat16")]
+    path = str(tmp_path / "results.json")
+    benchmarks.save_results(results, path)
+    assert benchmarks.load_results(path) == results
+
+
+def test_benchmark_runs_one_configuration():
+    res = benchmarks.benchmark(
+        "ppo", "CartPole-v1", num_envs=4, total_timesteps=256, num_repeats=1
+    )
+    assert res.total_timesteps == 256
+    assert res.steps_per_second > 0 and res.compile_time > 0
+    assert res.gradient_steps_per_second > 0
@@ -0,0 +1,173 @@
+import gymnax
+import jax
+import numpy as np
+import pytest
+from jax import numpy as jnp
+
+from RLinJAX import get_algo
+from RLinJAX.buffers import (
+    HostReplayBuffer,
+    Minibatch,
+    PrioritizedReplayBuffer,
+    ReplayBuffer,
+    SumTree,
+    make_codec,
+    n_step_transitions,
+)
+
+
+def spaces():
+    env, env_params = gymnax.make("CartPole-v1")
+    return env.observation_space(env_params), env.action_space(env_params)
+
+
+def test_host_replay_sampling_depends_on_key(transitions):
+    def sample(key):
+        buf = HostReplayBuffer.empty(64, *spaces()).extend(transitions(0, 64))
+        return buf.sample(16, jax.random.PRNGKey(key)).obs
+
+    np.testing.assert_array_equal(sample(0), sample(0))
+    assert not np.array_equal(sample(0), sample(1))
+
+
+def test_host_replay_only_samples_written_transitions(transitions):
+    buf = HostReplayBuffer.empty(64, *spaces()).extend(transitions(0, 8))
+    for key in range(4):
+        minibatch = buf.sample(32, jax.random.PRNGKey(key))
+        assert np.all(np.asarray(minibatch.obs) < 8)
+        np.testing.assert_array_equal(minibatch.next_obs, minibatch.obs + 1)
+
+
+@pytest.mark.parametrize(
+    "config",
+    [{"prioritized_replay": True}, {"n_step": 3}, {"compact_replay": True}],
+)
+def test_host_replay_rejects_unsupported_setups(config):
+    with pytest.raises(ValueError, match="Host replay"):
+        get_algo("dqn").create(env="CartPole-v1", host_replay=True, **config)
+
+
+def test_sum_tree_finds_prefix_sums():
+    tree = SumTree.empty(5).set(jnp.arange(5), jnp.array([1.0, 0.0, 2.0, 3.0, 4.0]))
+    assert tree.total == 10.0
+    index = tree.find(jnp.array([0.0, 0.5, 1.0, 2.9, 3.0, 5.99, 6.0, 9.99]))
+    np.testing.assert_array_equal(index, [0, 0, 2, 2, 3, 3, 4, 4])
+
+
+def test_prioritized_replay_samples_proportionally_to_priority(transitions):
+    buf = PrioritizedReplayBuffer.empty(4, *spaces()).extend(transitions(0, 4))
+    buf = buf.update_priorities(jnp.arange(4), jnp.array([1.0, 0.0, 3.0, 4.0]))
+    index = buf.sample_index(8000, jax.random.PRNGKey(0))
+    frequencies = np.bincount(np.asarray(index), minlength=4) / index.size
+    np.testing.assert_allclose(frequencies, [0.125, 0.0, 0.375, 0.5], atol=1e-3)
+
+    weights = buf.importance_weights(jnp.array([0, 2, 3]), beta=1.0)
+    np.testing.assert_allclose(weights, [1.0, 1 / 3, 1 / 4], rtol=1e-6)
+
+
+def test_prioritized_replay_inserts_with_max_priority(transitions):
+    buf = PrioritizedReplayBuffer.empty(8, *spaces()).extend(transitions(0, 2))
+    buf = buf.update_priorities(jnp.array([0]), jnp.array([5.0]))
+    buf = buf.extend(transitions(2, 2))
+    np.testing.assert_array_equal(buf.priorities.get(jnp.arange(4)), [5, 1, 5, 5])
+
+
+def lane_steps(num_steps, num_lanes, done_at=()):
+    """Consecutive steps of `num_lanes` environments whose observation is the step
+    count plus 100 times the lane index. Episodes end after the steps in `done_at`.
+    """
+    steps = []
+    for t in range(num_steps):
+        obs = t + 100 * jnp.arange(num_lanes, dtype=jnp.float32)
+        steps.append(
+            Minibatch(
+                obs=obs[:, None].repeat(4, 1),
+                action=jnp.zeros(num_lanes, jnp.int32),
+                reward=jnp.full(num_lanes, float(t)),
+                done=jnp.full(num_lanes, t in done_at),
+                next_obs=(obs + 1)[:, None].repeat(4, 1),
+            )
+        )
+    return steps
+
+
+def test_compact_replay_gathers_the_same_transitions():
+    full = ReplayBuffer.empty(12, *spaces())
+    compact = ReplayBuffer.empty(12, *spaces(), num_lanes=3)
+    assert compact.data.next_obs is None
+    for step in lane_steps(6, num_lanes=3):
+        full, compact = full.extend(step), compact.extend(step)
+
+    index = jnp.arange(12)
+    for a, b in zip(full.gather(index), compact.gather(index)):
+        np.testing.assert_array_equal(a, b)
+
+
+def test_compact_replay_does_not_bootstrap_across_episodes():
+    buf = ReplayBuffer.empty(8, *spaces(), num_lanes=2)
+    for step in lane_steps(4, num_lanes=2, done_at=(1,)):
+        buf = buf.extend(step)
+
+    minibatch = buf.gather(jnp.arange(8))
+    # The terminal observation is not stored, a finished transition returns its own
+    np.testing.assert_array_equal(minibatch.next_obs[2:4], minibatch.obs[2:4])
+    np.testing.assert_array_equal(minibatch.next_obs[4:], minibatch.obs[4:] + 1)
+
+
+def test_quantized_codec_round_trips_within_one_step():
+    space = gymnax.environments.spaces.Box(-2.0, 2.0, (3,), jnp.float32)
+    codec = make_codec("uint8", space)
+    x = jax.random.uniform(jax.random.PRNGKey(0), (100, 3), minval=-2.0, maxval=2.0)
+    encoded = codec.encode(x)
+    assert encoded.dtype == jnp.uint8
+    np.testing.assert_allclose(codec.decode(encoded), x, atol=4.0 / 255 / 2 + 1e-6)
+
+
+def test_quantization_requires_bounds():
+    space = gymnax.environments.spaces.Box(-jnp.inf, jnp.inf, (3,), jnp.float32)
+    with pytest.raises(ValueError, match="unbounded"):
+        make_codec("uint8", space)
+
+
+def test_replay_stores_encoded_and_samples_decoded(transitions):
+    buf = ReplayBuffer.empty(
+        8,
+        *spaces(),
+        obs_codec=make_codec("bfloat16", spaces()[0]),
+        reward_codec=make_codec("float16"),
+    ).extend(transitions(0, 8))
+    assert buf.data.obs.dtype == jnp.bfloat16
+    assert buf.data.reward.dtype == jnp.float16
+
+    minibatch = buf.sample(4, jax.random.PRNGKey(0))
+    assert minibatch.obs.dtype == minibatch.reward.dtype == jnp.float32
+    np.testing.assert_array_equal(minibatch.next_obs, minibatch.obs + 1)
+
+
+def test_n_step_transitions_stop_at_episode_ends():
+    windows = Minibatch(
+        obs=jnp.array([[0.0, 1.0, 2.0], [0.0, 1.0, 2.0]]),
+        action=jnp.array([[3, 4, 5], [3, 4, 5]]),
+        reward=jnp.ones((2, 3)),
+        done=jnp.array([[False, False, False], [False, True, False]]),
+        next_obs=jnp.array([[1.0, 2.0, 3.0], [1.0, 2.0, 3.0]]),
+    )
+    n_step = n_step_transitions(windows, gamma=0.5)
+    np.testing.assert_array_equal(n_step.obs, [0.0, 0.0])
+    np.testing.assert_array_equal(n_step.action, [3, 3])
+    np.testing.assert_allclose(n_step.reward, [1.75, 1.5])
+    np.testing.assert_array_equal(n_step.done, [False, True])
+    np.testing.assert_array_equal(n_step.next_obs, [3.0, 3.0])
+
+
+def test_windows_follow_one_lane_and_are_fully_written():
+    buf = ReplayBuffer.empty(12, *spaces(), num_lanes=3)
+    for step in lane_steps(5, num_lanes=3):
+        buf = buf.extend(step)
+
+    start = buf.sample_window_index(64, jax.random.PRNGKey(0), length=3, stride=3)
+    windows = buf.gather(buf.window_index(start, 3, stride=3))
+    obs = np.asarray(windows.obs[..., 0])
+    # Consecutive steps of the same lane, none of which has been overwritten
+    np.testing.assert_array_equal(np.diff(obs, axis=-1), 1)
+    assert np.all(obs % 100 >= 1)
@@ -0,0 +1,75 @@
+import jax
+import numpy as np
+
+from RLinJAX import get_algo
+from RLinJAX.checkpoint import Checkpointer
+
+
+def test_host_replay_checkpoint_restores_saved_transitions(tmp_path, transitions):
+    algo = get_algo("dqn").create(env="CartPole-v1", host_replay=True, buffer_size=16)
+    ts = algo.init_state(jax.random.PRNGKey(0))
+    ts = ts.replace(replay_buffer=ts.replay_buffer.extend(transitions(0, 12)))
+
+    checkpointer = Checkpointer(str(tmp_path))
+    checkpointer.save(1, ts)
+    # Overwrites the saved transitions after the checkpoint
+    ts.replay_buffer.extend(transitions(100, 16))
+    checkpointer.wait()
+
+    restored = checkpointer.restore(algo.init_state(jax.random.PRNGKey(1)), step=1)
+    assert int(restored.replay_buffer.index) == 12
+    obs = restored.replay_buffer.storage.arrays.obs
+    np.testing.assert_array_equal(obs[:12, 0], np.arange(12))
+
+
+def create_dqn(**config):
+    return get_algo("dqn").create(
+        env="CartPole-v1",
+        total_timesteps=256,
+        eval_freq=64,
+        fill_buffer=64,
+        num_eval_seeds=2,
+        **config,
+    )
+
+
+def assert_trees_equal(a, b):
+    jax.tree.map(np.testing.assert_array_equal, a, b)
+
+
+def test_train_chunked_matches_train():
+    algo = create_dqn()
+    rng = jax.random.PRNGKey(0)
+    ts, evaluation = jax.jit(algo.train)(rng)
+    # The last chunk is shorter than the others
+    chunked_ts, chunked_evaluation = algo.train_chunked(rng, evals_per_chunk=3)
+
+    assert_trees_equal(chunked_ts.q_ts.params, ts.q_ts.params)
+    assert_trees_equal(chunked_evaluation, evaluation)
+
+
+def test_train_chunked_resumes_from_checkpoint(tmp_path):
+    algo = create_dqn()
+    checkpointer = Checkpointer(str(tmp_path), max_to_keep=None)
+    ts, evaluation = algo.train_chunked(
+        jax.random.PRNGKey(0), checkpointer=checkpointer
+    )
+    assert checkpointer.steps == [64, 128, 192, 256]
+
+    target = algo.init_state(jax.random.PRNGKey(1))
+    restored = checkpointer.restore(target, step=128)
+    resumed_ts, resumed_evaluation = algo.train_chunked(train_state=restored)
+
+    assert int(resumed_ts.global_step) == 256
+    assert_trees_equal(resumed_ts.q_ts.params, ts.q_ts.params)
+    assert_trees_equal(resumed_ts.replay_buffer.data, ts.replay_buffer.data)
+    # Only the evaluations of the remaining steps are returned
+    assert_trees_equal(resumed_evaluation, jax.tree.map(lambda x: x[-2:], evaluation))
+
+
+def test_checkpointer_keeps_most_recent(tmp_path):
+    algo = create_dqn()
+    checkpointer = Checkpointer(str(tmp_path), max_to_keep=2)
+    algo.train_chunked(jax.random.PRNGKey(0), checkpointer=checkpointer)
+    assert checkpointer.steps == [192, 256]
+    assert checkpointer.latest_step == 256
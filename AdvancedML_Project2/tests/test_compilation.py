@@ -0,0 +1,58 @@
+import gymnax
+import jax
+import numpy as np
+
+from RLinJAX import get_algo
+from RLinJAX.compilation import cache_key
+from RLinJAX.domain_randomization import randomize, uniform
+
+RNG_SPEC = jax.ShapeDtypeStruct((2,), jax.numpy.uint32)
+
+
+def create(**config):
+    env, env_params = gymnax.make("CartPole-v1")
+    config = {"env_params": env_params, **config}
+    return get_algo("ppo").create(
+        env=env,
+        num_envs=4,
+        num_steps=16,
+        total_timesteps=256,
+        eval_freq=256,
+        num_eval_seeds=4,
+        **config,
+    )
+
+
+def test_compiled_state_can_be_trained_further():
+    algo = create()
+    ts, _ = algo.compile()(algo, jax.random.PRNGKey(0))
+    ts, _ = jax.jit(algo.train)(train_state=ts)
+    assert int(ts.global_step) == 2 * algo.num_evals * algo.steps_per_eval
+
+
+def test_compiled_train_uses_env_params_of_its_argument():
+    algo = create()
+    variant = algo.replace(env_params=algo.env_params.replace(gravity=100.0))
+    compiled = algo.compile()
+    _, evaluation = compiled(variant, jax.random.PRNGKey(0))
+    _, expected = variant.compile()(variant, jax.random.PRNGKey(0))
+    np.testing.assert_array_equal(evaluation[0], expected[0])
+
+
+def test_cache_dir_reuses_executable(tmp_path):
+    algo = create()
+    first = algo.compile(cache_dir=str(tmp_path))
+    second = algo.compile(cache_dir=str(tmp_path))
+    assert not first.from_cache and second.from_cache
+
+    _, evaluation = first(algo, jax.random.PRNGKey(0))
+    _, cached = second(algo, jax.random.PRNGKey(0))
+    np.testing.assert_array_equal(evaluation[0], cached[0])
+
+
+def test_cache_key_depends_on_closed_over_values():
+    narrow = create(env_params_sampler=randomize(gravity=uniform(1.0, 2.0)))
+    wide = create(env_params_sampler=randomize(gravity=uniform(5.0, 15.0)))
+    same = create(env_params_sampler=randomize(gravity=uniform(1.0, 2.0)))
+    assert cache_key(narrow, RNG_SPEC) != cache_key(wide, RNG_SPEC)
+    assert cache_key(narrow, RNG_SPEC) == cache_key(same, RNG_SPEC)
@@ -0,0 +1,45 @@
+import jax
+import numpy as np
+import pytest
+
+from RLinJAX import get_algo
+
+
+def create(name, **config):
+    config = {
+        "env": "CartPole-v1",
+        "num_envs": 4,
+        "num_steps": 16,
+        "num_minibatches": 2,
+        "total_timesteps": 128,
+        "eval_freq": 128,
+        "num_eval_seeds": 4,
+        "num_devices": 2,
+        **config,
+    }
+    return get_algo(name).create(**config)
+
+
+@pytest.mark.parametrize("name", ["ppo", "pqn"])
+def test_data_parallel_training_keeps_networks_replicated(name):
+    algo = create(name)
+    ts, (lengths, _) = jax.jit(algo.train)(jax.random.PRNGKey(0))
+    assert int(ts.global_step) == 128
+    assert np.all(lengths > 0)
+
+    params = ts.actor_ts.params if name == "ppo" else ts.q_ts.params
+    for x in jax.tree.leaves(params):
+        first, second = (shard.data for shard in x.addressable_shards)
+        np.testing.assert_array_equal(first, second)
+
+    # Every device steps its own half of the environment lanes
+    obs_first, obs_second = (s.data for s in ts.last_obs.addressable_shards)
+    assert obs_first.shape == obs_second.shape == (2, 4)
+    assert not np.array_equal(obs_first, obs_second)
+
+
+def test_data_parallel_training_checks_devices():
+    with pytest.raises(ValueError, match="divisible"):
+        jax.jit(create("ppo", num_envs=3).train)(jax.random.PRNGKey(0))
+    with pytest.raises(ValueError, match="devices are available"):
+        jax.jit(create("ppo", num_devices=4).train)(jax.random.PRNGKey(0))
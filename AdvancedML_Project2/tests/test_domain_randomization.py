@@ -0,0 +1,58 @@
+import gymnax
+import jax
+import numpy as np
+from jax import numpy as jnp
+
+from RLinJAX import get_algo
+from RLinJAX.domain_randomization import choice, randomize, uniform
+
+sampler = randomize(gravity=uniform(5.0, 15.0), force_mag=choice([5.0, 20.0]))
+
+
+def create(**config):
+    return get_algo("ppo").create(
+        env="CartPole-v1",
+        num_envs=4,
+        num_steps=16,
+        num_minibatches=4,
+        total_timesteps=128,
+        eval_freq=128,
+        num_eval_seeds=4,
+        env_params_sampler=sampler,
+        **config,
+    )
+
+
+def test_randomize_replaces_named_fields():
+    _, env_params = gymnax.make("CartPole-v1")
+    rngs = jax.random.split(jax.random.PRNGKey(0), 64)
+    variants = jax.vmap(sampler, in_axes=(0, None))(rngs, env_params)
+
+    assert variants.gravity.dtype == jnp.asarray(env_params.gravity).dtype
+    assert np.all((variants.gravity >= 5.0) & (variants.gravity < 15.0))
+    assert set(np.asarray(variants.force_mag).tolist()) == {5.0, 20.0}
+    np.testing.assert_array_equal(variants.masscart, env_params.masscart)
+
+
+def test_lanes_resample_when_their_episode_ends():
+    algo = create()
+    ts = algo.init_state(jax.random.PRNGKey(0))
+    gravity = np.asarray(ts.env_params.gravity)
+    assert gravity.shape == (4,) and len(set(gravity.tolist())) == 4
+
+    done = jnp.array([True, False, True, False])
+    resampled = algo.resample_env_params(ts, done).env_params.gravity
+    np.testing.assert_array_equal(resampled[~done], gravity[~done])
+    assert np.all(resampled[done] != gravity[done])
+
+
+def test_evaluation_reports_every_variant():
+    algo = create(num_eval_variants=3)
+    ts, (lengths, returns) = jax.jit(algo.train)(jax.random.PRNGKey(0))
+    assert lengths.shape == returns.shape == (2, 3, 4)
+    assert ts.env_params.gravity.shape == (4,)
+
+    # Variants are fixed, so that evaluations can be compared over time
+    variants = algo.eval_env_params()
+    np.testing.assert_array_equal(variants.gravity, algo.eval_env_params().gravity)
+    assert variants.gravity.shape == (3,)
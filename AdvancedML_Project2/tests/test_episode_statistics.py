@@ -0,0 +1,52 @@
+import gymnax
+import jax
+import numpy as np
+
+from RLinJAX import get_algo
+from RLinJAX.compat.episode_statistics import EpisodeStatisticsWrapper
+
+
+def test_wrapper_tracks_the_last_completed_episode():
+    env, env_params = gymnax.make("CartPole-v1")
+    wrapped = EpisodeStatisticsWrapper(env)
+    rng = jax.random.PRNGKey(0)
+    obs, state = wrapped.reset(rng, env_params)
+    ref_obs, ref_state = env.reset(rng, env_params)
+    np.testing.assert_array_equal(obs, ref_obs)
+    assert np.isnan(state.returned_episode_return)
+
+    length, done = 0, False
+    while not done:
+        rng, rng_step = jax.random.split(rng)
+        obs, state, reward, done, _ = wrapped.step(rng_step, state, 0, env_params)
+        ref_obs, ref_state, _, _, _ = env.step(rng_step, ref_state, 0, env_params)
+        # The wrapped environment is stepped exactly as without the wrapper
+        np.testing.assert_array_equal(obs, ref_obs)
+        length += 1
+        if not done:
+            assert state.episode_length == length
+            assert np.isnan(state.returned_episode_return)
+
+    assert state.returned_episode_length == length
+    assert state.returned_episode_return == length
+    assert state.episode_length == 0 and state.episode_return == 0
+
+
+def test_training_episodes_eval_mode():
+    algo = get_algo("ppo").create(
+        env="CartPole-v1",
+        num_envs=4,
+        num_steps=32,
+        num_minibatches=4,
+        total_timesteps=256,
+        eval_freq=128,
+        eval_mode="training_episodes",
+    )
+    _, (lengths, returns) = jax.jit(algo.train)(jax.random.PRNGKey(0))
+    assert lengths.shape == returns.shape == (3, 4)
+    # No episode has ended before training
+    assert np.all(np.isnan(returns[0]))
+    ended = ~np.isnan(returns[1:])
+    assert ended.any()
+    np.testing.assert_array_equal(returns[1:][ended], lengths[1:][ended])
+    assert np.all(lengths[1:][ended] > 0)
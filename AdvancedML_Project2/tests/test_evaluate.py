@@ -0,0 +1,66 @@
+import gymnax
+import jax
+import numpy as np
+import pytest
+from jax import numpy as jnp
+
+from RLinJAX import get_algo
+from RLinJAX.evaluate import EvalSummary, evaluate, evaluate_rollout
+
+
+def push_left(obs, rng):
+    return jnp.array(0)
+
+
+def test_evaluate_stops_at_max_steps():
+    env, env_params = gymnax.make("CartPole-v1")
+    rng = jax.random.PRNGKey(0)
+    lengths, returns = evaluate(push_left, rng, env, env_params, 8)
+    assert np.all(lengths < 20)
+
+    capped, _ = evaluate(push_left, rng, env, env_params, 8, max_steps_in_episode=5)
+    np.testing.assert_array_equal(capped, np.minimum(lengths, 5))
+
+
+def test_rollout_summarizes_completed_episodes():
+    env, env_params = gymnax.make("CartPole-v1")
+    summary = evaluate_rollout(
+        push_left, jax.random.PRNGKey(0), env, env_params, num_lanes=4, num_episodes=10
+    )
+    assert summary.num_episodes >= 10
+    # CartPole rewards every step with one
+    np.testing.assert_allclose(summary.mean_return, summary.mean_length)
+    assert summary.min_return <= summary.mean_return <= summary.max_return
+    assert summary.std_return > 0
+
+
+def test_rollout_without_completed_episodes_is_nan():
+    env, env_params = gymnax.make("CartPole-v1")
+    summary = evaluate_rollout(
+        push_left, jax.random.PRNGKey(0), env, env_params, num_lanes=4, max_steps=3
+    )
+    assert summary.num_episodes == 0
+    assert np.isnan(summary.mean_return)
+
+
+def test_algorithm_eval_modes():
+    config = dict(
+        env="CartPole-v1",
+        num_envs=4,
+        num_steps=16,
+        num_minibatches=4,
+        total_timesteps=64,
+        eval_freq=64,
+        num_eval_seeds=4,
+    )
+    algo = get_algo("ppo").create(eval_mode="rollout", num_eval_episodes=8, **config)
+    _, evaluation = jax.jit(algo.train)(jax.random.PRNGKey(0))
+    assert isinstance(evaluation, EvalSummary)
+    assert np.all(evaluation.num_episodes >= 8)
+
+    algo = get_algo("ppo").create(eval_max_steps=5, **config)
+    _, (lengths, _) = jax.jit(algo.train)(jax.random.PRNGKey(0))
+    assert lengths.shape == (2, 4) and np.all(lengths <= 5)
+
+    with pytest.raises(ValueError, match="eval_mode"):
+        get_algo("ppo").create(eval_mode="unknown", **config)
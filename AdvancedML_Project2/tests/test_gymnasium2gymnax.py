@@ -0,0 +1,78 @@
+import gymnasium
+import jax
+import numpy as np
+import pytest
+from jax import numpy as jnp
+
+from RLinJAX import get_algo
+from RLinJAX.compat.gymnasium2gymnax import create_gymnasium
+
+
+@pytest.fixture(scope="module")
+def cartpole():
+    env, env_params = create_gymnasium("CartPole-v1", num_workers=2)
+    yield env, env_params
+    env.close()
+
+
+def reference_envs(keys):
+    # Same seeds as `Gymnasium2GymnaxEnv.reset`
+    envs = []
+    for key in keys:
+        seed = jax.random.randint(key, (), 0, jnp.iinfo(jnp.int32).max)
+        env = gymnasium.make("CartPole-v1")
+        env.reset(seed=int(seed))
+        envs.append(env)
+    return envs
+
+
+def test_step_only_advances_given_lanes(cartpole):
+    env, env_params = cartpole
+    keys = jax.random.split(jax.random.PRNGKey(0), 4)
+    _, state = jax.vmap(env.reset, in_axes=(0, None))(keys, env_params)
+    step = jax.jit(jax.vmap(env.step, in_axes=(None, 0, 0, None)))
+
+    # Step lanes 0 and 2, e.g. as the shard of one device, then all lanes
+    lanes = jnp.array([0, 2])
+    partial = jax.tree.map(lambda x: x[lanes], state)
+    step(keys[0], partial, jnp.ones(2, jnp.int32), env_params)
+    obs, *_ = step(keys[0], state, jnp.zeros(4, jnp.int32), env_params)
+
+    references = reference_envs(keys)
+    for lane, reference in enumerate(references):
+        if lane in (0, 2):
+            reference.step(1)
+        expected, *_ = reference.step(0)
+        np.testing.assert_allclose(obs[lane], expected, rtol=1e-6)
+
+
+def test_identical_steps_are_not_merged(cartpole):
+    env, env_params = cartpole
+    keys = jax.random.split(jax.random.PRNGKey(1), 2)
+    _, state = jax.vmap(env.reset, in_axes=(0, None))(keys, env_params)
+
+    @jax.jit
+    def step_twice(state):
+        step = jax.vmap(env.step, in_axes=(None, 0, 0, None))
+        action = jnp.ones(2, jnp.int32)
+        first, *_ = step(keys[0], state, action, env_params)
+        second, *_ = step(keys[0], state, action, env_params)
+        return first, second
+
+    first, second = step_twice(state)
+    assert not np.allclose(first, second)
+
+
+def test_data_parallel_training():
+    algo = get_algo("ppo").create(
+        env="gymnasium/CartPole-v1",
+        num_envs=4,
+        num_steps=16,
+        total_timesteps=256,
+        eval_freq=256,
+        num_eval_seeds=4,
+        num_devices=2,
+    )
+    ts, (lengths, returns) = jax.jit(algo.train)(jax.random.PRNGKey(0))
+    assert int(ts.global_step) == 256
+    assert lengths.shape == returns.shape == (2, 4)
@@ -0,0 +1,45 @@
+import jax
+import numpy as np
+from jax import numpy as jnp
+
+from RLinJAX import get_algo
+from RLinJAX.metrics import MetricStats
+
+
+def test_metric_stats_reduce_batches_to_their_mean():
+    stats = MetricStats.empty()
+    assert np.isnan(stats.summary()["mean"])
+    stats = stats.update(jnp.array([1.0, 3.0])).update(jnp.array(5.0))
+    summary = stats.summary()
+    assert summary["mean"] == 3.5
+    assert summary["min"] == 2.0 and summary["max"] == 5.0
+
+
+def test_metrics_are_paired_with_evaluations():
+    calls = []
+    algo = get_algo("dqn").create(
+        env="CartPole-v1",
+        total_timesteps=256,
+        eval_freq=128,
+        fill_buffer=64,
+        num_eval_seeds=2,
+        collect_metrics=True,
+        metrics_callback=lambda step, metrics: calls.append((int(step), metrics)),
+    )
+    ts, (evaluation, metrics) = jax.jit(algo.train)(jax.random.PRNGKey(0))
+    jax.effects_barrier()
+
+    assert set(metrics) == set(algo.metric_names)
+    mean = np.asarray(metrics["loss"]["mean"])
+    # No updates happen before the initial evaluation
+    assert mean.shape == (3,) and np.isnan(mean[0]) and np.isfinite(mean[1:]).all()
+    assert np.all(metrics["td_error"]["min"][1:] >= 0)
+
+    assert [step for step, _ in calls] == [0, 128, 256]
+    np.testing.assert_array_equal(calls[-1][1]["loss"]["mean"], mean[-1])
+
+    # Collecting metrics does not change training
+    reference, _ = jax.jit(algo.replace(collect_metrics=False).train)(
+        jax.random.PRNGKey(0)
+    )
+    jax.tree.map(np.testing.assert_array_equal, ts.q_ts.params, reference.q_ts.params)
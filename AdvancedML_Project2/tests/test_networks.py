@@ -0,0 +1,117 @@
+import jax
+import numpy as np
+from flax import linen as nn
+from jax import numpy as jnp
+
+from RLinJAX import get_algo
+from RLinJAX.networks import (
+    DiscreteQNetwork,
+    EnsembleDense,
+    EnsembleQNetwork,
+    ImplicitQuantileNetwork,
+)
+
+
+def init_and_apply(network, obs):
+    params = network.init(jax.random.PRNGKey(0), obs)
+    return params, network.apply(params, obs)
+
+
+def test_networks_compute_in_dtype_with_float32_outputs():
+    obs = jax.random.normal(jax.random.PRNGKey(1), (8, 4))
+    network = DiscreteQNetwork((64, 64), nn.relu, 2, dtype=jnp.bfloat16)
+    params, q_values = init_and_apply(network, obs)
+    assert all(x.dtype == jnp.float32 for x in jax.tree.leaves(params))
+    assert q_values.dtype == jnp.float32
+
+    jaxpr = str(jax.make_jaxpr(network.apply)(params, obs))
+    assert "bf16" in jaxpr and "dot_general" in jaxpr
+
+    reference = DiscreteQNetwork((64, 64), nn.relu, 2).apply(params, obs)
+    np.testing.assert_allclose(q_values, reference, atol=0.05)
+
+
+def test_param_dtype_stores_parameters():
+    obs = jnp.ones((1, 4))
+    network = DiscreteQNetwork(
+        (16,), nn.relu, 2, dtype=jnp.bfloat16, param_dtype=jnp.bfloat16
+    )
+    params, q_values = init_and_apply(network, obs)
+    assert all(x.dtype == jnp.bfloat16 for x in jax.tree.leaves(params))
+    assert q_values.dtype == jnp.float32
+
+
+def test_algorithms_train_in_bfloat16():
+    algo = get_algo("ppo").create(
+        env="CartPole-v1",
+        num_envs=4,
+        num_steps=16,
+        num_minibatches=4,
+        total_timesteps=128,
+        eval_freq=128,
+        num_eval_seeds=4,
+        dtype="bfloat16",
+    )
+    ts, (lengths, returns) = jax.jit(algo.train)(jax.random.PRNGKey(0))
+    params = jax.tree.leaves(ts.actor_ts.params)
+    assert all(x.dtype == jnp.float32 and np.isfinite(x).all() for x in params)
+    assert np.all(lengths > 0)
+
+
+def test_ensemble_dense_matches_separate_layers():
+    layer = EnsembleDense(5, num_members=3)
+    shared = jax.random.normal(jax.random.PRNGKey(1), (8, 4))
+    params = layer.init(jax.random.PRNGKey(0), shared)["params"]
+    kernel, bias = params["kernel"], params["bias"]
+    assert kernel.shape == (3, 4, 5) and bias.shape == (3, 5)
+    # Members are initialized independently
+    assert not np.allclose(kernel[0], kernel[1])
+
+    expected = jnp.stack([shared @ kernel[m] + bias[m] for m in range(3)])
+    out = layer.apply({"params": params}, shared)
+    np.testing.assert_allclose(out, expected, rtol=1e-5, atol=1e-6)
+
+    per_member = jax.random.normal(jax.random.PRNGKey(2), (3, 8, 4))
+    expected = jnp.stack([per_member[m] @ kernel[m] + bias[m] for m in range(3)])
+    out = layer.apply({"params": params}, per_member)
+    np.testing.assert_allclose(out, expected, rtol=1e-5, atol=1e-6)
+
+
+def test_ensemble_q_network_members_are_independent():
+    network = EnsembleQNetwork((16, 16), nn.relu, num_members=2)
+    obs, action = jnp.ones((8, 3)), jnp.ones((8, 1))
+    params = network.init(jax.random.PRNGKey(0), obs, action)
+    q_values = network.apply(params, obs, action)
+    assert q_values.shape == (2, 8)
+    np.testing.assert_array_equal(
+        network.apply(params, obs, action, method="min"), q_values.min(axis=0)
+    )
+
+    # Each member only depends on its own parameters
+    def member_value(params, member):
+        return network.apply(params, obs, action)[member].sum()
+
+    grads = jax.grad(member_value)(params, 0)
+    for g in jax.tree.leaves(grads):
+        assert np.any(g[0] != 0) and np.all(g[1] == 0)
+
+
+def test_iqn_evaluates_every_tau_against_its_observation():
+    taus = jnp.array([0.1, 0.5, 0.9])
+
+    def network(distortion):
+        return ImplicitQuantileNetwork((16, 16), nn.relu, 2, risk_distortion=distortion)
+
+    obs = jax.random.normal(jax.random.PRNGKey(1), (4, 3))
+    rng = jax.random.PRNGKey(2)
+    fixed = network(lambda tau: jnp.broadcast_to(taus, tau.shape))
+    params = fixed.init(jax.random.PRNGKey(0), obs, rng, 3)
+    quantiles, tau = fixed.apply(params, obs, rng, 3)
+    assert quantiles.shape == (4, 3, 2)
+    np.testing.assert_array_equal(tau, jnp.broadcast_to(taus, (4, 3)))
+
+    for i in range(4):
+        for j, t in enumerate(taus):
+            single = network(lambda tau: jnp.full_like(tau, t))
+            expected, _ = single.apply(params, obs[i : i + 1], rng, 1)
+            np.testing.assert_allclose(quantiles[i, j], expected[0, 0], rtol=1e-5)
@@ -0,0 +1,40 @@
+import jax
+import numpy as np
+from jax import numpy as jnp
+
+from RLinJAX import get_algo
+
+
+def create(name="dqn", **config):
+    return get_algo(name).create(
+        env="CartPole-v1", total_timesteps=256, eval_freq=256, **config
+    )
+
+
+def test_sample_many_draws_stacked_minibatches(transitions):
+    algo = create(buffer_size=32)
+    ts = algo.init_state(jax.random.PRNGKey(0))
+    ts = ts.replace(replay_buffer=ts.replay_buffer.extend(transitions(0, 16)))
+
+    minibatches, index, weight = algo.sample_minibatches(
+        ts, jax.random.PRNGKey(1), num_batches=3
+    )
+    assert minibatches.obs.shape == (3, algo.batch_size, 4)
+    assert np.all(np.asarray(minibatches.obs) < 16)
+    assert index is None
+    np.testing.assert_array_equal(weight, jnp.ones((3, algo.batch_size)))
+
+
+def test_prioritized_epochs_sample_with_updated_priorities(transitions):
+    algo = create(prioritized_replay=True, buffer_size=8, batch_size=1, num_epochs=8)
+    ts = algo.init_state(jax.random.PRNGKey(0))
+    ts = ts.replace(replay_buffer=ts.replay_buffer.extend(transitions(0, 8)))
+
+    def update_iteration(ts, xs):
+        # Never sample a transition twice
+        _, index, _ = xs
+        buf = ts.replay_buffer.update_priorities(index, jnp.zeros(index.shape))
+        return ts.replace(replay_buffer=buf), None
+
+    _, minibatches = algo.sample_and_update(ts, jax.random.PRNGKey(1), update_iteration)
+    np.testing.assert_array_equal(np.sort(minibatches.obs[:, 0, 0]), np.arange(8))
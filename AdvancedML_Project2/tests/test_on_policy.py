@@ -0,0 +1,83 @@
+import jax
+import numpy as np
+import pytest
+from jax import numpy as jnp
+
+from RLinJAX import get_algo
+
+
+def create(name="ppo", **config):
+    return get_algo(name).create(
+        env="CartPole-v1",
+        num_envs=4,
+        num_steps=16,
+        num_minibatches=4,
+        total_timesteps=256,
+        eval_freq=256,
+        num_eval_seeds=4,
+        **config,
+    )
+
+
+def test_minibatch_indices_partition_rollout():
+    algo = create()
+    index = algo.minibatch_indices(jax.random.PRNGKey(0))
+    assert index.shape == (algo.num_minibatches, algo.minibatch_size)
+    np.testing.assert_array_equal(np.sort(index.ravel()), np.arange(64))
+
+
+def test_update_minibatches_visits_every_transition_once():
+    algo = create()
+    rollout = {"step": jnp.arange(64).reshape(16, 4)}
+    data = algo.flatten_rollout(rollout)
+
+    def update(seen, minibatch):
+        return seen.at[minibatch["step"]].add(1)
+
+    seen = algo.update_minibatches(
+        jnp.zeros(64, int), data, jax.random.PRNGKey(0), update
+    )
+    np.testing.assert_array_equal(seen, 1)
+
+
+def squared_error(params, batch):
+    error = batch["x"] @ params["w"] - batch["y"]
+    return jnp.mean(error**2), (jnp.mean(error), error)
+
+
+def regression_batch():
+    x = jax.random.normal(jax.random.PRNGKey(0), (32, 3))
+    return {"x": x, "y": x.sum(axis=1)}, {"w": jnp.array([0.5, -1.0, 2.0])}
+
+
+def test_micro_batches_accumulate_the_full_batch_gradient():
+    batch, params = regression_batch()
+    grads, (mean_error, error) = create().accumulate_gradients(
+        squared_error, params, batch
+    )
+
+    for config in ({"num_microbatches": 4}, {"num_microbatches": 4, "remat": True}):
+        micro_grads, (micro_mean, micro_error) = create(**config).accumulate_gradients(
+            squared_error, params, batch
+        )
+        np.testing.assert_allclose(micro_grads["w"], grads["w"], rtol=1e-5)
+        # Scalars are averaged and other outputs are concatenated
+        np.testing.assert_allclose(micro_mean, mean_error, rtol=1e-5, atol=1e-7)
+        np.testing.assert_allclose(micro_error, error, rtol=1e-6)
+
+
+def test_micro_batches_must_divide_the_minibatch():
+    batch, params = regression_batch()
+    with pytest.raises(ValueError, match="num_microbatches"):
+        create(num_microbatches=5).accumulate_gradients(squared_error, params, batch)
+
+
+def test_training_with_micro_batches_matches_full_batches():
+    rng = jax.random.PRNGKey(0)
+    ts, _ = jax.jit(create().train)(rng)
+    micro_ts, _ = jax.jit(create(num_microbatches=2).train)(rng)
+    jax.tree.map(
+        lambda a, b: np.testing.assert_allclose(a, b, atol=1e-4),
+        micro_ts.actor_ts.params,
+        ts.actor_ts.params,
+    )
@@ -0,0 +1,54 @@
+import jax
+import numpy as np
+
+from RLinJAX import get_algo
+from RLinJAX.profiling import phase, time_phases
+
+
+def test_phase_names_operations():
+    def f(x):
+        return phase("collect", lambda y: y * 2, x)
+
+    hlo = jax.jit(f).lower(1.0).compile().as_text()
+    assert "/collect/mul" in hlo
+
+
+def test_phase_records_time_only_within_time_phases():
+    def f(x):
+        return phase("update", lambda y: y + 1, x)
+
+    def g(x):
+        return phase("update", lambda y: y + 1, x)
+
+    with time_phases() as timer:
+        assert jax.jit(f)(1.0) == 2.0
+        assert jax.jit(f)(2.0) == 3.0
+    assert timer.counts["update"] == 2
+
+    # Functions traced outside of the context do not record times
+    assert jax.jit(g)(3.0) == 4.0
+    assert timer.counts["update"] == 2
+
+
+def test_profile_breaks_down_training_phases():
+    algo = get_algo("ppo").create(
+        env="CartPole-v1",
+        num_envs=4,
+        num_steps=16,
+        num_minibatches=4,
+        total_timesteps=128,
+        eval_freq=64,
+        num_eval_seeds=2,
+    )
+    rng = jax.random.PRNGKey(0)
+    ts, evaluation, timer = algo.profile(rng)
+
+    breakdown = timer.breakdown()
+    assert {"collect", "update", "eval"} <= set(breakdown)
+    assert breakdown["collect"]["count"] == 2
+    assert breakdown["eval"]["count"] == 3
+    np.testing.assert_allclose(sum(b["fraction"] for b in breakdown.values()), 1.0)
+
+    # Timing markers do not change the result
+    _, reference = algo.train_chunked(rng)
+    jax.tree.map(np.testing.assert_array_equal, evaluation, reference)
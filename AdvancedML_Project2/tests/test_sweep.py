@@ -0,0 +1,53 @@
+import jax
+import numpy as np
+import pytest
+from jax import numpy as jnp
+
+from RLinJAX import get_algo
+
+
+def create(**config):
+    return get_algo("ppo").create(
+        env="CartPole-v1",
+        num_envs=4,
+        num_steps=16,
+        num_minibatches=4,
+        total_timesteps=128,
+        eval_freq=128,
+        num_eval_seeds=4,
+        **config,
+    )
+
+
+def test_sweep_matches_separate_runs():
+    algo = create()
+    rngs = jax.random.split(jax.random.PRNGKey(0), 2)
+    learning_rates = jnp.array([1e-4, 1e-3])
+    result = jax.jit(algo.train_sweep)(rngs, {"learning_rate": learning_rates})
+    assert result.axes == ("config", "seed")
+
+    @jax.jit
+    def train(learning_rate, rng):
+        return algo.replace(learning_rate=learning_rate).train(rng)
+
+    for i, learning_rate in enumerate(learning_rates):
+        for j, rng in enumerate(rngs):
+            ts, _ = train(learning_rate, rng)
+            params = jax.tree.map(lambda x: x[i, j], result.train_state.actor_ts.params)
+            jax.tree.map(
+                lambda a, b: np.testing.assert_allclose(a, b, atol=1e-4),
+                params,
+                ts.actor_ts.params,
+            )
+
+
+def test_sweep_over_seeds_only():
+    algo = create()
+    result = algo.train_sweep(jax.random.split(jax.random.PRNGKey(0), 3))
+    assert result.axes == ("seed",)
+    assert result.train_state.global_step.shape == (3,)
+
+
+def test_sweep_rejects_static_fields():
+    with pytest.raises(ValueError, match="num_envs"):
+        create().train_sweep(jax.random.PRNGKey(0)[None], {"num_envs": jnp.ones(2)})
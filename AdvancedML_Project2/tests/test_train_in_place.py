@@ -0,0 +1,37 @@
+import jax
+import pytest
+
+from RLinJAX import get_algo
+
+CONFIGS = {
+    "dqn": ("CartPole-v1", {"fill_buffer": 64}),
+    "ppo": ("CartPole-v1", {"num_envs": 4, "num_steps": 16}),
+    "sac": ("Pendulum-v1", {"fill_buffer": 64}),
+}
+
+
+def create(name):
+    env, config = CONFIGS[name]
+    return get_algo(name).create(
+        env=env, total_timesteps=256, eval_freq=256, num_eval_seeds=2, **config
+    )
+
+
+@pytest.mark.parametrize("name", list(CONFIGS))
+def test_train_in_place_can_be_chained(name):
+    algo = create(name)
+    ts, _ = algo.train_in_place(jax.random.PRNGKey(0))
+    ts2, _ = algo.train_in_place(train_state=ts)
+
+    # The buffers of the donated train state are reused by the second call
+    arrays = [x for x in jax.tree.leaves(ts) if isinstance(x, jax.Array)]
+    assert all(x.is_deleted() for x in arrays)
+    assert int(ts2.global_step) == 2 * algo.num_evals * algo.steps_per_eval
+
+
+def test_train_in_place_continues_jitted_train():
+    algo = create("dqn")
+    ts, _ = jax.jit(algo.train)(jax.random.PRNGKey(0))
+    ts, _ = algo.train_in_place(train_state=ts)
+    ts, _ = jax.jit(algo.train)(train_state=ts)
+    assert int(ts.global_step) == 3 * 256